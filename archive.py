@@ -0,0 +1,98 @@
+"""คลังประวัติลงเวลาเก่า: ย้าย Log ที่พ้นระยะเก็บไปเป็นไฟล์ CSV บีบอัดแยกรายเดือนแทนการลบทิ้ง
+
+    archive/attendance_YYYY-MM.csv.gz   (Log ลงเวลา)
+    archive/remarks_YYYY-MM.csv.gz      (หมายเหตุรายวัน)
+
+- เขียนต่อท้ายทีละ batch เป็น gzip member ใหม่ (อ่านรวมทั้งไฟล์ได้ตามปกติ) และ fsync ก่อน Server ลบแถวออกจากฐานข้อมูล
+- ถ้าระบบดับหลังเขียนไฟล์แต่ก่อนลบแถว รอบถัดไปจะเขียนซ้ำ ตอนอ่านจึงตัดแถวที่ id + เวลาซ้ำออก
+- อ่านเฉพาะเดือนที่อยู่ในช่วงที่ขอ เก็บผลที่แตกไฟล์แล้วไว้ใน cache ไม่กี่เดือน (ไฟล์เปลี่ยน cache จะหมดอายุเอง)
+"""
+import io
+import os
+import csv
+import gzip
+import threading
+from datetime import datetime, timedelta
+from functools import lru_cache
+from dotenv import load_dotenv
+
+load_dotenv()
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+LOG_FIELDS = ("id", "employee_id", "employee_name", "check_time", "log_type", "status", "client_ip", "evidence_image")
+REMARK_FIELDS = ("date_str", "employee_id", "remark")
+_write_lock = threading.Lock()
+
+def month_path(kind, month):
+    return os.path.join(ARCHIVE_DIR, f"{kind}_{month}.csv.gz")
+
+def _append(kind, rows, fields, date_key):
+    by_month = {}
+    for r in rows:
+        by_month.setdefault(str(r[date_key])[:7], []).append(r)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with _write_lock:
+        for month, items in sorted(by_month.items()):
+            path = month_path(kind, month)
+            buf = io.StringIO()
+            w = csv.writer(buf)
+            if not os.path.exists(path): w.writerow(fields)
+            w.writerows([["" if r[f] is None else r[f] for f in fields] for r in items])
+            with open(path, "ab") as f:
+                f.write(gzip.compress(buf.getvalue().encode("utf-8")))
+                f.flush()
+                os.fsync(f.fileno())
+    return len(rows)
+
+def archive_logs(rows):
+    """rows = dict/sqlite3.Row ที่มีคอลัมน์ตาม LOG_FIELDS คืนจำนวนแถวที่เขียน"""
+    return _append("attendance", rows, LOG_FIELDS, "check_time")
+
+def archive_remarks(rows):
+    return _append("remarks", rows, REMARK_FIELDS, "date_str")
+
+@lru_cache(maxsize=6)
+def _read_month(path, mtime_ns, size):
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        return tuple(csv.DictReader(f))
+
+def _months(start_date, end_date):
+    year, month = int(start_date[:4]), int(start_date[5:7])
+    while f"{year:04d}-{month:02d}" <= end_date[:7]:
+        yield f"{year:04d}-{month:02d}"
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+def _read(kind, start_date, end_date, date_key, key):
+    end_excl = (datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    found = {}
+    for month in _months(start_date, end_date):
+        path = month_path(kind, month)
+        if not os.path.exists(path): continue
+        st = os.stat(path)
+        for r in _read_month(path, st.st_mtime_ns, st.st_size):
+            if start_date <= r[date_key] < end_excl: found[key(r)] = r
+    return [dict(r) for r in sorted(found.values(), key=lambda r: r[date_key])]
+
+def read_logs(start_date, end_date):
+    """Log ใน archive ช่วง start_date..end_date (YYYY-MM-DD รวมทั้งสองวัน) เรียงตามเวลา ค่าทุกช่องเป็น str"""
+    return _read("attendance", start_date, end_date, "check_time", lambda r: (r["id"], r["check_time"]))
+
+def read_remarks(start_date, end_date):
+    return _read("remarks", start_date, end_date, "date_str", lambda r: (r["date_str"], r["employee_id"]))
+
+def set_aside():
+    """ย้ายโฟลเดอร์ archive ทั้งหมดไปเป็น <ARCHIVE_DIR>_reset_YYYYmmdd_HHMMSS (ตอนล้างข้อมูลลงเวลา id เริ่มใหม่ที่ 1
+    ถ้าปล่อยไว้ที่เดิมจะปนกับ Log ใหม่) ไม่ลบประวัติทิ้ง คืน path ใหม่ หรือ None ถ้าไม่มีอะไรให้ย้าย"""
+    with _write_lock:
+        if not os.path.isdir(ARCHIVE_DIR) or not os.listdir(ARCHIVE_DIR): return None
+        dest = f"{os.path.normpath(ARCHIVE_DIR)}_reset_{datetime.now():%Y%m%d_%H%M%S}"
+        os.replace(ARCHIVE_DIR, dest)
+        _read_month.cache_clear()
+        return dest
+
+def summary():
+    """จำนวนไฟล์/ขนาดรวม และเดือนเก่าสุด-ใหม่สุดที่มีใน archive"""
+    if not os.path.isdir(ARCHIVE_DIR): return {"files": 0, "size_mb": 0.0, "first_month": None, "last_month": None}
+    names = sorted(n for n in os.listdir(ARCHIVE_DIR) if n.startswith("attendance_") and n.endswith(".csv.gz"))
+    size = sum(os.path.getsize(os.path.join(ARCHIVE_DIR, n)) for n in os.listdir(ARCHIVE_DIR) if n.endswith(".csv.gz"))
+    return {"files": len(names), "size_mb": round(size / (1024 * 1024), 2),
+            "first_month": names[0][11:18] if names else None, "last_month": names[-1][11:18] if names else None}
@@ -0,0 +1,107 @@
+"""เปรียบเทียบ throughput ระหว่างส่งภาพเต็ม (/scan) กับโหมด Edge (/scan/embedding)
+
+ใช้งาน:
+    python bench_edge.py face.jpg
+    python bench_edge.py face.jpg --kiosks 8 --requests 40 --server http://192.168.1.10:9876
+
+- ใช้รูปใบหน้าของพนักงานที่ลงทะเบียนแล้ว ผลลัพธ์ควรเป็น OK ทั้งสองโหมด
+- ควรรันกับฐานข้อมูลทดสอบ (ภาพที่จดจำได้จะถูกบันทึกเวลาจริง ซ้ำภายใน 60 วินาทีจะถูกข้าม)
+- โหมด Edge วัดเวลาคำนวณ embedding ในเครื่องนี้แยกจากเวลาที่ Server ใช้
+- Kiosk จำลองแต่ละตัวส่ง X-Kiosk-Id ของตัวเอง (SCHED_KIOSK_LIMIT นับแยกเครื่องเหมือนของจริง) คำตอบ BUSY นับแยก
+- ทุกคำขอส่งภาพเดิม ต้องรัน Server ด้วย SCAN_CACHE_TTL=0 ไม่งั้น /scan ตอบจาก cache โดยไม่รัน AI
+  (คำตอบที่มาจาก cache นับแยกเป็น CACHED และไม่รวมในเวลาตอบ)
+"""
+import os
+import json
+import time
+import argparse
+import threading
+import statistics
+import cv2
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from face_engine import MODEL_NAME, load_model, represent_faces, model_signature
+
+load_dotenv()
+SERVER_URL = os.getenv("SERVER_URL", "http://localhost:9876")
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)] * 1000
+
+def run(label, kiosks, total, send):
+    """ยิง total คำขอจาก kiosks เครื่องพร้อมกัน (1 thread = 1 kiosk มี X-Kiosk-Id ของตัวเอง) แล้วสรุปเวลา
+    คำขอที่ Server ตอบ BUSY (429/503) หรือตอบจาก cache (CACHED) นับแยกและไม่รวมในเวลาตอบ"""
+    latencies, statuses = [], {}
+    def one(_):
+        t0 = time.perf_counter()
+        status = send(threading.current_thread().name)
+        return time.perf_counter() - t0, status
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=kiosks, thread_name_prefix="bench-kiosk") as ex:
+        for dt, status in ex.map(one, range(total)):
+            statuses[status] = statuses.get(status, 0) + 1
+            if status not in ("BUSY", "CACHED"): latencies.append(dt)
+    wall = time.perf_counter() - t0
+    busy, cached = statuses.get("BUSY", 0), statuses.get("CACHED", 0)
+    if cached: print(f"{label:<14} ⚠️ {cached}/{total} คำขอตอบจาก cache (รัน Server ด้วย SCAN_CACHE_TTL=0)")
+    if not latencies:
+        print(f"{label:<14} ไม่มีคำขอที่ประมวลผลจริง (BUSY {busy}, CACHED {cached}) ลด --kiosks หรือเพิ่ม SCHED_WORKERS/SCHED_QUEUE_MAX ของ Server")
+        return
+    print(f"{label:<14} {len(latencies) / wall:7.2f} req/s   p50 {_pct(latencies, 50):7.1f} ms   "
+          f"p95 {_pct(latencies, 95):7.1f} ms   mean {statistics.mean(latencies) * 1000:7.1f} ms   BUSY {busy}/{total}   {statuses}")
+
+def reply_status(r):
+    if r.status_code in (429, 503): return "BUSY"
+    if r.status_code != 200: return f"HTTP {r.status_code}"
+    data = r.json()
+    return "CACHED" if data.get("cached") else data.get("status")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /scan เทียบกับ /scan/embedding")
+    parser.add_argument("image", help="รูปใบหน้าพนักงาน (jpg/png)")
+    parser.add_argument("--server", default=SERVER_URL)
+    parser.add_argument("--kiosks", type=int, default=4, help="จำนวน Kiosk จำลองที่ส่งพร้อมกัน")
+    parser.add_argument("--requests", type=int, default=20, help="จำนวนคำขอต่อโหมด")
+    parser.add_argument("--model", default=MODEL_NAME)
+    args = parser.parse_args()
+
+    frame = cv2.imread(args.image)
+    if frame is None: parser.error(f"อ่านรูปไม่ได้: {args.image}")
+    if frame.shape[1] > 640: frame = cv2.resize(frame, (0,0), fx=640 / frame.shape[1], fy=640 / frame.shape[1])
+    full_jpeg = cv2.imencode('.jpg', frame)[1].tobytes()
+    thumb_jpeg = cv2.imencode('.jpg', cv2.resize(frame, (0,0), fx=0.5, fy=0.5), [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes()
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.kiosks))
+
+    server_model = session.get(f"{args.server}/health", timeout=5).json().get("model")
+    print(f">>> Server model: {server_model} | Local model: {model_signature(args.model)}")
+    print(f">>> โหลดโมเดลในเครื่อง...")
+    load_model(args.model)
+    faces = represent_faces(frame, args.model)
+    if not faces: parser.error(f"ไม่พบใบหน้าใน {args.image}")
+    t0 = time.perf_counter()
+    for _ in range(5): represent_faces(frame, args.model)
+    embed_ms = (time.perf_counter() - t0) / 5 * 1000
+    print(f">>> Local embedding: {embed_ms:.1f} ms/ภาพ (CPU เครื่องนี้)  ขนาดส่ง: ภาพเต็ม {len(full_jpeg)//1024} KB, Edge {len(thumb_jpeg)//1024} KB + embedding\n")
+
+    def send_full(kiosk_id):
+        r = session.post(f"{args.server}/scan", files={'file': ('image.jpg', full_jpeg, 'image/jpeg')},
+                         headers={"X-Kiosk-Id": kiosk_id}, timeout=60)
+        return reply_status(r)
+
+    def send_edge_server_only(kiosk_id):
+        data = {'embeddings': json.dumps(faces), 'model': model_signature(args.model)}
+        r = session.post(f"{args.server}/scan/embedding", data=data, headers={"X-Kiosk-Id": kiosk_id},
+                         files={'file': ('evidence.jpg', thumb_jpeg, 'image/jpeg')}, timeout=60)
+        return reply_status(r)
+
+    def send_edge(kiosk_id):
+        represent_faces(frame, args.model)  # แต่ละ Kiosk คำนวณเองจริง (ในที่นี้ทุก thread ใช้ CPU เครื่องเดียวกัน)
+        return send_edge_server_only(kiosk_id)
+
+    run("full frame", args.kiosks, args.requests, send_full)
+    run("edge (server)", args.kiosks, args.requests, send_edge_server_only)
+    run("edge (total)", args.kiosks, args.requests, send_edge)
+    print("\nedge (server) = ภาระฝั่ง Server อย่างเดียว (เทียบกับ full frame), edge (total) รวมเวลาคำนวณในเครื่องนี้ด้วย")
@@ -0,0 +1,175 @@
+"""เตรียมโมเดล ONNX และเทียบ Engine (DeepFace/TensorFlow กับ ONNX Runtime)
+
+ใช้งาน:
+    # 1. Export Facenet512 จาก DeepFace เป็น ONNX (fp32) + quantize เป็น int8 (ต้องมี tensorflow + tf2onnx)
+    python bench_engine.py export --out models/
+
+    # 2. ตรวจความเหมือน (cosine) + วัดความเร็ว/หน่วยความจำ ด้วยโฟลเดอร์รูปเต็ม (เช่น images/ รูปลงทะเบียนจริง)
+    python bench_engine.py compare images/ --onnx models/facenet512.onnx models/facenet512_int8.onnx --threads 4
+
+compare จะจบด้วย exit code 1 ถ้าไฟล์ ONNX ใดมี cosine ต่ำสุดต่ำกว่า --min-cos หรือการตัดสิน "คนเดียวกัน" ตาม --threshold
+(รูปสแกนจาก ONNX เทียบกับ gallery จาก DeepFace) ตรงกับ DeepFace ล้วนน้อยกว่า --min-agree
+ผลตรวจของแต่ละไฟล์เขียนไว้ที่ <ไฟล์>.onnx.parity.json ถ้าฐานข้อมูลมีใบหน้าที่สร้างด้วย DeepFace อยู่แล้ว
+Server จะใช้ ONNX เฉพาะไฟล์ที่ผ่านและยังไม่ถูกแก้ไขหลังตรวจ (tests/test_onnx_parity.py รันขั้นนี้ให้อัตโนมัติเมื่อมี weights)
+หลังผ่านแล้วตั้ง .env: EMBED_ENGINE=onnx, ONNX_MODEL_PATH=models/facenet512_int8.onnx, ONNX_THREADS=4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import statistics
+import cv2
+import numpy as np
+import psutil
+from datetime import datetime
+from face_engine import MODEL_NAME, DeepFaceEngine, OnnxEngine, parity_path, file_sha256
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+def cosine(a, b):
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-10))
+
+def rss_mb():
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+def export(out_dir, model_name):
+    """Keras model ของ DeepFace -> ONNX fp32 -> int8 (dynamic quantization เฉพาะ weight)"""
+    import tensorflow as tf
+    import tf2onnx
+    from deepface import DeepFace
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(out_dir, exist_ok=True)
+    built = DeepFace.build_model(model_name)
+    keras_model = getattr(built, "model", built)  # deepface รุ่นใหม่ห่อ Keras model ไว้ใน .model
+    size = keras_model.input_shape[1]
+    fp32_path = os.path.join(out_dir, f"{model_name.lower()}.onnx")
+    int8_path = os.path.join(out_dir, f"{model_name.lower()}_int8.onnx")
+    spec = (tf.TensorSpec((None, size, size, 3), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(keras_model, input_signature=spec, opset=13, output_path=fp32_path)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    for p in (fp32_path, int8_path):
+        print(f">>> ✅ {p} ({os.path.getsize(p) / (1024 * 1024):.1f} MB)")
+
+def load_images(folder, limit):
+    """อ่านรูปเต็ม (ไม่ crop) ให้แต่ละ Engine ตรวจจับ/จัดแนว/ย่อใบหน้าเองเหมือนตอนใช้งานจริง
+    ความต่างของ preprocessing จึงรวมอยู่ในผลเทียบด้วย ไม่ใช่เทียบเฉพาะตัวโมเดล"""
+    images = []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(IMAGE_EXTS): continue
+        img = cv2.imread(os.path.join(folder, name))
+        if img is None: continue
+        images.append((name, img))
+        if len(images) >= limit: break
+    return images
+
+def measure(engine, images, batch):
+    """คืน (ใบหน้าแรกของแต่ละรูป [(กรอบ, embedding)], latency ต่อภาพ [วินาที], throughput แบบ batch [ภาพ/วินาที], RSS ที่เพิ่มขึ้น [MB])"""
+    before = rss_mb()
+    t0 = time.perf_counter()
+    engine.load()
+    load_s = time.perf_counter() - t0
+    engine.represent(images[0][1])  # warm-up
+    faces, lat = [], []
+    for _, img in images:
+        t0 = time.perf_counter()
+        first = engine.represent(img)[0]
+        lat.append(time.perf_counter() - t0)
+        area = first["facial_area"]
+        faces.append(((area["x"], area["y"], area["w"], area["h"]), np.asarray(first["embedding"], dtype=np.float32)))
+    tput = None
+    if isinstance(engine, OnnxEngine):
+        # ONNX รับหลายหน้าเป็น batch เดียว วัด throughput จาก session โดยตรง (ไม่รวมเวลาตรวจจับใบหน้า)
+        stacked = np.ascontiguousarray(np.concatenate([engine.preprocess(img)[1][:1] for _, img in images[:batch]]))
+        t0 = time.perf_counter()
+        for _ in range(5): engine.session.run(None, {engine.input_name: stacked})
+        tput = 5 * len(stacked) / (time.perf_counter() - t0)
+    return faces, lat, tput, rss_mb() - before, load_s
+
+def report(label, lat, tput, mem, load_s):
+    lat_ms = sorted(x * 1000 for x in lat)
+    p95 = lat_ms[min(int(len(lat_ms) * 0.95), len(lat_ms) - 1)]
+    print(f"{label:<28} load {load_s:6.1f} s  RSS +{mem:7.1f} MB  p50 {statistics.median(lat_ms):7.1f} ms  "
+          f"p95 {p95:7.1f} ms  1-by-1 {1000 / statistics.mean(lat_ms):6.1f} img/s"
+          + (f"  batch {tput:6.1f} img/s" if tput else ""))
+
+def parity(images, faces, ref, threshold):
+    """เทียบผลของ ONNX กับ DeepFace: cosine ต่อรูป, กรอบหน้าที่ไม่ตรง และสัดส่วนคู่รูปที่การตัดสินตาม threshold
+    (cosine distance < threshold = คนเดียวกัน) เมื่อรูปสแกนมาจาก ONNX แต่ gallery มาจาก DeepFace ตรงกับ DeepFace ล้วน"""
+    cos = [cosine(a, b) for (_, a), (_, b) in zip(faces, ref)]
+    boxes = [name for (name, _), (box, _), (ref_box, _) in zip(images, faces, ref) if box != ref_box]
+    pairs = list(itertools.permutations(range(len(ref)), 2))
+    agree = sum((1 - cosine(faces[i][1], ref[j][1]) < threshold) == (1 - cosine(ref[i][1], ref[j][1]) < threshold)
+                for i, j in pairs)
+    worst = min(range(len(cos)), key=cos.__getitem__)
+    return {"images": len(cos), "mean_cos": statistics.mean(cos), "min_cos": min(cos), "worst": images[worst][0],
+            "box_mismatch": boxes, "pairs": len(pairs), "agreement": agree / len(pairs) if pairs else 1.0}
+
+def write_record(path, reference, stats, args, ok):
+    """บันทึกผลตรวจไว้ข้างไฟล์ .onnx (get_engine อ่านไฟล์นี้ก่อนใช้ ONNX กับ gallery ที่สร้างด้วย DeepFace)"""
+    st = os.stat(path)
+    record = {"signature": OnnxEngine(args.model, path).signature, "reference": reference,
+              "sha256": file_sha256(path, st.st_mtime_ns, st.st_size), "threshold": args.threshold,
+              "min_cos_required": args.min_cos, "min_agree_required": args.min_agree,
+              **stats, "passed": ok, "checked_at": datetime.now().isoformat(timespec="seconds")}
+    with open(parity_path(path), "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+
+def compare(args):
+    images = load_images(args.folder, args.limit)
+    if not images: sys.exit(f"ไม่พบรูปใน {args.folder}")
+    print(f">>> {len(images)} รูป จาก {args.folder}\n")
+
+    # ONNX ก่อน (ยังไม่ได้โหลด TensorFlow) ค่า RSS จึงสะท้อนขนาดจริงของแต่ละ Engine
+    results = {}
+    for path in args.onnx:
+        engine = OnnxEngine(args.model, path, args.threads)
+        faces, lat, tput, mem, load_s = measure(engine, images, args.batch)
+        results[path] = faces
+        report(f"onnx {os.path.basename(path)}", lat, tput, mem, load_s)
+    reference = DeepFaceEngine(args.model)
+    ref, lat, _, mem, load_s = measure(reference, images, args.batch)
+    report(f"deepface {args.model}", lat, None, mem, load_s)
+
+    print(f"\n>>> Parity (cosine similarity กับ DeepFace ทั้ง pipeline: ตรวจจับ + จัดแนว + ย่อภาพ + โมเดล, "
+          f"threshold {args.threshold})")
+    if len(ref) > 1:  # ค่าอ้างอิง: ผลเทียบกับ DeepFace ควรสูงกว่าค่าระหว่างรูปต่างกันมาก
+        pairs = [cosine(a, b) for (_, a), (_, b) in itertools.combinations(ref, 2)]
+        same = sum(1 - c < args.threshold for c in pairs)
+        print(f"{'(deepface ระหว่างรูปต่างกัน)':<28} mean {statistics.mean(pairs):.4f}  max {max(pairs):.4f}  "
+              f"ผ่าน threshold {same}/{len(pairs)} คู่")
+    failed = False
+    for path, faces in results.items():
+        stats = parity(images, faces, ref, args.threshold)
+        ok = stats["min_cos"] >= args.min_cos and stats["agreement"] >= args.min_agree
+        failed |= not ok
+        write_record(path, reference.signature, stats, args, ok)
+        print(f"{os.path.basename(path):<28} mean {stats['mean_cos']:.4f}  min {stats['min_cos']:.4f} ({stats['worst']})  "
+              f"ตัดสินตรงกัน {stats['agreement']:.2%} ({stats['pairs']} คู่)  "
+              f"กรอบหน้าไม่ตรง {len(stats['box_mismatch'])}/{stats['images']}  {'✅ PASS' if ok else '❌ FAIL'}")
+        for name in stats["box_mismatch"][:10]: print(f"    กรอบหน้าไม่ตรง: {name}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export/เทียบ Embedding Engine (DeepFace vs ONNX Runtime)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("export", help="Export โมเดล DeepFace เป็น ONNX fp32 + int8")
+    p.add_argument("--out", default="models")
+    p.add_argument("--model", default=MODEL_NAME)
+    p = sub.add_parser("compare", help="Parity + latency/throughput/memory")
+    p.add_argument("folder", help="โฟลเดอร์รูปเต็ม (แต่ละ Engine ตรวจจับใบหน้าเอง)")
+    p.add_argument("--onnx", nargs="+", required=True, help="ไฟล์ .onnx (ใส่ได้หลายไฟล์ เช่น fp32 และ int8)")
+    p.add_argument("--model", default=MODEL_NAME)
+    p.add_argument("--threads", type=int, default=0, help="ONNX intra-op threads (0 = อัตโนมัติ)")
+    p.add_argument("--limit", type=int, default=100, help="จำนวนรูปสูงสุด")
+    p.add_argument("--batch", type=int, default=8)
+    p.add_argument("--min-cos", type=float, default=0.98)
+    p.add_argument("--min-agree", type=float, default=0.99, help="สัดส่วนคู่รูปที่ต้องตัดสินตรงกับ DeepFace")
+    p.add_argument("--threshold", type=float, default=float(os.getenv("THRESHOLD", 0.3)))
+    args = parser.parse_args()
+    if args.cmd == "export":
+        export(args.out, args.model)
+    else:
+        compare(args)
@@ -0,0 +1,72 @@
+"""วัดเวลา import server_api (เวลาเริ่ม Server ก่อนโหลดโมเดล) และตรวจว่าโหมด reports ไม่โหลด library หนัก
+
+ใช้งาน:
+    python bench_startup.py                  # โหมด reports (ค่าเริ่มต้น)
+    python bench_startup.py --mode full --budget 2.0
+    python bench_startup.py --top 15         # แสดง module ที่ import ช้าที่สุด 15 อันดับ
+
+จบด้วย exit code 1 ถ้าเวลา import เกิน --budget (วินาที) หรือโหมด reports โหลด module หนัก
+(ใช้เป็น regression check ได้ เช่น มีคน import cv2/numpy ไว้บนสุดของไฟล์อีก)
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+HEAVY_MODULES = ("tensorflow", "deepface", "cv2", "numpy", "psutil", "onnxruntime", "torch")
+
+# รันใน process ใหม่ทุกครั้ง (module ที่ import ไปแล้วจะไม่ถูกนับซ้ำ)
+PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+import server_api
+elapsed = time.perf_counter() - t0
+print(json.dumps({"elapsed": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+def probe(mode):
+    env = dict(os.environ, APP_MODE=mode)
+    out = subprocess.run([sys.executable, "-c", PROBE % (HEAVY_MODULES,)], env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def import_profile(mode, top):
+    """ผลของ python -X importtime เรียงตามเวลาสะสม (cumulative) ของ module ที่ server_api import โดยตรง"""
+    env = dict(os.environ, APP_MODE=mode)
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import server_api"], env=env,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line: continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2  # importtime ย่อหน้า 2 ช่องต่อชั้น
+        if depth <= 1 and cumulative.strip().isdigit():
+            rows.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="วัดเวลา import server_api")
+    parser.add_argument("--mode", default="reports", choices=["reports", "full"], help="APP_MODE ที่ใช้ทดสอบ")
+    parser.add_argument("--budget", type=float, default=1.0, help="เวลา import สูงสุดที่ยอมรับได้ (วินาที)")
+    parser.add_argument("--runs", type=int, default=3, help="จำนวนรอบ (ใช้ค่าที่เร็วที่สุด ตัดผล disk cache รอบแรก)")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    results = [probe(args.mode) for _ in range(args.runs)]
+    best = min(r["elapsed"] for r in results)
+    loaded = results[-1]["loaded"]
+    print(f">>> APP_MODE={args.mode}: import server_api {best * 1000:.0f} ms (ดีที่สุดจาก {args.runs} รอบ, budget {args.budget * 1000:.0f} ms)")
+    print(f">>> Module หนักที่ถูกโหลด: {', '.join(loaded) if loaded else '-'}")
+    print("\n>>> import ที่ช้าที่สุด (cumulative ms)")
+    for ms, name in import_profile(args.mode, args.top):
+        print(f"    {ms:8.1f}  {name}")
+
+    failed = best > args.budget
+    if args.mode == "reports" and loaded:
+        print(f"\n❌ โหมด reports ไม่ควรโหลด: {', '.join(loaded)}")
+        failed = True
+    if best > args.budget:
+        print(f"\n❌ เกิน budget {args.budget:.2f} s")
+    if not failed: print("\n✅ PASS")
+    sys.exit(1 if failed else 0)
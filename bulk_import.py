@@ -0,0 +1,241 @@
+"""นำเข้าพนักงานจำนวนมากจาก ZIP/โฟลเดอร์รูป + CSV
+
+ใช้งาน:
+    python bulk_import.py photos.zip staff.csv
+    python bulk_import.py photos_folder/ staff.csv --workers 8
+    python bulk_import.py --resume bulk_jobs/<job_id>
+
+CSV (UTF-8): employee_id,name,role,department[,photo]
+- ถ้าไม่มีคอลัมน์ photo จะจับคู่รูปจากชื่อไฟล์ = employee_id (เช่น 1001.jpg)
+- ถ้าถูกขัดจังหวะ สั่งซ้ำด้วยไฟล์เดิม (หรือ --resume) จะทำต่อจากรูปที่ค้างไว้
+- หน้าที่ซ้ำกับพนักงานรหัสอื่น (ในฐานข้อมูลหรือในไฟล์เดียวกัน) จะไม่นำเข้า ดูใน failures.csv
+  ตรวจแล้วถ้าถูกต้อง สั่งซ้ำด้วย --force (ใช้ embedding เดิม ไม่ต้องคำนวณใหม่)
+"""
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import hashlib
+import sqlite3
+import zipfile
+import argparse
+from datetime import datetime
+from dotenv import load_dotenv
+from face_engine import MODEL_NAME, LazyModule, embed_files_parallel, set_gallery_signature
+
+cv2 = LazyModule("cv2")  # ใช้เฉพาะตอนแปลงรูปที่ไม่ใช่ JPG (Server import โมดูลนี้ไม่ต้องโหลด OpenCV)
+
+load_dotenv()
+DB_FILE = os.getenv("DB_FILE", "attendance.db")
+BULK_DIR = "bulk_jobs"
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+def _file_hash(path, h):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+
+def _setting(db_file, key, default=None):
+    try:
+        conn = sqlite3.connect(db_file)
+        row = conn.execute("SELECT value FROM app_settings WHERE key = ?", (key,)).fetchone()
+        conn.close()
+        return row[0] if row else default
+    except sqlite3.Error:
+        return default
+
+def active_model(db_file=DB_FILE):
+    """โมเดลที่ Server ใช้อยู่ (เปลี่ยนได้ด้วยงาน Re-embed) ถ้ายังไม่เคยตั้งจะใช้ค่าจาก .env"""
+    return _setting(db_file, "active_model", MODEL_NAME)
+
+def prepare_job(photos_path, csv_path, model_name=MODEL_NAME):
+    """สร้างโฟลเดอร์งาน bulk_jobs/<job_id> (job_id มาจาก hash ของไฟล์ ส่งไฟล์เดิมซ้ำจะได้งานเดิม)"""
+    h = hashlib.sha1()
+    _file_hash(csv_path, h)
+    if os.path.isfile(photos_path):
+        _file_hash(photos_path, h)
+    else:
+        h.update(os.path.abspath(photos_path).encode("utf-8"))
+    job_id = h.hexdigest()[:12]
+    job_dir = os.path.join(BULK_DIR, job_id)
+
+    if not os.path.exists(os.path.join(job_dir, "job.json")):
+        os.makedirs(job_dir, exist_ok=True)
+        shutil.copyfile(csv_path, os.path.join(job_dir, "staff.csv"))
+        if os.path.isfile(photos_path):
+            with zipfile.ZipFile(photos_path) as zf:
+                zf.extractall(os.path.join(job_dir, "photos"))
+            photo_dir = os.path.join(job_dir, "photos")
+        else:
+            photo_dir = os.path.abspath(photos_path)
+        with open(os.path.join(job_dir, "job.json"), "w", encoding="utf-8") as f:
+            json.dump({"job_id": job_id, "photo_dir": photo_dir, "model_name": model_name,
+                       "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}, f, ensure_ascii=False)
+    return job_id, job_dir
+
+def _read_rows(job_dir):
+    with open(os.path.join(job_dir, "staff.csv"), encoding="utf-8-sig", newline="") as f:
+        return [{k.strip(): (v or "").strip() for k, v in r.items() if k} for r in csv.DictReader(f)]
+
+def _index_photos(photo_dir):
+    """สร้าง map ชื่อไฟล์ -> path (ไล่โฟลเดอร์ครั้งเดียว)"""
+    by_name, by_stem = {}, {}
+    for root, _, files in os.walk(photo_dir):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTS):
+                path = os.path.join(root, name)
+                by_name[name] = path
+                by_stem.setdefault(os.path.splitext(name)[0], path)
+    return by_name, by_stem
+
+def _load_done(results_path):
+    """อ่านผล embedding ที่ทำเสร็จแล้วจากรอบก่อน (สำหรับ resume)"""
+    done = {}
+    if os.path.exists(results_path):
+        with open(results_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                    done[r["employee_id"]] = r
+                except ValueError:
+                    pass  # บรรทัดสุดท้ายอาจเขียนไม่ครบตอนโดนขัดจังหวะ
+    return done
+
+def duplicate_rows(rows, embeddings, db_file, model_name, threshold=None):
+    """แถวที่หน้าซ้ำกับพนักงานรหัสอื่นในฐานข้อมูล หรือกับแถวก่อนหน้าในไฟล์เดียวกันที่รับไปแล้ว
+    คืน {employee_id: ข้อความ} (รหัสเดียวกันที่นำเข้าซ้ำเพื่อเปลี่ยนรูปไม่นับ)"""
+    import dedupe
+    threshold = dedupe.DUPLICATE_THRESHOLD if threshold is None else threshold
+    ids = [r["employee_id"] for r in rows]
+    names = {r["employee_id"]: r["name"] for r in rows}
+    queries = dedupe.normalize(embeddings)
+    found = {}
+    matrix, g_ids, g_names = dedupe.load_gallery(db_file, model_name)
+    for qi, gi, d in dedupe.matches_against(queries, matrix, threshold):
+        if g_ids[gi] != ids[qi] and (qi not in found or d < found[qi][2]):
+            found[qi] = (g_ids[gi], g_names[gi], d)
+    # ภายในไฟล์: แถวแรกของคู่ได้ไป แถวหลังซ้ำ (ถ้าแถวแรกเองถูกตัด แถวหลังยังรับได้)
+    later = {}
+    for i, j, d in dedupe.similar_pairs(queries, threshold):
+        if ids[i] != ids[j]: later.setdefault(j, []).append((i, d))
+    for j in range(len(ids)):
+        if j in found: continue
+        hits = [(i, d) for i, d in later.get(j, []) if i not in found]
+        if hits:
+            i, d = min(hits, key=lambda h: h[1])
+            found[j] = (ids[i], names[ids[i]], d)
+    return {ids[k]: f"หน้าซ้ำกับ {e} {n} (distance {d:.3f})" for k, (e, n, d) in found.items()}
+
+def run_job(job_dir, db_file=DB_FILE, workers=None, progress=None, force=False):
+    """ประมวลผลงานนำเข้า คืนค่าสรุป {total, imported, failed, failures, employee_ids}
+    progress(dict) จะถูกเรียกทุกครั้งที่รูปประมวลผลเสร็จ
+    หน้าที่ซ้ำกับคนอื่น (ในฐานข้อมูลหรือในไฟล์เดียวกัน) จะไม่นำเข้าและอยู่ใน failures เว้นแต่ force=True"""
+    with open(os.path.join(job_dir, "job.json"), encoding="utf-8") as f:
+        job = json.load(f)
+    rows = _read_rows(job_dir)
+    by_name, by_stem = _index_photos(job["photo_dir"])
+    results_path = os.path.join(job_dir, "embeddings.jsonl")
+    done = _load_done(results_path)
+
+    state = {"job_id": job["job_id"], "status": "running", "total": len(rows), "processed": 0, "failed": 0,
+             "started": time.time(), "rate": 0.0}
+    failures, pending, photos = [], [], {}
+    for r in rows:
+        emp_id = r.get("employee_id", "")
+        if not emp_id or not r.get("name"):
+            failures.append({"employee_id": emp_id, "file": r.get("photo", ""), "error": "ไม่มีรหัสหรือชื่อพนักงาน"})
+            continue
+        photo = by_name.get(r["photo"]) if r.get("photo") else by_stem.get(emp_id)
+        if not photo:
+            failures.append({"employee_id": emp_id, "file": r.get("photo", ""), "error": "ไม่พบไฟล์รูป"})
+            continue
+        photos[emp_id] = photo
+        if emp_id not in done or done[emp_id].get("error"): pending.append((emp_id, photo))
+
+    state["processed"] = len(rows) - len(pending)
+    if progress: progress(state)
+
+    # 1. Embedding แบบขนานทุก Core และเขียนผลทีละบรรทัด (โดนขัดจังหวะก็ resume ได้)
+    set_gallery_signature(_setting(db_file, "gallery_signature"))  # ใช้ Engine เดียวกับใบหน้าในฐานข้อมูล
+    t0 = time.time()
+    with open(results_path, "a", encoding="utf-8") as out:
+        for n, (emp_id, emb, err) in enumerate(embed_files_parallel(pending, job["model_name"], workers), 1):
+            rec = {"employee_id": emp_id, "embedding": emb, "error": err}
+            out.write(json.dumps(rec) + "\n")
+            out.flush()
+            done[emp_id] = rec
+            state["processed"] += 1
+            state["rate"] = round(n / max(time.time() - t0, 1e-6), 2)
+            if progress: progress(state)
+
+    for emp_id, rec in done.items():
+        if rec.get("error") and emp_id in photos:
+            failures.append({"employee_id": emp_id, "file": os.path.basename(photos[emp_id]), "error": rec["error"]})
+
+    # 2. เขียนลงฐานข้อมูลใน Transaction เดียว
+    ok_rows = [r for r in rows if r.get("employee_id") in photos and done.get(r["employee_id"], {}).get("embedding")]
+    if not force and ok_rows:
+        duplicates = duplicate_rows(ok_rows, [done[r["employee_id"]]["embedding"] for r in ok_rows], db_file, job["model_name"])
+        failures += [{"employee_id": r["employee_id"], "file": os.path.basename(photos[r["employee_id"]]),
+                      "error": duplicates[r["employee_id"]]} for r in ok_rows if r["employee_id"] in duplicates]
+        ok_rows = [r for r in ok_rows if r["employee_id"] not in duplicates]
+    os.makedirs("images", exist_ok=True)
+    conn = sqlite3.connect(db_file)
+    try:
+        with conn:
+            for r in ok_rows:
+                emp_id = r["employee_id"]
+                file_path = f"images/{emp_id}.jpg"
+                src = photos[emp_id]
+                if src.lower().endswith((".jpg", ".jpeg")):
+                    shutil.copyfile(src, file_path)
+                else:
+                    cv2.imwrite(file_path, cv2.imread(src))
+                conn.execute("""
+                    INSERT OR REPLACE INTO employees (employee_id, name, role, department, image_path, embedding, embedding_model)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (emp_id, r["name"], r.get("role", ""), r.get("department", ""), file_path,
+                      json.dumps(done[emp_id]["embedding"]), job["model_name"]))
+                conn.execute("DELETE FROM face_embeddings WHERE employee_id = ?", (emp_id,))
+                if r.get("role"): conn.execute("INSERT OR IGNORE INTO roles (role_name) VALUES (?)", (r["role"],))
+                if r.get("department"): conn.execute("INSERT OR IGNORE INTO departments (dep_name) VALUES (?)", (r["department"],))
+    finally:
+        conn.close()
+
+    # 3. รายงานไฟล์ที่ไม่ผ่าน
+    with open(os.path.join(job_dir, "failures.csv"), "w", encoding="utf-8-sig", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=["employee_id", "file", "error"])
+        w.writeheader()
+        w.writerows(failures)
+
+    state.update({"status": "done", "imported": len(ok_rows), "failed": len(failures), "failures": failures,
+                  "employee_ids": [r["employee_id"] for r in ok_rows]})
+    if progress: progress(state)
+    return state
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="นำเข้าพนักงานจำนวนมาก (ZIP/โฟลเดอร์รูป + CSV)")
+    parser.add_argument("photos", nargs="?", help="ไฟล์ ZIP หรือโฟลเดอร์รูปพนักงาน")
+    parser.add_argument("csv", nargs="?", help="ไฟล์ CSV: employee_id,name,role,department[,photo]")
+    parser.add_argument("--resume", help="ทำงานต่อจากโฟลเดอร์งานเดิม (bulk_jobs/<job_id>)")
+    parser.add_argument("--workers", type=int, default=None, help="จำนวน process (ค่าเริ่มต้น = จำนวน Core)")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--force", action="store_true", help="นำเข้าแม้หน้าซ้ำกับพนักงานคนอื่น")
+    args = parser.parse_args()
+
+    if args.resume:
+        job_dir = args.resume
+    elif args.photos and args.csv:
+        _, job_dir = prepare_job(args.photos, args.csv, active_model(args.db))
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+    print(f">>> 📥 Bulk import job: {job_dir}")
+    def show(s):
+        print(f"\r    {s['processed']}/{s['total']} รูป ({s['rate']} รูป/วินาที)", end="", flush=True)
+    summary = run_job(job_dir, args.db, args.workers, show, args.force)
+    print(f"\n>>> ✅ นำเข้า {summary['imported']} คน, ไม่ผ่าน {summary['failed']} รายการ (ดู {job_dir}/failures.csv)")
+    print(">>> ℹ️ ถ้า Server เปิดอยู่ ให้เรียก POST /api/system/reload-faces เพื่อโหลดใบหน้าใหม่")
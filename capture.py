@@ -0,0 +1,77 @@
+"""บันทึกคำขอ /scan และ /manual_scan จริง (ภาพ เวลาที่มาถึง เครื่องที่ส่ง ผลลัพธ์) ไว้เล่นซ้ำด้วย replay_capture.py
+
+- ปิดไว้โดยค่าเริ่มต้น เปิดด้วย CAPTURE_ENABLED=True หรือ POST /api/system/capture
+- สุ่มเก็บตาม sample (0-1) เขียนเป็น JSON บรรทัดละคำขอ (ภาพเป็น base64)
+- ไฟล์ใหญ่เกิน max_mb / 2 จะย้ายไปเป็น <file>.1 (ทับของเดิม) พื้นที่รวมจึงไม่เกิน max_mb
+- เขียนไฟล์ใน thread แยก ถ้าคิวเต็ม (disk ช้า) จะทิ้งรายการนั้นแทนการหน่วงการสแกน
+ไฟล์นี้มีรูปใบหน้าพนักงาน เก็บเฉพาะในเครื่อง Server และลบเมื่อใช้เสร็จ
+"""
+import os
+import json
+import queue
+import base64
+import random
+import threading
+
+class TrafficRecorder:
+    def __init__(self, path, enabled=False, sample=1.0, max_mb=200):
+        self.path = path
+        self.enabled = enabled
+        self.sample = sample
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.pending = queue.Queue(maxsize=256)
+        self.stats = {"recorded": 0, "dropped": 0, "rotated": 0}
+        self._thread = None
+
+    def configure(self, enabled=None, sample=None):
+        if enabled is not None: self.enabled = enabled
+        if sample is not None: self.sample = min(max(sample, 0.0), 1.0)
+
+    def record(self, endpoint, arrival, client_ip, kiosk_id, contents, result, elapsed_ms, **form):
+        """เรียกเมื่อได้คำตอบแล้วเท่านั้น result = None หมายถึงไม่ได้ประมวลผล (Server ตอบ BUSY)"""
+        if not self.enabled or random.random() >= self.sample: return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._writer, daemon=True)
+            self._thread.start()
+        try:
+            self.pending.put_nowait({"t": round(arrival, 3), "endpoint": endpoint, "client_ip": client_ip,
+                                     "kiosk_id": kiosk_id, "form": form, "ms": round(elapsed_ms, 1),
+                                     "result": result if result is not None else {"status": "BUSY"}, "image": contents})
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def _writer(self):
+        while True:
+            rec = self.pending.get()
+            try:
+                rec["image"] = base64.b64encode(rec["image"]).decode("ascii")
+                line = json.dumps(rec, ensure_ascii=False) + "\n"
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes // 2:
+                    os.replace(self.path, self.path + ".1")
+                    self.stats["rotated"] += 1
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+                self.stats["recorded"] += 1
+            except Exception as e:
+                self.stats["dropped"] += 1
+                print(f"Capture Error: {e}")
+
+    def snapshot(self):
+        size = sum(os.path.getsize(p) for p in (self.path, self.path + ".1") if os.path.exists(p))
+        return {"enabled": self.enabled, "sample": self.sample, "file": self.path,
+                "size_mb": round(size / (1024 * 1024), 2), "max_mb": round(self.max_bytes / (1024 * 1024), 1), **self.stats}
+
+def read_capture(paths):
+    """อ่านไฟล์ capture (ไฟล์เก่า .1 ก่อน) คืน list ของคำขอเรียงตามเวลาที่มาถึง (image เป็น bytes)"""
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                    rec["image"] = base64.b64decode(rec["image"])
+                    records.append(rec)
+                except ValueError:
+                    pass  # บรรทัดสุดท้ายอาจเขียนไม่ครบตอน Server ถูกปิด
+    return sorted(records, key=lambda r: r["t"])
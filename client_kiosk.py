@@ -2,10 +2,17 @@ import sys
 import cv2
 import time
 import requests
+from requests.adapters import HTTPAdapter
 import winsound
 import os
 import threading
+import sqlite3
+import socket
+import struct
+import json
 import numpy as np
+from collections import deque, OrderedDict
+from queue import Queue, Empty
 from datetime import datetime
 from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
@@ -22,6 +29,15 @@ load_dotenv() # อ่านไฟล์ .env
 SERVER_URL = os.getenv("SERVER_URL", "http://localhost:9876")
 CAMERA_INDEX = int(os.getenv("CAMERA_INDEX", 0))
 CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", 5))
+KIOSK_DEBUG = os.getenv("KIOSK_DEBUG", "False").lower() == "true"  # แสดงเวลาแต่ละขั้นบนจอ (กด F12 สลับได้)
+QUEUE_DB = os.getenv("KIOSK_QUEUE_DB", "kiosk_queue.db")  # ภาพที่สแกนตอน Server ล่ม (รอส่งย้อนหลัง)
+QUEUE_MAX = int(os.getenv("KIOSK_QUEUE_MAX", 5000))
+REPLAY_BATCH = int(os.getenv("KIOSK_REPLAY_BATCH", 10))        # ภาพต่อคำขอ /scan/batch
+KIOSK_ID = os.getenv("KIOSK_ID", socket.gethostname())  # ให้ Server แยก cache/สถิติของแต่ละเครื่อง
+SCAN_TRANSPORT = os.getenv("SCAN_TRANSPORT", "http").lower()  # http = POST /scan ทีละภาพ | ws = WebSocket /ws/scan ค้าง connection ไว้
+EDGE_EMBEDDING = os.getenv("EDGE_EMBEDDING", "False").lower() == "true"  # คำนวณ embedding ในเครื่อง Kiosk ส่งแค่ผลไป Server
+EDGE_MODEL = os.getenv("MODEL_NAME", "Facenet512")  # ต้องตรงกับโมเดลของ Server
+REPLAY_INTERVAL = float(os.getenv("KIOSK_REPLAY_INTERVAL", 2))  # วินาทีระหว่างแต่ละชุด (กันถล่ม Server ตอนเพิ่งกลับมา)
 
 print(f"⚙️ Config Loaded: Server={SERVER_URL}, Cam={CAMERA_INDEX}")
 
@@ -32,19 +48,62 @@ except:
     pass
 
 # --- HELPER: วาดข้อความภาษาไทย (PIL) ---
-def draw_thai_text(img, text, pos, color=(0, 255, 0), size=30):
-    """วาดข้อความภาษาไทยด้วย PIL"""
-    img_pil = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-    draw = ImageDraw.Draw(img_pil)
-    
-    try:
-        # พยายามใช้ฟอนต์ Tahoma (มีใน Windows ทุกเครื่อง)
-        font = ImageFont.truetype("tahoma.ttf", size) 
-    except:
-        font = ImageFont.load_default()
+# โหลดฟอนต์ครั้งเดียวต่อขนาด และวาดข้อความแต่ละแบบครั้งเดียวเป็นภาพเล็ก (sprite) เก็บไว้ใน cache
+# ตอนวาดลงเฟรมจะผสมเฉพาะบริเวณข้อความด้วย NumPy ไม่ต้องแปลงทั้งภาพไป-กลับ PIL ทุกเฟรม
+_font_cache = {}
+_sprite_cache = OrderedDict()
+_text_lock = threading.Lock()
+SPRITE_CACHE_SIZE = 256
+
+def get_font(size):
+    font = _font_cache.get(size)
+    if font is None:
+        try:
+            # พยายามใช้ฟอนต์ Tahoma (มีใน Windows ทุกเครื่อง)
+            font = ImageFont.truetype("tahoma.ttf", size)
+        except:
+            font = ImageFont.load_default()
+        _font_cache[size] = font
+    return font
+
+def render_text_sprite(text, size, color):
+    """คืน (สี BGR คูณ alpha แล้ว, 1 - alpha) ของข้อความ ใช้ซ้ำจาก cache ถ้าเคยวาดแล้ว"""
+    key = (text, size, color)
+    with _text_lock:
+        sprite = _sprite_cache.get(key)
+        if sprite is not None:
+            _sprite_cache.move_to_end(key)
+            return sprite
+
+        font = get_font(size)
+        _, _, right, bottom = font.getbbox(text)
+        img = Image.new("RGBA", (max(right, 1), max(bottom, 1)), (0, 0, 0, 0))
+        ImageDraw.Draw(img).text((0, 0), text, font=font, fill=color)
+        rgba = np.asarray(img).astype(np.float32)
+        alpha = rgba[..., 3:4] / 255.0
+        sprite = (rgba[..., 2::-1] * alpha, 1.0 - alpha)  # RGB -> BGR
+
+        _sprite_cache[key] = sprite
+        if len(_sprite_cache) > SPRITE_CACHE_SIZE:
+            _sprite_cache.popitem(last=False)
+        return sprite
 
-    draw.text(pos, text, font=font, fill=color)
-    return cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGB2BGR)
+def draw_thai_text(img, text, pos, color=(0, 255, 0), size=30):
+    """วาดข้อความภาษาไทยลงภาพ BGR (แก้ภาพเดิมโดยตรง และคืนภาพเดิม)"""
+    premul, inv_alpha = render_text_sprite(text, size, tuple(color))
+    sh, sw = premul.shape[:2]
+    H, W = img.shape[:2]
+    x, y = int(pos[0]), int(pos[1])
+
+    # ตัดส่วนที่ล้นขอบภาพ
+    x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + sw, W), min(y + sh, H)
+    if x0 >= x1 or y0 >= y1: return img
+    sprite = premul[y0 - y:y1 - y, x0 - x:x1 - x]
+    keep = inv_alpha[y0 - y:y1 - y, x0 - x:x1 - x]
+
+    roi = img[y0:y1, x0:x1]
+    roi[:] = (roi * keep + sprite + 0.5).astype(np.uint8)
+    return img
 
 # --- HELPER: ฝังวันที่เวลาลงในภาพ ---
 def add_timestamp_to_image(image):
@@ -78,61 +137,516 @@ def play_greeting(name):
         print(f"TTS Error: {e}")
         winsound.Beep(1000, 200)
 
-# --- WORKER: เช็คสถานะ Server ---
-class ServerStatusThread(QThread):
-    status_signal = pyqtSignal(bool, str)
+# --- HTTP: ใช้ Session เดียวตลอดอายุโปรแกรม (keep-alive ไม่ต้อง TCP/TLS handshake ใหม่ทุกคำขอ) ---
+def make_session():
+    session = requests.Session()
+    session.headers["X-Kiosk-Id"] = KIOSK_ID
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)  # 1 เส้นสำหรับสแกน/health + 1 เส้นสำหรับส่งคิวย้อนหลัง
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+http = make_session()
+
+# --- คิวเก็บภาพตอน Offline (SQLite ในเครื่อง ปิดโปรแกรม/ไฟดับก็ไม่หาย) ---
+class OfflineQueue:
+    def __init__(self, path=QUEUE_DB, max_items=QUEUE_MAX):
+        self.max_items = max_items
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS scan_queue (id INTEGER PRIMARY KEY AUTOINCREMENT, captured_at TEXT, image BLOB)")
+        self.conn.commit()
+
+    def put(self, jpeg_bytes, captured_at):
+        with self.lock:
+            self.conn.execute("INSERT INTO scan_queue (captured_at, image) VALUES (?, ?)", (captured_at.isoformat(), jpeg_bytes))
+            # เต็มแล้วทิ้งภาพเก่าสุด (ดิสก์ไม่เต็มถ้า Server ล่มนาน)
+            self.conn.execute("DELETE FROM scan_queue WHERE id <= (SELECT MAX(id) FROM scan_queue) - ?", (self.max_items,))
+            self.conn.commit()
+
+    def peek(self, n):
+        with self.lock:
+            return self.conn.execute("SELECT id, captured_at, image FROM scan_queue ORDER BY id LIMIT ?", (n,)).fetchall()
+
+    def remove(self, ids):
+        with self.lock:
+            self.conn.executemany("DELETE FROM scan_queue WHERE id = ?", [(i,) for i in ids])
+            self.conn.commit()
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM scan_queue").fetchone()[0]
+
+# --- WORKER: ส่งภาพในคิวย้อนหลังเมื่อ Server กลับมา ---
+class QueueUploader(QThread):
+    """ส่งทีละชุดผ่าน /scan/batch เว้นช่วงระหว่างชุด ถ้าส่งไม่ผ่านจะรอนานขึ้นเรื่อยๆ (สูงสุด 60 วินาที)"""
+    queue_changed = pyqtSignal(int)  # จำนวนภาพที่ยังค้างส่ง
+
+    def __init__(self, queue, window):
+        super().__init__()
+        self.queue = queue
+        self.window = window
+        self.running = True
 
     def run(self):
-        while True:
+        delay = REPLAY_INTERVAL
+        self.queue_changed.emit(self.queue.count())
+        while self.running:
+            time.sleep(delay)
+            if not self.window.server_online: continue
+            rows = self.queue.peek(REPLAY_BATCH)
+            if not rows:
+                delay = REPLAY_INTERVAL
+                continue
             try:
-                start_time = time.time()
-                response = requests.get(f"{SERVER_URL}/health", timeout=2)
-                if response.status_code == 200:
-                    latency = int((time.time() - start_time) * 1000)
-                    self.status_signal.emit(True, f"{latency} ms")
-                else:
-                    self.status_signal.emit(False, "Error")
-            except:
-                self.status_signal.emit(False, "Timeout")
-            self.sleep(CHECK_INTERVAL)
-
-# --- WORKER: ส่งภาพสแกน (Auto Scan) ---
+                files = [('files', (f'{i}.jpg', img, 'image/jpeg')) for i, _, img in rows]
+                data = [('captured_at', ts) for _, ts, _ in rows]
+                response = http.post(f"{SERVER_URL}/scan/batch", files=files, data=data, timeout=60)
+                if response.status_code in (429, 503) and response.headers.get("Retry-After"):
+                    # Server กำลังยุ่งกับงานสแกนสด รอตามที่ Server บอกแล้วค่อยส่งใหม่
+                    delay = max(float(response.headers["Retry-After"]), REPLAY_INTERVAL)
+                    print(f"Replay: Server ไม่ว่าง รอ {delay:.0f} วินาที")
+                    continue
+                if response.status_code != 200: raise RuntimeError(f"HTTP {response.status_code}")
+                results = response.json()["results"]
+                # ภาพที่ Server อ่านไม่ได้ (ERROR) ไม่ต้องส่งซ้ำ ลบออกจากคิวทั้งชุด
+                self.queue.remove([i for i, _, _ in rows])
+                for r in results:
+                    if r.get("status") == "ERROR": print(f"Replay: ไม่บันทึก ({r.get('name')})")
+                    for f in r.get("faces", []):
+                        if f["status"] == "OK": print(f"Replay: {f['name']} ({'บันทึก' if f.get('recorded') else 'ซ้ำ'})")
+                self.queue_changed.emit(self.queue.count())
+                delay = REPLAY_INTERVAL
+            except Exception as e:
+                print(f"Replay Error: {e}")
+                delay = min(delay * 2, 60)
+
+    def stop(self):
+        self.running = False
+
+# --- WORKER: งานเครือข่ายทั้งหมด (สแกน / ลงเวลามือ / เช็คสถานะ Server) ---
 class NetworkThread(QThread):
+    """Thread เดียวทำงานตลอดอายุโปรแกรม รับงานจากคิวแล้วส่งผ่าน Session เดียวกัน
+    ช่วงว่างจะเรียก /health ทุก CHECK_INTERVAL วินาทีบน connection เดิม (วัด RTT แบบไม่มี handshake)"""
     result_ready = pyqtSignal(dict)
-    
-    def __init__(self):
+    manual_ready = pyqtSignal(dict)
+    status_signal = pyqtSignal(bool, str)
+
+    def __init__(self, queue):
         super().__init__()
-        self.frame_to_send = None
+        self.queue = queue
+        self.jobs = Queue()
         self.is_busy = False
-
-    def request_scan(self, frame):
+        self.rtt_ms = 0.0   # เวลาไป-กลับของ /health (ไม่มีงานประมวลผล)
+        self.scan_ms = 0.0  # เวลาทั้งหมดของ /scan ล่าสุด
+        self.ws = None
+        self.ws_seq = 0
+        self.edge_enabled = EDGE_EMBEDDING
+        self.embed_ms = 0.0  # เวลาคำนวณ embedding ในเครื่อง (โหมด Edge)
+        self.busy_until = 0.0  # Server ตอบ BUSY (429/503 + Retry-After) เก็บเข้าคิวไปก่อนจนถึงเวลานี้
+
+    def request_scan(self, frame, offline=False):
         if not self.is_busy:
+            self.is_busy = True
+            self.jobs.put(("scan", frame, datetime.now(), offline))
+
+    def request_manual(self, emp_id, frame):
+        self.jobs.put(("manual", emp_id, frame, False))
+
+    def stop(self):
+        self.jobs.put(None)
+        self.wait(3000)
+
+    def run(self):
+        if self.edge_enabled:
+            try:
+                from face_engine import load_model
+                load_model(EDGE_MODEL)
+            except Exception as e:
+                print(f"⚠️ โหลดโมเดล Edge ไม่สำเร็จ ({e}) -> ส่งภาพเต็มแทน")
+                self.edge_enabled = False
+        last_ping = 0.0
+        while True:
+            try:
+                job = self.jobs.get(timeout=max(CHECK_INTERVAL - (time.time() - last_ping), 0.01))
+            except Empty:
+                self.check_health()
+                last_ping = time.time()
+                continue
+            if job is None:
+                if self.ws: self.ws.close()
+                break
+            kind, a, b, offline = job
+            if kind == "scan":
+                try:
+                    self.send_scan(a, b, offline)
+                finally:
+                    self.is_busy = False
+            else:
+                self.send_manual(a, b)
+
+    def check_health(self):
+        try:
+            start_time = time.perf_counter()
+            response = http.get(f"{SERVER_URL}/health", timeout=2)
+            if response.status_code == 200:
+                self.rtt_ms = (time.perf_counter() - start_time) * 1000
+                self.status_signal.emit(True, f"RTT {self.rtt_ms:.0f} ms")
+            else:
+                self.status_signal.emit(False, "Error")
+        except:
+            self.status_signal.emit(False, "Timeout")
+
+    def send_scan(self, frame, captured_at, offline):
+        try:
             h, w = frame.shape[:2]
             target_width = 640
+            scale = 1.0
             if w > target_width:
                 scale = target_width / w
                 frame = cv2.resize(frame, (0,0), fx=scale, fy=scale)
-            
-            # ฝัง Timestamp ก่อนส่ง
-            frame_with_stamp = add_timestamp_to_image(frame)
-            self.frame_to_send = frame_with_stamp
-            self.start()
 
-    def run(self):
-        if self.frame_to_send is not None:
-            self.is_busy = True
+            # ฝัง Timestamp ก่อนส่ง
+            stamped = add_timestamp_to_image(frame)
+            _, img_encoded = cv2.imencode('.jpg', stamped)
+            jpeg = img_encoded.tobytes()
             try:
-                _, img_encoded = cv2.imencode('.jpg', self.frame_to_send)
-                files = {'file': ('image.jpg', img_encoded.tobytes(), 'image/jpeg')}
-                
-                response = requests.post(f"{SERVER_URL}/scan", files=files, timeout=10)
-                
-                if response.status_code == 200:
-                    self.result_ready.emit(response.json())
+                if offline: raise ConnectionError("Server offline")
+                if time.time() < self.busy_until: raise ConnectionError("Server busy")
+                t0 = time.perf_counter()
+                result = self.scan_edge(frame, stamped) if self.edge_enabled else None
+                if result is None and SCAN_TRANSPORT == "ws":
+                    result = self.scan_ws(jpeg)
+                elif result is None:
+                    files = {'file': ('image.jpg', jpeg, 'image/jpeg')}
+                    response = http.post(f"{SERVER_URL}/scan", files=files, timeout=10)
+                    self.check_busy(response)
+                    result = response.json()
+                self.scan_ms = (time.perf_counter() - t0) * 1000
+                # กรอบหน้าที่ Server ส่งกลับเป็นพิกัดของภาพที่ย่อแล้ว แปลงกลับเป็นพิกัดกล้อง
+                for f in result.get("faces", []):
+                    f["box"] = [int(v / scale) for v in f["box"]]
+                self.result_ready.emit(result)
             except Exception as e:
-                print(f"Scan Network Error: {e}")
-            finally:
-                self.is_busy = False
+                # ส่งไม่ได้ เก็บภาพไว้ในเครื่องพร้อมเวลาที่ถ่าย แล้วค่อยส่งย้อนหลัง
+                print(f"Scan Network Error: {e} -> เก็บเข้าคิว")
+                self.queue.put(jpeg, captured_at)
+                self.result_ready.emit({"status": "QUEUED"})
+        except Exception as e:
+            print(f"Scan Error: {e}")
+
+    def scan_edge(self, frame, stamped):
+        """โหมด Edge: คำนวณ embedding ทุกใบหน้าในเครื่อง ส่งแค่ embedding + กรอบหน้า + รูปหลักฐานขนาดเล็ก
+        คืน None ถ้าโมเดลไม่ตรงกับ Server (ปิดโหมด Edge แล้วให้ส่งภาพเต็มแทน)"""
+        from face_engine import represent_faces, model_signature
+        t0 = time.perf_counter()
+        faces = represent_faces(frame, EDGE_MODEL)
+        self.embed_ms = (time.perf_counter() - t0) * 1000
+        if not faces: return {"status": "FAIL", "name": "Unknown", "faces": []}
+
+        thumb = cv2.resize(stamped, (0,0), fx=0.5, fy=0.5)
+        _, img_encoded = cv2.imencode('.jpg', thumb, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        # กรอบหน้าเป็นพิกัดของ frame (ขนาดเดียวกับภาพที่ส่งให้ /scan) Server ตอบ faces รูปแบบเดียวกับ /scan
+        data = {'embeddings': json.dumps(faces), 'model': model_signature(EDGE_MODEL)}
+        files = {'file': ('evidence.jpg', img_encoded.tobytes(), 'image/jpeg')}
+        response = http.post(f"{SERVER_URL}/scan/embedding", data=data, files=files, timeout=10)
+        if response.status_code == 409:
+            print(f"⚠️ โมเดล Edge {data['model']} ไม่ตรงกับ Server ({response.json().get('model')}) -> ส่งภาพเต็มแทน")
+            self.edge_enabled = False
+            return None
+        self.check_busy(response)
+        return response.json()
+
+    def check_busy(self, response):
+        """ตอบไม่สำเร็จ -> ConnectionError (ภาพจะเข้าคิวส่งย้อนหลัง) ถ้ามี Retry-After จะหยุดส่งสดตามเวลานั้น"""
+        if response.status_code == 200: return
+        retry_after = response.headers.get("Retry-After")
+        if retry_after: self.busy_until = time.time() + float(retry_after)
+        raise ConnectionError(f"HTTP {response.status_code}")
+
+    def scan_ws(self, jpeg):
+        """ส่งภาพผ่าน WebSocket ที่เปิดค้างไว้ (ต่อใหม่อัตโนมัติถ้าหลุด) รอผลที่ seq ตรงกัน"""
+        import websocket  # websocket-client (ใช้เฉพาะโหมด ws)
+        try:
+            if self.ws is None:
+                self.ws = websocket.create_connection(SERVER_URL.replace("http", "ws", 1) + "/ws/scan", timeout=10,
+                                                      header=[f"X-Kiosk-Id: {KIOSK_ID}"])
+            self.ws_seq = (self.ws_seq + 1) & 0xFFFFFFFF
+            self.ws.send_binary(struct.pack(">I", self.ws_seq) + jpeg)
+            while True:
+                result = json.loads(self.ws.recv())
+                if result.get("seq") == self.ws_seq: break
+        except Exception:
+            if self.ws: self.ws.close()
+            self.ws = None
+            raise
+        if result.get("status") == "BUSY":  # connection ยังใช้ได้ แค่ Server ตัดงานนี้
+            self.busy_until = time.time() + result.get("retry_after", 1)
+            raise ConnectionError("Server busy")
+        return result
+
+    def send_manual(self, emp_id, frame):
+        try:
+            frame_stamp = add_timestamp_to_image(frame)
+            small = cv2.resize(frame_stamp, (0,0), fx=0.5, fy=0.5)
+            _, img_encoded = cv2.imencode('.jpg', small)
+
+            files = {'file': ('manual.jpg', img_encoded.tobytes(), 'image/jpeg')}
+            data = {'employee_id': emp_id}
+            res = http.post(f"{SERVER_URL}/manual_scan", data=data, files=files, timeout=5)
+            if res.status_code == 200:
+                self.manual_ready.emit(res.json())
+            else:
+                self.manual_ready.emit({"status": "ERROR", "message": "Server Error"})
+        except Exception as e:
+            self.manual_ready.emit({"status": "ERROR", "message": str(e)})
+
+# --- WORKER: อ่านภาพจากกล้อง (Producer) ---
+class CaptureThread(QThread):
+    """อ่านภาพจากกล้องตลอดเวลา เก็บเฉพาะภาพล่าสุดไม่กี่ภาพ (ring buffer) ไม่ให้ UI ต้องรอกล้อง"""
+
+    def __init__(self, camera_index, buffer_size=2):
+        super().__init__()
+        self.camera_index = camera_index
+        self.frames = deque(maxlen=buffer_size)
+        self.cond = threading.Condition()
+        self.seq = 0
+        self.read_ms = 0.0
+        self.fps = 0.0
+        self.running = True
+
+    def run(self):
+        cap = cv2.VideoCapture(self.camera_index)
+        last = time.perf_counter()
+        while self.running:
+            t0 = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                self.msleep(50)
+                continue
+            frame = cv2.flip(frame, 1)
+            now = time.perf_counter()
+            self.read_ms = (now - t0) * 1000
+            self.fps = 0.9 * self.fps + 0.1 * (1.0 / max(now - last, 1e-6))
+            last = now
+            with self.cond:
+                self.seq += 1
+                self.frames.append((self.seq, frame))
+                self.cond.notify_all()
+        cap.release()
+
+    def latest(self, after_seq=0, timeout=0.5):
+        """รอจนมีภาพใหม่กว่า after_seq แล้วคืน (seq, frame) ล่าสุด หรือ None ถ้าหมดเวลา"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > after_seq or not self.running, timeout):
+                return None
+            return self.frames[-1] if self.frames else None
+
+    def stop(self):
+        self.running = False
+        with self.cond: self.cond.notify_all()
+        self.wait(2000)
+
+# --- ติดตามใบหน้าระหว่างเฟรม (ส่งแต่ละคนไปจดจำครั้งเดียว) ---
+TRACK_IOU = 0.3          # IoU ขั้นต่ำที่ถือว่าเป็นคนเดิม
+TRACK_LOST_S = 1.0       # ไม่เห็นหน้าเกินนี้ถือว่าคนออกจากกล้องแล้ว
+TRACK_WINDOW_S = 0.6     # ช่วงเวลาเก็บเฟรมเพื่อเลือกภาพที่ดีที่สุดก่อนส่ง
+TRACK_RETRY_S = 2.0      # จดจำไม่สำเร็จ รอเท่านี้แล้วเก็บเฟรมใหม่ส่งอีกครั้ง
+TRACK_SEND_TIMEOUT = 12.0  # ส่งไปแล้วไม่ได้คำตอบ (เครือข่ายขัดข้อง) ให้ส่งใหม่ได้
+
+def _iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = max(0, min(ax+aw, bx+bw) - max(ax, bx))
+    ih = max(0, min(ay+ah, by+bh) - max(ay, by))
+    inter = iw * ih
+    return inter / float(aw*ah + bw*bh - inter) if inter else 0.0
+
+def face_quality(frame, box):
+    """คะแนนคุณภาพแบบเร็ว: ความคม (Laplacian variance) x ความตรง (สมมาตรซ้าย-ขวา) x ขนาดหน้า"""
+    x, y, w, h = box
+    roi = frame[max(y, 0):y+h, max(x, 0):x+w]
+    if roi.size == 0: return 0.0
+    gray = cv2.cvtColor(cv2.resize(roi, (64, 64)), cv2.COLOR_BGR2GRAY)
+    sharp = cv2.Laplacian(gray, cv2.CV_64F).var()
+    left = gray[:, :32].astype(np.int16)
+    right = gray[:, :31:-1].astype(np.int16)
+    frontal = 1.0 - np.abs(left - right).mean() / 255.0
+    return float(np.log1p(sharp) * frontal * w)
+
+class FaceTracker:
+    """จับคู่กรอบหน้าระหว่างเฟรมด้วย IoU/ระยะจุดกึ่งกลาง ให้แต่ละคนมี track id
+    เก็บเฟรมที่ดีที่สุดของแต่ละคนในช่วงสั้นๆ แล้วส่งไปจดจำครั้งเดียว
+    ส่งใหม่เฉพาะเมื่อจดจำไม่สำเร็จหรือคนนั้นหายไปจากกล้องแล้วกลับมา"""
+
+    def __init__(self):
+        self.tracks = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    def _match(self, box, candidates):
+        best, best_score = None, 0.0
+        cx, cy = box[0] + box[2] / 2, box[1] + box[3] / 2
+        for tid in candidates:
+            t = self.tracks[tid]
+            tx, ty, tw, th = t["box"]
+            iou = _iou(box, t["box"])
+            if iou < TRACK_IOU:
+                # กล้อง fps ต่ำ/ขยับเร็ว กรอบอาจไม่ซ้อนกัน ใช้ระยะจุดกึ่งกลางแทน
+                dist = ((cx - tx - tw / 2) ** 2 + (cy - ty - th / 2) ** 2) ** 0.5
+                iou = 0.01 if dist < 0.5 * max(box[2], tw) else 0.0
+            if iou > best_score:
+                best, best_score = tid, iou
+        return best
+
+    def update(self, faces, frame, now):
+        """อัปเดตด้วยผลตรวจจับรอบล่าสุด คืนรายการ (box, name) ของหน้าที่เห็นในเฟรมนี้"""
+        with self.lock:
+            free = set(self.tracks)
+            for box in sorted(faces, key=lambda b: b[2] * b[3], reverse=True):
+                tid = self._match(box, free)
+                if tid is None:
+                    tid = self.next_id
+                    self.next_id += 1
+                    self.tracks[tid] = {"box": box, "last_seen": now, "state": "collect", "window_start": now,
+                                        "best": None, "best_score": 0.0, "sent_at": 0.0, "name": None}
+                free.discard(tid)
+                t = self.tracks[tid]
+                t["box"], t["last_seen"] = box, now
+                if t["state"] == "collect" and now >= t["window_start"]:
+                    score = face_quality(frame, box)
+                    if score > t["best_score"]:
+                        t["best"], t["best_score"] = frame, score
+            for tid in [tid for tid in free if now - self.tracks[tid]["last_seen"] > TRACK_LOST_S]:
+                del self.tracks[tid]
+            return [(t["box"], t["name"]) for t in self.tracks.values() if t["last_seen"] == now]
+
+    def next_to_send(self, now):
+        """เลือก track ที่เก็บเฟรมครบช่วงแล้ว (คนที่หน้าใหญ่สุด/ใกล้กล้องสุดก่อน) คืน (track_id, frame) หรือ None"""
+        with self.lock:
+            ready = []
+            for tid, t in self.tracks.items():
+                if t["state"] == "sent" and now - t["sent_at"] > TRACK_SEND_TIMEOUT:
+                    t.update(state="collect", window_start=now, best=None, best_score=0.0)
+                if t["state"] == "collect" and t["best"] is not None and now - t["window_start"] >= TRACK_WINDOW_S:
+                    ready.append(tid)
+            if not ready: return None
+            tid = max(ready, key=lambda i: self.tracks[i]["box"][2] * self.tracks[i]["box"][3])
+            t = self.tracks[tid]
+            frame = t["best"]
+            t.update(state="sent", sent_at=now, best=None, best_score=0.0)
+            return tid, frame
+
+    def set_result(self, tid, data, now):
+        """ใช้ผลจดจำของภาพที่ส่งไปจาก track tid ทุกใบหน้าที่จดจำได้ในภาพนั้นจะถูกจับคู่กับ track ตามกรอบ
+        (หลายคนยืนพร้อมกันจึงไม่ต้องส่งภาพแยกทีละคน)"""
+        with self.lock:
+            for f in data.get("faces", []):
+                if f.get("status") != "OK": continue
+                other = self._match(tuple(f["box"]), [i for i, t in self.tracks.items() if t["state"] != "done"])
+                if other is not None: self.tracks[other].update(state="done", name=f["name"])
+            t = self.tracks.get(tid)
+            if t is None or t["state"] == "done": return  # คนออกจากกล้องไปแล้ว / จดจำได้แล้ว
+            if data.get("status") == "OK" and "faces" not in data:
+                t.update(state="done", name=data.get("name"))
+            elif data.get("status") == "QUEUED":
+                t.update(state="done")  # เก็บเข้าคิวแล้ว ไม่ต้องถ่ายซ้ำ
+            else:
+                t.update(state="collect", window_start=now + TRACK_RETRY_S, best=None, best_score=0.0)
+
+# --- WORKER: ตรวจจับใบหน้า + วาดกรอบ (Consumer) ---
+class FrameProcessor(QThread):
+    """ดึงภาพล่าสุดจาก CaptureThread ตรวจจับใบหน้าตามรอบที่ปรับเองตามความเร็วเครื่อง
+    ติดตามใบหน้าแต่ละคน วาดกรอบ/ชื่อ แล้วแปลงเป็น QImage ให้ UI แค่นำไปแสดง"""
+    faces_ready = pyqtSignal(object)  # รายการ (กรอบหน้า, ชื่อ) ของหน้าที่เห็นในรอบนี้
+    frame_ready = pyqtSignal()
+
+    def __init__(self, capture, window):
+        super().__init__()
+        self.capture = capture
+        self.window = window
+        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.tracker = FaceTracker()
+        self.faces = []
+        self.detect_interval = 0.1  # วินาที (ปรับอัตโนมัติ)
+        self.latest_image = None
+        self.lock = threading.Lock()
+        self.pending = False
+        self.running = True
+        self.stats = {"dropped": 0, "detect_ms": 0.0, "draw_ms": 0.0, "proc_fps": 0.0}
+
+    def run(self):
+        last_seq, last_detect, last_t = 0, 0.0, time.perf_counter()
+        while self.running:
+            item = self.capture.latest(last_seq)
+            if item is None: continue
+            seq, frame = item
+            if last_seq: self.stats["dropped"] += max(seq - last_seq - 1, 0)
+            last_seq = seq
+
+            now = time.time()
+            if not self.window.is_manual_mode and now - last_detect >= self.detect_interval:
+                t0 = time.perf_counter()
+                small = cv2.resize(frame, (0,0), fx=0.5, fy=0.5)
+                gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+                boxes = [(x*2, y*2, w*2, h*2) for (x, y, w, h) in self.face_cascade.detectMultiScale(gray, 1.2, 5)]
+                self.faces = self.tracker.update(boxes, frame, now)
+                detect_s = time.perf_counter() - t0
+                self.stats["detect_ms"] = detect_s * 1000
+                # ใช้ CPU กับการตรวจจับไม่เกินราว 1/3 ของเวลา เครื่องช้าจะตรวจถี่น้อยลงเอง
+                self.detect_interval = min(max(detect_s * 3, 0.05), 0.5)
+                last_detect = now
+                self.faces_ready.emit(self.faces)
+            elif self.window.is_manual_mode:
+                self.faces = []
+
+            t0 = time.perf_counter()
+            view = self.annotate(frame.copy())
+            rgb = cv2.cvtColor(view, cv2.COLOR_BGR2RGB)
+            h, w, ch = rgb.shape
+            qimg = QImage(rgb.data, w, h, ch*w, QImage.Format.Format_RGB888).copy()
+            self.stats["draw_ms"] = (time.perf_counter() - t0) * 1000
+            t = time.perf_counter()
+            self.stats["proc_fps"] = 0.9 * self.stats["proc_fps"] + 0.1 * (1.0 / max(t - last_t, 1e-6))
+            last_t = t
+
+            # ส่งสัญญาณเฉพาะเมื่อ UI แสดงภาพก่อนหน้าไปแล้ว กัน event ค้างคิวตอน UI ช้า
+            with self.lock:
+                if self.latest_image is not None and self.pending: self.stats["dropped"] += 1
+                self.latest_image = qimg
+                notify = not self.pending
+                self.pending = True
+            if notify: self.frame_ready.emit()
+
+    def annotate(self, frame):
+        win = self.window
+        color = (0, 255, 0) if win.server_online else (0, 0, 255)
+        for (rx, ry, rw, rh), name in self.faces:
+            cv2.rectangle(frame, (rx, ry), (rx+rw, ry+rh), color, 2)
+            # แสดงชื่อไทยบนกรอบของคนที่จดจำได้แล้ว (ชื่อติดตามคนนั้นไปจนออกจากกล้อง)
+            if name:
+                frame = draw_thai_text(frame, name, (rx, ry-35), (255, 255, 255), 30)
+        if win.debug_overlay:
+            lines = [
+                f"cam {self.capture.fps:4.1f} fps  read {self.capture.read_ms:5.1f} ms",
+                f"proc {self.stats['proc_fps']:4.1f} fps  draw {self.stats['draw_ms']:5.1f} ms",
+                f"detect {self.stats['detect_ms']:5.1f} ms  every {self.detect_interval*1000:4.0f} ms",
+                f"ui {win.render_fps:4.1f} fps  dropped {self.stats['dropped']}",
+                f"rtt {win.net_worker.rtt_ms:5.1f} ms  scan {win.net_worker.scan_ms:5.1f} ms  embed {win.net_worker.embed_ms:5.1f} ms",
+            ]
+            for i, line in enumerate(lines):
+                cv2.putText(frame, line, (10, 20 + i*20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1, cv2.LINE_AA)
+        return frame
+
+    def take_image(self):
+        with self.lock:
+            self.pending = False
+            return self.latest_image
+
+    def stop(self):
+        self.running = False
+        self.wait(2000)
 
 # --- UI MAIN WINDOW ---
 class ClientWindow(QMainWindow):
@@ -141,11 +655,13 @@ class ClientWindow(QMainWindow):
         self.setWindowTitle("Smart Attendance Kiosk")
         self.setFixedSize(1000, 750)
         
-        self.last_greeted_name = None 
+        self.greeted_names = set()  # ชื่อที่ทักทายไปแล้ว (ล้างเมื่อไม่มีใครอยู่หน้ากล้อง)
         self.is_manual_mode = False 
-        self.current_frame = None 
-        self.display_name = None
-        self.display_name_time = 0
+        self.pending_track = None
+        self.server_online = False
+        self.debug_overlay = KIOSK_DEBUG
+        self.render_fps = 0.0
+        self.last_render = time.perf_counter()
         
         # GUI Setup
         central = QWidget()
@@ -189,16 +705,16 @@ class ClientWindow(QMainWindow):
         self.txt_manual_id.setFont(QFont("Tahoma", 14))
         self.txt_manual_id.setStyleSheet("padding: 5px;")
         
-        btn_send_manual = QPushButton("📸 บันทึก")
-        btn_send_manual.setStyleSheet("background: #28a745; color: white; font-weight: bold; padding: 8px;")
-        btn_send_manual.clicked.connect(self.submit_manual)
+        self.btn_send_manual = QPushButton("📸 บันทึก")
+        self.btn_send_manual.setStyleSheet("background: #28a745; color: white; font-weight: bold; padding: 8px;")
+        self.btn_send_manual.clicked.connect(self.submit_manual)
         
         btn_cancel_manual = QPushButton("❌ ยกเลิก")
         btn_cancel_manual.setStyleSheet("background: #dc3545; color: white; padding: 8px;")
         btn_cancel_manual.clicked.connect(self.toggle_manual_mode)
         
         man_layout.addWidget(self.txt_manual_id)
-        man_layout.addWidget(btn_send_manual)
+        man_layout.addWidget(self.btn_send_manual)
         man_layout.addWidget(btn_cancel_manual)
         
         left_layout.addWidget(self.manual_widget)
@@ -228,31 +744,59 @@ class ClientWindow(QMainWindow):
 
         main_layout.addLayout(content_layout)
 
-        # SYSTEM INIT
-        self.cap = cv2.VideoCapture(CAMERA_INDEX)
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        
-        self.net_worker = NetworkThread()
+        # SYSTEM INIT (กล้อง -> ตรวจจับ -> UI แยก Thread กัน)
+        self.queue = OfflineQueue()
+        self.queue_count = 0
+        self.net_worker = NetworkThread(self.queue)
         self.net_worker.result_ready.connect(self.on_scan_result)
+        self.net_worker.manual_ready.connect(self.on_manual_result)
+        self.net_worker.status_signal.connect(self.update_server_status)
+        self.net_worker.start()
+        self.uploader = QueueUploader(self.queue, self)
+        self.uploader.queue_changed.connect(self.on_queue_changed)
+        self.uploader.start()
+        self.capture = CaptureThread(CAMERA_INDEX)
+        self.processor = FrameProcessor(self.capture, self)
+        self.processor.frame_ready.connect(self.render_frame)
+        self.processor.faces_ready.connect(self.on_faces)
+        self.capture.start()
+        self.processor.start()
         
-        self.status_worker = ServerStatusThread()
-        self.status_worker.status_signal.connect(self.update_server_status)
-        self.status_worker.start()
-
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_camera)
-        self.timer.start(30)
+        
+        self.clock_timer = QTimer()
+        self.clock_timer.timeout.connect(lambda: self.lbl_time.setText(datetime.now().strftime("%H:%M:%S")))
+        self.clock_timer.start(500)
+
+    @property
+    def current_frame(self):
+        item = self.capture.frames[-1] if self.capture.frames else None
+        return item[1] if item else None
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key.Key_F12:
+            self.debug_overlay = not self.debug_overlay
+        super().keyPressEvent(event)
+
+    def closeEvent(self, event):
+        self.uploader.stop()
+        self.net_worker.stop()
+        self.processor.stop()
+        self.capture.stop()
+        super().closeEvent(event)
 
     def update_server_status(self, is_online, msg):
         if is_online:
-            self.lbl_server_status.setText(f"🟢 Online ({msg})")
+            self.lbl_server_status.setText(f"🟢 Online ({msg})" + (f" ⏫ รอส่ง {self.queue_count}" if self.queue_count else ""))
             self.lbl_server_status.setStyleSheet("background: #e6fffa; color: green; border: 1px solid green; padding:5px; border-radius:5px; font-weight:bold;")
             self.server_online = True
         else:
-            self.lbl_server_status.setText(f"🔴 Offline ({msg})")
+            self.lbl_server_status.setText(f"🔴 Offline ({msg})" + (f" 📥 เก็บไว้ {self.queue_count}" if self.queue_count else ""))
             self.lbl_server_status.setStyleSheet("background: #ffe6e6; color: red; border: 1px solid red; padding:5px; border-radius:5px; font-weight:bold;")
             self.server_online = False
 
+    def on_queue_changed(self, count):
+        self.queue_count = count
+
     def toggle_manual_mode(self):
         self.is_manual_mode = not self.is_manual_mode
         if self.is_manual_mode:
@@ -277,99 +821,80 @@ class ClientWindow(QMainWindow):
         if self.current_frame is None: return
 
         self.lbl_action.setText("⏳ กำลังส่งข้อมูล...")
-        QApplication.processEvents()
+        self.btn_send_manual.setEnabled(False)
+        self.net_worker.request_manual(emp_id, self.current_frame.copy())
+
+    def on_manual_result(self, result):
+        self.btn_send_manual.setEnabled(True)
+        if result['status'] == 'OK':
+            QMessageBox.information(self, "สำเร็จ", f"บันทึก: {result['name']}")
+            self.toggle_manual_mode()
+        elif result['status'] == 'ERROR':
+            QMessageBox.critical(self, "Error", result.get('message', 'Unknown Error'))
+        else:
+            QMessageBox.critical(self, "ผิดพลาด", result.get('message', 'Unknown Error'))
 
-        try:
-            frame_stamp = add_timestamp_to_image(self.current_frame)
-            small = cv2.resize(frame_stamp, (0,0), fx=0.5, fy=0.5)
-            _, img_encoded = cv2.imencode('.jpg', small)
-            
-            files = {'file': ('manual.jpg', img_encoded.tobytes(), 'image/jpeg')}
-            data = {'employee_id': emp_id}
-            
-            res = requests.post(f"{SERVER_URL}/manual_scan", data=data, files=files, timeout=5)
-            
-            if res.status_code == 200:
-                result = res.json()
-                if result['status'] == 'OK':
-                    QMessageBox.information(self, "สำเร็จ", f"บันทึก: {result['name']}")
-                    self.toggle_manual_mode()
-                else:
-                    QMessageBox.critical(self, "ผิดพลาด", result.get('message', 'Unknown Error'))
-            else:
-                QMessageBox.critical(self, "Error", "Server Error")
-                
-        except Exception as e:
-            QMessageBox.critical(self, "Error", str(e))
-        
         if self.is_manual_mode:
             self.lbl_action.setText("กรุณากรอกรหัสพนักงาน...")
 
-    def update_camera(self):
-        self.lbl_time.setText(datetime.now().strftime("%H:%M:%S"))
-        
-        ret, frame = self.cap.read()
-        if ret:
-            frame = cv2.flip(frame, 1)
-            self.current_frame = frame.copy()
-
-            if not self.is_manual_mode:
-                small = cv2.resize(frame, (0,0), fx=0.5, fy=0.5)
-                gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
-                faces = self.face_cascade.detectMultiScale(gray, 1.2, 5)
-                
-                face_found = False
-                for (x, y, w, h) in faces:
-                    rx, ry, rw, rh = x*2, y*2, w*2, h*2
-                    color = (0, 255, 0) if getattr(self, 'server_online', False) else (0, 0, 255)
-                    
-                    cv2.rectangle(frame, (rx, ry), (rx+rw, ry+rh), color, 2)
-                    
-                    # แสดงชื่อไทยบนกรอบ
-                    if self.display_name and (time.time() - self.display_name_time < 5.0):
-                        frame = draw_thai_text(frame, self.display_name, (rx, ry-35), (255, 255, 255), 30)
-                    
-                    face_found = True
-
-                if face_found and getattr(self, 'server_online', False) and not self.net_worker.is_busy:
-                    if (time.time() - getattr(self, 'last_scan_time', 0)) > 2.5:
-                        self.lbl_action.setText("⏳ กำลังตรวจสอบ...")
-                        self.net_worker.request_scan(frame)
-                        self.last_scan_time = time.time()
-                elif not getattr(self, 'server_online', False):
-                    self.lbl_action.setText("❌ Server ไม่เชื่อมต่อ")
-                elif not face_found:
-                    self.lbl_action.setText("กรุณามองกล้อง...")
-                    if (time.time() - getattr(self, 'last_scan_time', 0)) > 5.0:
-                        self.last_greeted_name = None
-                        self.display_name = None
-            
-            # Show Video
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = frame.shape
-            qimg = QImage(frame.data, w, h, ch*w, QImage.Format.Format_RGB888)
-            self.video.setPixmap(QPixmap.fromImage(qimg).scaled(640, 480, Qt.AspectRatioMode.KeepAspectRatio))
+    def render_frame(self):
+        """UI Thread ทำแค่นำภาพที่วาดเสร็จแล้วไปแสดง"""
+        qimg = self.processor.take_image()
+        if qimg is None: return
+        self.video.setPixmap(QPixmap.fromImage(qimg).scaled(640, 480, Qt.AspectRatioMode.KeepAspectRatio))
+        now = time.perf_counter()
+        self.render_fps = 0.9 * self.render_fps + 0.1 * (1.0 / max(now - self.last_render, 1e-6))
+        self.last_render = now
+
+    def on_faces(self, faces):
+        """ผลตรวจจับใบหน้าจาก FrameProcessor (เรียกตามรอบการตรวจจับ ไม่ใช่ทุกเฟรม)
+        ส่งภาพไปจดจำเฉพาะ track ที่ยังไม่รู้จัก โดยใช้เฟรมที่ดีที่สุดของคนนั้น"""
+        if self.is_manual_mode: return
+        face_found = len(faces) > 0
+
+        if face_found and not self.net_worker.is_busy:
+            item = self.processor.tracker.next_to_send(time.time())
+            if item:
+                # Server ล่มก็ยังถ่ายเก็บไว้ในคิว ไม่ต้องให้พนักงานไปลงมือ
+                self.pending_track, frame = item
+                self.lbl_action.setText("⏳ กำลังตรวจสอบ..." if self.server_online else "📥 กำลังบันทึกไว้ในเครื่อง...")
+                self.net_worker.request_scan(frame, offline=not self.server_online)
+                self.last_scan_time = time.time()
+        elif not face_found:
+            self.lbl_action.setText("กรุณามองกล้อง...")
+            if (time.time() - getattr(self, 'last_scan_time', 0)) > 5.0:
+                self.greeted_names.clear()
 
     def on_scan_result(self, data):
+        if self.pending_track is not None:
+            self.processor.tracker.set_result(self.pending_track, data, time.time())
+            self.pending_track = None
         if data['status'] == 'OK':
-            name = data['name']
-            self.display_name = name
-            self.display_name_time = time.time()
-            
-            if name != self.last_greeted_name:
-                threading.Thread(target=play_greeting, args=(name,), daemon=True).start()
-                self.last_greeted_name = name
+            # ทุกคนที่จดจำได้ในภาพเดียวกัน (ผลแบบเก่าไม่มี faces ใช้ name อย่างเดียว)
+            names = [f['name'] for f in data.get('faces', []) if f['status'] == 'OK'] or [data['name']]
+            new_names = [n for n in names if n not in self.greeted_names]
+            if new_names:
+                # ทักทีละคนตามลำดับใน Thread เดียว (play_greeting รอเสียงก่อนหน้าจบเอง)
+                threading.Thread(target=lambda: [play_greeting(n) for n in new_names], daemon=True).start()
+                self.greeted_names.update(new_names)
             else:
                 winsound.Beep(2000, 100) 
 
-            self.lbl_action.setText(f"✅ ยินดีต้อนรับ: {name}")
+            self.lbl_action.setText(f"✅ ยินดีต้อนรับ: {', '.join(names)}")
             self.lbl_action.setStyleSheet("font-size: 24px; font-weight: bold; color: green; margin-top: 10px;")
             
             now = datetime.now()
             thai_datetime = f"{now.day:02}/{now.month:02}/{now.year+543} {now.strftime('%H:%M:%S')}"
-            self.table.insertRow(0)
-            self.table.setItem(0, 0, QTableWidgetItem(name))
-            self.table.setItem(0, 1, QTableWidgetItem(thai_datetime))
+            # ผลจาก cache ของ Server (ภาพเดิม) ไม่ได้บันทึกเวลาใหม่ ไม่เพิ่มแถวในตาราง
+            for name in ([] if data.get('cached') else names):
+                self.table.insertRow(0)
+                self.table.setItem(0, 0, QTableWidgetItem(name))
+                self.table.setItem(0, 1, QTableWidgetItem(thai_datetime))
+        elif data['status'] == 'QUEUED':
+            self.queue_count += 1
+            winsound.Beep(1500, 150)
+            self.lbl_action.setText("📥 บันทึกภาพไว้แล้ว จะส่งเมื่อ Server กลับมา")
+            self.lbl_action.setStyleSheet("font-size: 24px; font-weight: bold; color: #d97706; margin-top: 10px;")
         else:
             self.lbl_action.setText("❌ ไม่พบข้อมูล / กรุณาลองใหม่")
             self.lbl_action.setStyleSheet("font-size: 24px; font-weight: bold; color: red; margin-top: 10px;")
@@ -0,0 +1,142 @@
+"""ตรวจหาพนักงานที่ลงทะเบียนซ้ำ (คนเดียวกันหลายรหัส) จาก embedding ในฐานข้อมูล
+
+ใช้งาน:
+    python dedupe.py
+    python dedupe.py --threshold 0.25 --block 4096 --csv duplicates.csv
+
+เทียบทุกคู่ด้วย cosine distance ทีละ block x block (RAM ~ block² x 4 ไบต์ ไม่สร้างเมทริกซ์ N x N)
+คู่ที่ระยะต่ำกว่า threshold ถูกรวมเป็นกลุ่ม (A~B และ B~C -> A, B, C อยู่กลุ่มเดียวกัน)
+"""
+import os
+import csv
+import json
+import time
+import sqlite3
+import argparse
+from dotenv import load_dotenv
+from face_engine import LazyModule
+
+np = LazyModule("numpy")
+
+load_dotenv()
+DB_FILE = os.getenv("DB_FILE", "attendance.db")
+# ค่าเริ่มต้น = THRESHOLD ที่ใช้สแกน (สองรหัสที่ใกล้กันกว่านี้ สแกนแล้วอาจบันทึกผิดคน)
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", os.getenv("THRESHOLD", 0.3)))
+DUPLICATE_BLOCK = int(os.getenv("DUPLICATE_BLOCK", 2048))
+MAX_PAIRS = 100000  # เก็บรายละเอียดคู่ไม่เกินนี้ (threshold หลวมเกินไปคู่จะเยอะมาก แต่ยังรวมกลุ่มได้ครบ)
+
+def normalize(embeddings):
+    matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1) if len(embeddings) else np.zeros((0, 0), np.float32)
+    if len(matrix): matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-10
+    return matrix
+
+def similar_pairs(matrix, threshold=DUPLICATE_THRESHOLD, block=DUPLICATE_BLOCK, progress=None):
+    """yield (i, j, distance) ทุกคู่ i < j ที่ cosine distance < threshold (matrix ต้อง normalize แล้ว)
+    progress(done, total) ถูกเรียกหลังคำนวณเสร็จแต่ละ block"""
+    n = len(matrix)
+    starts = range(0, n, block)
+    total, done = len(starts) * (len(starts) + 1) // 2, 0
+    for i in starts:
+        rows = matrix[i:i + block]
+        for j in range(i, n, block):
+            dist = 1.0 - rows @ matrix[j:j + block].T
+            r, c = np.nonzero(dist < threshold)
+            if i == j:
+                keep = r < c  # block ทแยง: เอาเฉพาะสามเหลี่ยมบน (ไม่เอาคู่กับตัวเอง/คู่กลับด้าน)
+                r, c = r[keep], c[keep]
+            for a, b in zip(r.tolist(), c.tolist()):
+                yield i + a, j + b, float(dist[a, b])
+            done += 1
+            if progress: progress(done, total)
+
+def matches_against(queries, matrix, threshold=DUPLICATE_THRESHOLD, block=DUPLICATE_BLOCK):
+    """yield (qi, gi, distance) ทุกคู่ระหว่าง queries กับ matrix ที่ cosine distance < threshold (normalize แล้วทั้งคู่)"""
+    if not len(queries) or not len(matrix) or queries.shape[1] != matrix.shape[1]: return
+    for i in range(0, len(queries), block):
+        dist = 1.0 - queries[i:i + block] @ matrix.T
+        r, c = np.nonzero(dist < threshold)
+        for a, b in zip(r.tolist(), c.tolist()):
+            yield i + a, b, float(dist[a, b])
+
+def find_duplicates(matrix, ids, names, threshold=DUPLICATE_THRESHOLD, block=DUPLICATE_BLOCK, progress=None):
+    """รวมคู่ที่ใกล้กันเป็นกลุ่ม (union-find) คืน list กลุ่ม เรียงกลุ่มที่ใกล้กันที่สุดก่อน
+    [{"members": [{"employee_id", "name"}], "min_distance", "pairs": [{"a", "b", "distance"}]}]"""
+    parent = {}
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]  # path halving
+            x = parent[x]
+        return x
+    pairs = []
+    for i, j, d in similar_pairs(matrix, threshold, block, progress):
+        parent.setdefault(i, i)
+        parent.setdefault(j, j)
+        ri, rj = find(i), find(j)
+        if ri != rj: parent[max(ri, rj)] = min(ri, rj)
+        if len(pairs) < MAX_PAIRS: pairs.append((i, j, d))
+
+    groups = {}
+    for x in parent:
+        groups.setdefault(find(x), set()).add(x)
+    by_root = {root: [] for root in groups}
+    for i, j, d in pairs:
+        by_root[find(i)].append({"a": ids[i], "b": ids[j], "distance": round(d, 4)})
+    clusters = []
+    for root, members in groups.items():
+        found = sorted(by_root[root], key=lambda p: p["distance"])
+        clusters.append({"members": [{"employee_id": ids[m], "name": names[m]} for m in sorted(members)],
+                         "min_distance": found[0]["distance"] if found else None, "pairs": found[:50]})
+    return sorted(clusters, key=lambda c: (c["min_distance"] is None, c["min_distance"]))
+
+def nearest(matrix, emb, threshold=DUPLICATE_THRESHOLD, limit=5):
+    """คนในฐานข้อมูลที่ใกล้กับ emb ต่ำกว่า threshold คืน [(index, distance)] ใกล้สุดก่อน (ใช้ตรวจก่อนลงทะเบียน)"""
+    if matrix is None or not len(matrix): return []
+    q = np.asarray(emb, dtype=np.float32).reshape(-1)
+    if q.shape[0] != matrix.shape[1]: return []
+    dist = 1.0 - matrix @ (q / (np.linalg.norm(q) + 1e-10))
+    idx = np.nonzero(dist < threshold)[0]
+    idx = idx[np.argsort(dist[idx])][:limit]
+    return [(int(i), float(dist[i])) for i in idx]
+
+def load_gallery(db_file=DB_FILE, model_name=None):
+    """embedding ของโมเดลที่ใช้อยู่จากฐานข้อมูล คืน (matrix ที่ normalize แล้ว, ids, names)"""
+    from bulk_import import active_model
+    model_name = model_name or active_model(db_file)
+    conn = sqlite3.connect(db_file)
+    rows = conn.execute("SELECT employee_id, name, embedding FROM employees WHERE embedding IS NOT NULL "
+                        "AND (embedding_model IS NULL OR embedding_model = ?)", (model_name,)).fetchall()
+    conn.close()
+    embeddings, ids, names = [], [], []
+    for emp_id, name, emb in rows:
+        try:
+            embeddings.append(json.loads(emb))
+            ids.append(emp_id)
+            names.append(name)
+        except ValueError:
+            pass
+    return normalize(embeddings), ids, names
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ตรวจหาพนักงานที่ลงทะเบียนซ้ำ (ใบหน้าเดียวกันหลายรหัส)")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--threshold", type=float, default=DUPLICATE_THRESHOLD, help="cosine distance ที่ถือว่าเป็นคนเดียวกัน")
+    parser.add_argument("--block", type=int, default=DUPLICATE_BLOCK, help="ขนาด block (RAM ~ block² x 4 ไบต์)")
+    parser.add_argument("--csv", help="บันทึกรายการคู่ที่สงสัยลงไฟล์ CSV")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    matrix, ids, names = load_gallery(args.db)
+    print(f">>> 🔎 ตรวจ {len(ids)} ใบหน้า (threshold {args.threshold}, block {args.block})")
+    def show(done, total):
+        print(f"\r    block {done}/{total}", end="", flush=True)
+    clusters = find_duplicates(matrix, ids, names, args.threshold, args.block, show)
+    print(f"\n>>> พบ {len(clusters)} กลุ่มที่สงสัยว่าซ้ำ ({time.time() - t0:.1f} วินาที)")
+    for c in clusters:
+        print(f"    [{c['min_distance']}] " + ", ".join(f"{m['employee_id']} {m['name']}" for m in c["members"]))
+    if args.csv:
+        with open(args.csv, "w", encoding="utf-8-sig", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=["group", "a", "b", "distance"])
+            w.writeheader()
+            for n, c in enumerate(clusters, 1):
+                w.writerows({"group": n, **p} for p in c["pairs"])
+        print(f">>> ✅ บันทึก {args.csv}")
@@ -0,0 +1,321 @@
+import os
+import abc
+import json
+import hashlib
+import threading
+import importlib
+from functools import lru_cache
+from importlib import metadata
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+# --- CONFIG LOADING ---
+load_dotenv()
+MODEL_NAME = os.getenv("MODEL_NAME", "Facenet512")
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", 0)) or os.cpu_count() or 1
+EMBED_ENGINE = os.getenv("EMBED_ENGINE", "deepface").lower()  # deepface | onnx
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", "models/facenet512_int8.onnx")
+ONNX_MODEL_NAME = os.getenv("ONNX_MODEL_NAME", "Facenet512")  # โมเดลที่ export เป็นไฟล์ ONNX
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", 0))  # intra-op threads (0 = ให้ ONNX Runtime เลือกเอง)
+# ขนาด embedding ของแต่ละโมเดล (ใช้ตรวจ embedding ที่ Kiosk ส่งมา ตอนยังไม่มีใบหน้าในฐานข้อมูลให้เทียบขนาด)
+EMBEDDING_DIMS = {"VGG-Face": 4096, "Facenet": 128, "Facenet512": 512, "OpenFace": 128, "DeepFace": 4096,
+                  "DeepID": 160, "ArcFace": 512, "Dlib": 128, "SFace": 128, "GhostFaceNet": 512}
+
+# --- LAZY IMPORT (ส่วนที่ไม่ได้จดจำใบหน้า เช่น หน้า Admin/รายงาน ไม่ต้องรอโหลด library หนัก) ---
+class LazyModule:
+    """ใช้แทน module ที่ import ช้า (cv2, numpy, psutil ...) จะ import จริงตอนเรียกใช้ครั้งแรก
+    เช่น cv2 = LazyModule("cv2") แล้วใช้ cv2.imread(...) ได้ตามปกติ"""
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def __getattr__(self, attr):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__dict__["_name"])
+            self.__dict__["_module"] = module
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<LazyModule {self.__dict__['_name']}{' (loaded)' if self.__dict__['_module'] else ''}>"
+
+# --- ENGINES (แปลงใบหน้าเป็น embedding ได้หลายแบบ ผลลัพธ์รูปแบบเดียวกับ DeepFace.represent) ---
+class EmbeddingEngine(abc.ABC):
+    """represent(img, detect=True) คืน [{"embedding": [...], "facial_area": {"x","y","w","h"}}, ...] 1 รายการต่อใบหน้า
+    img เป็น path หรือภาพ BGR (numpy) ถ้า detect=False จะถือว่าทั้งภาพคือใบหน้า (ภาพที่ crop มาแล้ว)"""
+    name = "base"
+
+    def __init__(self, model_name=MODEL_NAME):
+        self.model_name = model_name
+
+    @property
+    @abc.abstractmethod
+    def signature(self):
+        """ใช้ตรวจว่า embedding จากเครื่องอื่นเทียบกับของเครื่องนี้ได้ (โมเดล/เวอร์ชันต่างกันเทียบกันไม่ได้)"""
+
+    def load(self):
+        pass
+
+    @abc.abstractmethod
+    def represent(self, img, detect=True):
+        """แปลงทุกใบหน้าในภาพเป็น embedding"""
+
+class DeepFaceEngine(EmbeddingEngine):
+    name = "deepface"
+
+    @property
+    def signature(self):
+        return f"{self.model_name}/deepface-{_package_version('deepface')}"
+
+    def load(self):
+        from deepface import DeepFace
+        DeepFace.build_model(self.model_name)
+
+    def represent(self, img, detect=True):
+        from deepface import DeepFace
+        return DeepFace.represent(img_path=img, model_name=self.model_name, enforce_detection=False,
+                                  detector_backend="opencv" if detect else "skip")
+
+class OnnxEngine(EmbeddingEngine):
+    """Facenet512 ที่ export เป็น ONNX (fp32 หรือ int8) รันด้วย ONNX Runtime CPU ไม่ต้องโหลด TensorFlow
+    ตรวจจับ/จัดแนว/ย่อใบหน้าตามขั้นตอนเดียวกับ DeepFace (detector_backend="opencv") แล้วส่งทุกใบหน้าเข้าโมเดลเป็น batch เดียว"""
+    name = "onnx"
+
+    def __init__(self, model_name=ONNX_MODEL_NAME, model_path=ONNX_MODEL_PATH, threads=ONNX_THREADS):
+        super().__init__(model_name)
+        self.model_path = model_path
+        self.threads = threads
+        self.session = None
+        self.lock = threading.Lock()
+
+    @property
+    def signature(self):
+        return f"{self.model_name}/onnx-{os.path.splitext(os.path.basename(self.model_path))[0]}"
+
+    def load(self):
+        with self.lock:
+            if self.session is not None: return
+            import cv2
+            import onnxruntime as ort
+            opts = ort.SessionOptions()
+            if self.threads: opts.intra_op_num_threads = self.threads
+            session = ort.InferenceSession(self.model_path, sess_options=opts, providers=["CPUExecutionProvider"])
+            inp = session.get_inputs()[0]
+            self.input_name = inp.name
+            # Keras export = NHWC (None, 160, 160, 3) / บางไฟล์เป็น NCHW (None, 3, 160, 160)
+            self.channels_first = inp.shape[1] == 3
+            size = inp.shape[2] if self.channels_first else inp.shape[1]
+            self.size = size if isinstance(size, int) else 160
+            self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+            self.eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_eye.xml")
+            self.session = session
+
+    def preprocess(self, img, detect=True):
+        """คืน (กรอบใบหน้า [(x, y, w, h), ...], batch float32 พร้อมส่งเข้าโมเดล)"""
+        import cv2
+        import numpy as np
+        self.load()
+        if isinstance(img, str): img = cv2.imread(img)
+        if img is None: return [], None
+        h, w = img.shape[:2]
+        boxes, faces = [], []
+        if detect:
+            # DeepFace (align=True) เติมขอบดำครึ่งภาพทุกด้านก่อนตรวจจับ ผลตรวจจับจึงไม่เท่ากับตรวจบนภาพเดิม
+            by, bx = int(0.5 * h), int(0.5 * w)
+            padded = cv2.copyMakeBorder(img, by, by, bx, bx, cv2.BORDER_CONSTANT, value=[0, 0, 0])
+            found, _, _ = self.face_cascade.detectMultiScale3(padded, 1.1, 10, outputRejectLevels=True)
+            for x, y, bw, bh in (tuple(int(v) for v in b) for b in found):
+                face = _align_face(padded, (x, y, bw, bh), _find_eyes(padded[y:y+bh, x:x+bw], self.eye_cascade))
+                if face.shape[0] == 0 or face.shape[1] == 0: continue
+                x, y = max(0, x - bx), max(0, y - by)
+                boxes.append((x, y, min(w - x - 1, bw), min(h - y - 1, bh)))
+                faces.append(_resize_pad(face / 255.0, self.size))
+            if not faces:  # เหมือน enforce_detection=False ของ DeepFace (กรอบถูกตัด 1 px แบบเดียวกับกรอบที่ตรวจเจอ)
+                boxes, faces = [(0, 0, w - 1, h - 1)], [_resize_pad(img / 255.0, self.size)]
+        else:  # detector_backend="skip" ย่อภาพ uint8 ก่อนค่อยหาร 255
+            boxes, faces = [(0, 0, w, h)], [_resize_pad(img, self.size) / 255.0]
+        # DeepFace กลับสีสองครั้ง (extract_faces BGR->RGB แล้ว represent กลับอีกรอบ) โมเดลจึงได้ภาพ BGR 0..1
+        batch = np.stack(faces).astype(np.float32)
+        if self.channels_first: batch = batch.transpose(0, 3, 1, 2)
+        return boxes, np.ascontiguousarray(batch)
+
+    def represent(self, img, detect=True):
+        boxes, batch = self.preprocess(img, detect)
+        if batch is None: return []
+        embs = self.session.run(None, {self.input_name: batch})[0]
+        return [{"embedding": e.tolist(), "facial_area": {"x": x, "y": y, "w": bw, "h": bh}}
+                for e, (x, y, bw, bh) in zip(embs, boxes)]
+
+# --- PREPROCESSING แบบ DeepFace (opencv detector + align=True + resize_image) ให้ ONNX ได้ภาพเข้าโมเดลแบบเดียวกัน ---
+def _find_eyes(face, eye_cascade):
+    """ตาซ้าย/ขวา (จุดกลาง ในพิกัดของภาพใบหน้า) จากตา 2 อันที่ใหญ่ที่สุด ไม่เจอคืน (None, None)"""
+    import cv2
+    if face.shape[0] == 0 or face.shape[1] == 0: return None, None
+    eyes = sorted(eye_cascade.detectMultiScale(cv2.cvtColor(face, cv2.COLOR_BGR2GRAY), 1.1, 10),
+                  key=lambda e: abs(e[2] * e[3]), reverse=True)
+    if len(eyes) < 2: return None, None
+    right, left = sorted(eyes[:2], key=lambda e: e[0])  # ตาขวาของคนอยู่ซ้ายในภาพ
+    center = lambda e: (int(e[0] + e[2] / 2), int(e[1] + e[3] / 2))
+    return center(left), center(right)
+
+def _align_face(img, box, eyes):
+    """หมุนภาพรอบใบหน้าให้ตาอยู่แนวนอนแล้ว crop กรอบเดิม (extract_sub_image + align_img_wrt_eyes + project_facial_area)"""
+    import cv2
+    import numpy as np
+    x, y, w, h = box
+    left, right = eyes
+    if left is None or right is None: return img[y:y+h, x:x+w]
+    # ขยายกรอบออกไปครึ่งหนึ่งทุกด้าน (ส่วนที่เลยขอบภาพเติมดำ) กันมุมภาพหายตอนหมุน
+    rx, ry = int(0.5 * w), int(0.5 * h)
+    sub = np.zeros((h + 2 * ry, w + 2 * rx, img.shape[2]), dtype=img.dtype)
+    region = img[max(0, y - ry):min(img.shape[0], y + h + ry), max(0, x - rx):min(img.shape[1], x + w + rx)]
+    sx, sy = max(0, rx - x), max(0, ry - y)
+    sub[sy:sy + region.shape[0], sx:sx + region.shape[1]] = region
+    angle = float(np.degrees(np.arctan2(left[1] - right[1], left[0] - right[0])))
+    sh, sw = sub.shape[:2]
+    m = cv2.getRotationMatrix2D((sw // 2, sh // 2), angle, 1.0)
+    sub = cv2.warpAffine(sub, m, (sw, sh), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0))
+    # ตำแหน่งกรอบใบหน้าหลังหมุน
+    direction, rad = (1 if angle >= 0 else -1), (abs(angle) % 360) * np.pi / 180
+    if rad == 0: return sub[ry:ry + h, rx:rx + w]
+    cx, cy = rx + w / 2 - sw / 2, ry + h / 2 - sh / 2
+    nx = cx * np.cos(rad) + cy * direction * np.sin(rad) + sw / 2
+    ny = -cx * direction * np.sin(rad) + cy * np.cos(rad) + sh / 2
+    x1, y1 = max(int(nx - w / 2), 0), max(int(ny - h / 2), 0)
+    x2, y2 = min(int(nx + w / 2), sw), min(int(ny + h / 2), sh)
+    return sub[y1:y2, x1:x2]
+
+def _resize_pad(face, size):
+    """ย่อโดยคงสัดส่วนให้พอดี size x size แล้วเติมขอบดำให้อยู่กลางภาพ (แทนการยืดภาพ)"""
+    import cv2
+    import numpy as np
+    factor = min(size / face.shape[0], size / face.shape[1])
+    face = cv2.resize(face, (int(face.shape[1] * factor), int(face.shape[0] * factor)))
+    dy, dx = size - face.shape[0], size - face.shape[1]
+    face = np.pad(face, ((dy // 2, dy - dy // 2), (dx // 2, dx - dx // 2), (0, 0)), "constant")
+    if face.shape[:2] != (size, size): face = cv2.resize(face, (size, size))
+    return face
+
+@lru_cache(maxsize=None)
+def _package_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+_engines = {}
+_engines_lock = threading.Lock()
+_gallery_signatures = {}  # model_name -> signature ของ embedding ในฐานข้อมูล
+
+def engine_kind(signature):
+    """'Facenet512/deepface-0.0.93' -> 'Facenet512/deepface' (ไม่สนเวอร์ชัน/ไฟล์ export ที่ต่างกันเล็กน้อย)"""
+    model, _, engine = signature.partition("/")
+    return f"{model}/{engine.split('-', 1)[0]}"
+
+def set_gallery_signature(signature):
+    """บอกว่า embedding ในฐานข้อมูลของโมเดลนี้สร้างด้วย Engine ไหน (ใช้ตัดสินใน get_engine)"""
+    if not signature: return
+    model = signature.partition("/")[0]
+    with _engines_lock:
+        if _gallery_signatures.get(model) != signature:
+            _gallery_signatures[model] = signature
+            _engines.pop(model, None)
+
+def parity_path(model_path):
+    """ไฟล์ผลตรวจ parity ที่ bench_engine.py compare เขียนไว้ข้างไฟล์ .onnx"""
+    return f"{model_path}.parity.json"
+
+@lru_cache(maxsize=8)
+def file_sha256(path, mtime_ns, size):
+    """sha256 ของไฟล์ (mtime/size อยู่ใน key ของ cache ไฟล์ที่ถูกแทนที่จึงถูกคำนวณใหม่)"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""): h.update(chunk)
+    return h.hexdigest()
+
+def parity_record(model_path, reference):
+    """ผลตรวจ parity ของไฟล์ ONNX นี้เทียบกับ Engine ที่สร้าง gallery (reference) คืน None ถ้าไม่มี/ไม่ผ่าน/ไฟล์ถูกเปลี่ยน"""
+    try:
+        with open(parity_path(model_path), encoding="utf-8") as f: record = json.load(f)
+        st = os.stat(model_path)
+        digest = file_sha256(model_path, st.st_mtime_ns, st.st_size)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(record, dict) or not record.get("passed") or record.get("sha256") != digest: return None
+    if engine_kind(str(record.get("reference", ""))) != engine_kind(reference): return None
+    return record
+
+def get_engine(model_name=MODEL_NAME):
+    """Engine ของโมเดลนี้ (สร้างครั้งเดียวต่อ process)
+    EMBED_ENGINE=onnx ใช้ ONNX เฉพาะโมเดลที่มีไฟล์ export (ONNX_MODEL_NAME) โมเดลอื่นยังใช้ DeepFace
+    ถ้า gallery ของโมเดลนี้สร้างด้วย Engine อื่นจะไม่ใช้ ONNX (embedding คนละ Engine เทียบกันตรงๆ ไม่ได้)
+    จนกว่า bench_engine.py compare จะตรวจไฟล์ .onnx นี้ผ่าน (cosine + การตัดสินตาม THRESHOLD ตรงกับ DeepFace)"""
+    with _engines_lock:
+        engine = _engines.get(model_name)
+        if engine is None:
+            engine = DeepFaceEngine(model_name)
+            if EMBED_ENGINE == "onnx" and model_name == ONNX_MODEL_NAME:
+                onnx = OnnxEngine(model_name, ONNX_MODEL_PATH)
+                gallery = _gallery_signatures.get(model_name)
+                if gallery and engine_kind(gallery) != engine_kind(onnx.signature) \
+                        and not parity_record(onnx.model_path, gallery):
+                    print(f">>> ⚠️ ไม่ใช้ EMBED_ENGINE=onnx: ใบหน้าในฐานข้อมูลสร้างด้วย {gallery} แต่ {onnx.model_path} "
+                          f"ยังไม่ผ่าน bench_engine.py compare (ไม่มี {parity_path(onnx.model_path)}) ใช้ DeepFace แทน")
+                else:
+                    engine = onnx
+            _engines[model_name] = engine
+        return engine
+
+# --- MODEL SIGNATURE (embedding จากคนละโมเดล/คนละเวอร์ชันเทียบกันไม่ได้) ---
+def model_signature(model_name=MODEL_NAME):
+    """เช่น 'Facenet512/deepface-0.0.93' ใช้ตรวจว่า embedding ที่ Kiosk ส่งมาเทียบกับฐานข้อมูลได้"""
+    return get_engine(model_name).signature
+
+def load_model(model_name=MODEL_NAME):
+    """โหลดโมเดลเข้าหน่วยความจำล่วงหน้า (ครั้งแรกใช้เวลาหลายวินาที)"""
+    get_engine(model_name).load()
+
+# --- SINGLE IMAGE ---
+def represent(img, model_name=MODEL_NAME):
+    """ทุกใบหน้าในภาพ (path หรือ BGR numpy) รูปแบบเดียวกับ DeepFace.represent"""
+    return get_engine(model_name).represent(img)
+
+def represent_file(img_path, model_name=MODEL_NAME):
+    """แปลงรูป 1 ไฟล์เป็น embedding (ใบหน้าแรกที่เจอ) คืนค่า list หรือ None"""
+    objs = represent(img_path, model_name)
+    return objs[0]["embedding"] if objs else None
+
+def represent_frame(frame, model_name=MODEL_NAME):
+    """เหมือน represent_file แต่รับภาพ BGR (numpy) ตรงๆ"""
+    return represent_file(frame, model_name)
+
+def represent_faces(frame, model_name=MODEL_NAME):
+    """ทุกใบหน้าในภาพ BGR เป็น [{"embedding": [...], "box": [x, y, w, h]}] ใช้ตอน Kiosk คำนวณ embedding เอง (โหมด Edge)"""
+    return [{"embedding": o["embedding"], "box": [int(o["facial_area"][k]) for k in ("x", "y", "w", "h")]}
+            for o in represent(frame, model_name)]
+
+# --- PROCESS POOL (ใช้ทุก Core ตอนประมวลผลรูปจำนวนมาก) ---
+def _pool_init(model_name, gallery_signature=None):
+    """โหลดโมเดลครั้งเดียวต่อ process ไม่ต้องโหลดใหม่ทุกรูป (ใช้ Engine เดียวกับ process หลัก)"""
+    set_gallery_signature(gallery_signature)
+    load_model(model_name)
+
+def _pool_task(key, img_path, model_name):
+    try:
+        emb = represent_file(img_path, model_name)
+        if emb is None: return key, None, "ไม่พบใบหน้าในรูป"
+        return key, emb, None
+    except Exception as e:
+        return key, None, str(e)
+
+def embed_files_parallel(items, model_name=MODEL_NAME, workers=None):
+    """items = [(key, img_path), ...] คืนค่า (key, embedding, error) ทีละรายการตามลำดับที่เสร็จ"""
+    items = list(items)
+    if not items: return
+    workers = min(workers or EMBED_WORKERS, len(items))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_pool_init,
+                             initargs=(model_name, _gallery_signatures.get(model_name))) as ex:
+        futures = [ex.submit(_pool_task, key, path, model_name) for key, path in items]
+        for f in as_completed(futures):
+            yield f.result()
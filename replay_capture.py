@@ -0,0 +1,134 @@
+"""เล่นซ้ำคำขอสแกนที่บันทึกไว้ (capture.py) กับ Server แล้วสรุปเวลาตอบและผลที่ต่างจากเดิม
+
+ใช้งาน:
+    python replay_capture.py captures/scan_capture.jsonl                 # ความเร็วเท่าของจริง (1x)
+    python replay_capture.py captures/scan_capture.jsonl.1 captures/scan_capture.jsonl --speed 4
+    python replay_capture.py captures/scan_capture.jsonl --speed 0 --concurrency 16   # เร็วที่สุด
+    python replay_capture.py cap.jsonl --save onnx.jsonl --baseline deepface.jsonl     # เทียบกับผลการเล่นซ้ำรอบก่อน
+
+- ส่ง X-Forwarded-For / X-Kiosk-Id ตามของจริง (คิวต่อ Kiosk และ cache ผลสแกนทำงานเหมือนตอนบันทึก)
+- ค่าเริ่มต้นเทียบผลกับผลที่ Server ตอบตอนบันทึก (--baseline เทียบกับไฟล์จาก --save ของรอบก่อนแทน)
+- ควรรันกับ Server ที่ใช้ฐานข้อมูลสำเนา (คำขอที่จดจำได้จะถูกบันทึกเวลาจริง)
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from capture import read_capture
+
+load_dotenv()
+SERVER_URL = os.getenv("SERVER_URL", "http://localhost:9876")
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)] if values else 0.0
+
+def outcome(result):
+    """ผลที่ใช้เทียบ: สถานะ + รายชื่อคนที่จดจำได้ (ไม่สนเวลา/กรอบหน้า/cached)"""
+    names = sorted(f["name"] for f in result.get("faces", []) if f.get("status") == "OK")
+    if not names and result.get("status") == "OK": names = [result.get("name")]
+    return f"{result.get('status')} {','.join(names)}".strip()
+
+def send(session, server, rec):
+    headers = {"X-Forwarded-For": rec["client_ip"]}
+    if rec.get("kiosk_id"): headers["X-Kiosk-Id"] = rec["kiosk_id"]
+    t0 = time.perf_counter()
+    try:
+        r = session.post(f"{server}{rec['endpoint']}", data=rec.get("form") or {}, headers=headers, timeout=60,
+                         files={"file": ("image.jpg", rec["image"], "image/jpeg")})
+        result = r.json() if r.status_code == 200 else {"status": "BUSY" if r.status_code in (429, 503) else f"HTTP {r.status_code}"}
+    except (requests.RequestException, ValueError) as e:
+        result = {"status": "ERROR", "message": str(e)}
+    return (time.perf_counter() - t0) * 1000, result
+
+def replay(records, server, speed, concurrency, progress=None):
+    """ส่งตามจังหวะเวลาที่บันทึกไว้หาร speed (0 = ส่งต่อกันไม่รอ) คืน [(record, ms, result, ส่งช้ากว่ากำหนด ms)]"""
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+    results, lock = [None] * len(records), threading.Lock()
+    done = [0]
+    def one(i, due):
+        lag = max(time.perf_counter() - due, 0.0) * 1000 if speed > 0 else 0.0
+        ms, result = send(session, server, records[i])
+        results[i] = (records[i], ms, result, lag)
+        with lock:
+            done[0] += 1
+            if progress: progress(done[0], len(records))
+
+    t0, first = time.perf_counter(), records[0]["t"]
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        for i, rec in enumerate(records):
+            due = t0 + (rec["t"] - first) / speed if speed > 0 else t0
+            if due > time.perf_counter(): time.sleep(due - time.perf_counter())
+            ex.submit(one, i, due)
+    return results, time.perf_counter() - t0
+
+def summarize(results, wall, baseline):
+    print(f"\n>>> {len(results)} คำขอ ใน {wall:.1f} วินาที ({len(results) / max(wall, 1e-6):.2f} req/s)")
+    print(f"{'endpoint':<14}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'เดิม p95':>10}")
+    for endpoint in sorted({r[0]["endpoint"] for r in results}):
+        rows = [r for r in results if r[0]["endpoint"] == endpoint]
+        ms, old = [r[1] for r in rows], [r[0]["ms"] for r in rows]
+        print(f"{endpoint:<14}{len(rows):>6}{_pct(ms, 50):>9.1f}{_pct(ms, 95):>9.1f}{_pct(ms, 99):>9.1f}{max(ms):>9.1f}{_pct(old, 95):>10.1f}")
+    lags = [r[3] for r in results]
+    if any(lags): print(f">>> ส่งช้ากว่าจังหวะจริง p95 {_pct(lags, 95):.1f} ms (ถ้าสูง ให้เพิ่ม --concurrency)")
+
+    statuses = {}
+    for r in results: statuses[r[2].get("status")] = statuses.get(r[2].get("status"), 0) + 1
+    print(f">>> สถานะ: {statuses}")
+
+    diffs = []
+    for i, (rec, _, result, _) in enumerate(results):
+        before = baseline[i] if baseline is not None else outcome(rec["result"])
+        if before != outcome(result): diffs.append((rec, before, outcome(result)))
+    label = "รอบ --baseline" if baseline is not None else "ตอนบันทึก"
+    print(f">>> ผลต่างจาก{label} {len(diffs)}/{len(results)} คำขอ")
+    changes = {}
+    for _, before, after in diffs: changes[(before, after)] = changes.get((before, after), 0) + 1
+    for (before, after), n in sorted(changes.items(), key=lambda x: -x[1])[:20]:
+        print(f"    {n:>5} x  {before or '-'}  ->  {after or '-'}")
+    return diffs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="เล่นซ้ำคำขอสแกนที่บันทึกไว้ และเทียบเวลาตอบ/ผลลัพธ์")
+    parser.add_argument("captures", nargs="+", help="ไฟล์ capture (.jsonl) ใส่ได้หลายไฟล์")
+    parser.add_argument("--server", default=SERVER_URL)
+    parser.add_argument("--speed", type=float, default=1.0, help="ความเร็วเทียบของจริง (2 = เร็วขึ้น 2 เท่า, 0 = เร็วที่สุด)")
+    parser.add_argument("--concurrency", type=int, default=32, help="จำนวนคำขอที่ค้างได้พร้อมกันสูงสุด")
+    parser.add_argument("--endpoint", choices=["/scan", "/manual_scan"], help="เล่นซ้ำเฉพาะ endpoint นี้")
+    parser.add_argument("--limit", type=int, help="เล่นซ้ำเฉพาะ N คำขอแรก")
+    parser.add_argument("--save", help="บันทึกผลรอบนี้ (ใช้เป็น --baseline ของรอบถัดไป)")
+    parser.add_argument("--baseline", help="เทียบผลกับไฟล์จาก --save แทนผลตอนบันทึก")
+    args = parser.parse_args()
+
+    records = read_capture(args.captures)
+    if args.endpoint: records = [r for r in records if r["endpoint"] == args.endpoint]
+    if args.limit: records = records[:args.limit]
+    if not records:
+        print("❌ ไม่มีคำขอในไฟล์ capture")
+        sys.exit(1)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = [json.loads(line)["outcome"] for line in f]
+        if len(baseline) != len(records): parser.error("--baseline ต้องมาจากการเล่นซ้ำไฟล์และตัวเลือกชุดเดียวกัน")
+
+    span = records[-1]["t"] - records[0]["t"]
+    print(f">>> ▶️ เล่นซ้ำ {len(records)} คำขอ ({span:.0f} วินาทีของจริง) ความเร็ว {'สูงสุด' if args.speed <= 0 else f'{args.speed:g}x'} -> {args.server}")
+    def show(done, total):
+        print(f"\r    {done}/{total}", end="", flush=True)
+    results, wall = replay(records, args.server, args.speed, args.concurrency, show)
+    summarize(results, wall, baseline)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            for rec, ms, result, _ in results:
+                f.write(json.dumps({"t": rec["t"], "endpoint": rec["endpoint"], "ms": round(ms, 1),
+                                    "outcome": outcome(result), "result": result}, ensure_ascii=False) + "\n")
+        print(f">>> ✅ บันทึก {args.save}")
@@ -0,0 +1,133 @@
+"""คิวงานจดจำใบหน้าแบบมีลำดับความสำคัญ (ใช้ใน server_api)
+
+- จำกัดจำนวนงานที่รัน AI พร้อมกัน (workers) งานที่เกินจะรอคิว: manual > scan > enroll
+- จำกัดจำนวนงานค้างต่อ Kiosk (เครื่องเดียวส่งรัวๆ ไม่แย่งคิวเครื่องอื่น) -> 429
+- ถ้า p95 ของเวลาตอบ (รอคิว + ประมวลผล) ของงาน scan ช่วงหลังสุดเกิน SLO จะตัดงาน enroll และงาน scan ที่ต้องรอคิว -> 503
+  (เก็บเวลาแยกตามประเภทงาน งาน enroll/batch ที่ช้าโดยธรรมชาติไม่ทำให้ตัดงานสแกน)
+  ทั้งสองกรณีส่ง Retry-After (วินาที) ให้ Client ถอยไปส่งใหม่ ส่วนงาน manual ไม่ถูกตัดและไม่นับโควต้า
+
+ทุกเมธอดเรียกจาก event loop ของ FastAPI เท่านั้น (ไม่ต้องใช้ lock)
+"""
+import math
+import time
+import heapq
+import asyncio
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+
+PRIORITIES = ("manual", "scan", "enroll")  # เลขน้อย = สำคัญกว่า
+
+class Overloaded(Exception):
+    """ไม่รับงานนี้ตอนนี้ status_code = 429 (Kiosk ส่งเกินโควต้า) หรือ 503 (Server รับไม่ไหว)"""
+
+    def __init__(self, status_code, retry_after, reason):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+class RecognitionScheduler:
+    def __init__(self, workers=2, kiosk_limit=2, queue_max=50, slo_p95_ms=1500, window_sec=60):
+        self.workers = max(1, workers)
+        self.kiosk_limit = kiosk_limit    # 0 = ไม่จำกัด
+        self.queue_max = queue_max
+        self.slo_p95_ms = slo_p95_ms      # 0 = ไม่ตัดงานตาม SLO
+        self.window_sec = window_sec
+        self.busy = 0
+        self.waiting = []                 # heap ของ (priority, ลำดับที่มา, future)
+        self.order = itertools.count()
+        self.inflight = {}                # kiosk -> จำนวนงานที่รอ/กำลังทำ
+        self.samples = {p: deque() for p in PRIORITIES}  # (เวลาเสร็จ, ms) ของงานในช่วง window_sec ล่าสุด แยกตามประเภท
+        self.service_ms = {p: 0.0 for p in PRIORITIES}   # เวลาประมวลผลเฉลี่ย (ไม่รวมรอคิว) ใช้ประมาณ Retry-After
+        self.stats = {p: {"served": 0, "shed": 0} for p in PRIORITIES}
+
+    def p95_ms(self, priority="scan", now=None):
+        now = now or time.time()
+        samples = self.samples[priority]
+        while samples and now - samples[0][0] > self.window_sec:
+            samples.popleft()
+        if not samples: return 0.0
+        values = sorted(ms for _, ms in samples)
+        return values[min(int(len(values) * 0.95), len(values) - 1)]
+
+    def shedding(self):
+        """SLO ใช้กับงานสแกนสด (Kiosk รอผลอยู่) เท่านั้น"""
+        return self.slo_p95_ms > 0 and self.p95_ms("scan") > self.slo_p95_ms
+
+    def retry_after(self):
+        """ประมาณเวลาที่คิวปัจจุบันจะหมด (1-30 วินาที)"""
+        service = [self.service_ms[PRIORITIES[prio]] or 1000 for prio, _, fut in self.waiting if not fut.done()]
+        est = (sum(service) + (self.service_ms["scan"] or 1000)) / self.workers / 1000
+        return min(max(math.ceil(est), 1), 30)
+
+    def admit(self, priority, kiosk=None):
+        """ตรวจว่ารับงานได้ไหม (ไม่รับ -> Overloaded) ใช้ตรงๆ กับงานที่ไม่ได้รอคิว เช่น เริ่มงาน bulk import"""
+        if priority == "manual": return
+        try:
+            if kiosk and self.kiosk_limit and self.inflight.get(kiosk, 0) >= self.kiosk_limit:
+                raise Overloaded(429, self.retry_after(), "kiosk_limit")
+            if len(self.waiting) >= self.queue_max:
+                raise Overloaded(503, self.retry_after(), "queue_full")
+            if self.shedding() and (priority == "enroll" or self.busy >= self.workers):
+                raise Overloaded(503, self.retry_after(), "slo")
+        except Overloaded:
+            self.stats[priority]["shed"] += 1
+            raise
+
+    @asynccontextmanager
+    async def slot(self, priority, kiosk=None):
+        """async with scheduler.slot("scan", kiosk_id): ... ได้สิทธิ์รันงานหนัก 1 ช่อง"""
+        self.admit(priority, kiosk)
+        t0 = time.perf_counter()
+        if kiosk: self.inflight[kiosk] = self.inflight.get(kiosk, 0) + 1
+        try:
+            if self.busy < self.workers and not self.waiting:
+                self.busy += 1
+            else:
+                entry = (PRIORITIES.index(priority), next(self.order), asyncio.get_running_loop().create_future())
+                heapq.heappush(self.waiting, entry)
+                try:
+                    await entry[2]  # _release ส่งต่อช่องให้ (busy ไม่ลด)
+                except asyncio.CancelledError:
+                    if entry[2].done() and not entry[2].cancelled():
+                        self._release()  # ได้ช่องพอดีกับที่ Client ตัดการเชื่อมต่อ ส่งต่อให้คนถัดไป
+                    elif entry in self.waiting:
+                        self.waiting.remove(entry)
+                        heapq.heapify(self.waiting)
+                    raise
+            started = time.perf_counter()
+            try:
+                yield
+            finally:
+                self._release()
+                done = time.perf_counter()
+                service = (done - started) * 1000
+                avg = self.service_ms[priority]
+                self.service_ms[priority] = service if not avg else 0.9 * avg + 0.1 * service
+                self.samples[priority].append((time.time(), (done - t0) * 1000))
+                self.stats[priority]["served"] += 1
+        finally:
+            if kiosk:
+                self.inflight[kiosk] -= 1
+                if not self.inflight[kiosk]: del self.inflight[kiosk]
+
+    def _release(self):
+        while self.waiting:
+            fut = heapq.heappop(self.waiting)[2]
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.busy -= 1
+
+    def snapshot(self):
+        queued = {p: 0 for p in PRIORITIES}
+        for prio, _, fut in self.waiting:
+            if not fut.done(): queued[PRIORITIES[prio]] += 1
+        p95 = self.p95_ms("scan")
+        return {"workers": self.workers, "busy": self.busy, "queued": queued, "kiosks": len(self.inflight),
+                "p95_ms": round(p95, 1), "slo_p95_ms": self.slo_p95_ms,
+                "shedding": self.slo_p95_ms > 0 and p95 > self.slo_p95_ms,
+                "avg_service_ms": round(self.service_ms["scan"], 1), "retry_after": self.retry_after(),
+                "classes": {p: {**s, "p95_ms": round(self.p95_ms(p), 1), "avg_service_ms": round(self.service_ms[p], 1)}
+                            for p, s in self.stats.items()}}
@@ -1,30 +1,45 @@
-import uvicorn
 import shutil
 import os
 import sqlite3
-import cv2
-import numpy as np
 import threading
-import requests
 import json
-import psutil
 import time
+import struct
+import math
+import asyncio
 from fastapi import FastAPI, UploadFile, File, Form
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import FileResponse
-from deepface import DeepFace
+from fastapi.concurrency import run_in_threadpool
+from face_engine import (MODEL_NAME, EMBEDDING_DIMS, DeepFaceEngine, LazyModule, embed_files_parallel, model_signature,
+                         represent, represent_file, set_gallery_signature)
+import bulk_import
+import dedupe
+import archive
+from scheduler import Overloaded, RecognitionScheduler
+from capture import TrafficRecorder
 import secrets
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from fastapi import Request
-from fastapi.responses import HTMLResponse, JSONResponse
-from typing import Optional
+from fastapi import Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+from typing import Optional, List
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+# Library หนักโหลดเมื่อใช้ครั้งแรก (โหมด reports ไม่ต้องโหลดเลย)
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+psutil = LazyModule("psutil")
+requests = LazyModule("requests")
+
 # --- CONFIG LOADING ---
 load_dotenv()
+APP_MODE = os.getenv("APP_MODE", "full").lower()  # full | reports (เฉพาะหน้า Admin/รายงาน ไม่โหลดระบบจดจำใบหน้า)
+RECOGNITION_ENABLED = APP_MODE != "reports"
 DB_FILE = os.getenv("DB_FILE", "attendance.db")
 THRESHOLD = float(os.getenv("THRESHOLD", 0.3))
 ENABLE_TELEGRAM = os.getenv("ENABLE_TELEGRAM", "False").lower() == "true"
@@ -33,9 +48,41 @@ TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
 KEEP_IMAGE_DAYS = int(os.getenv("KEEP_IMAGE_DAYS", 60))
 SERVER_PORT = int(os.getenv("PORT", 9876))
 SERVER_HOST = os.getenv("HOST", "0.0.0.0")
+CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", 500))
+CLEANUP_BATCH_PAUSE = float(os.getenv("CLEANUP_BATCH_PAUSE", 0.2))
+THUMB_CACHE_MB = int(os.getenv("THUMB_CACHE_MB", 512))
+SCAN_CACHE_TTL = float(os.getenv("SCAN_CACHE_TTL", 2.0))    # วินาทีที่ใช้ผลเดิมได้ถ้าภาพแทบไม่เปลี่ยน (0 = ปิด)
+SCAN_CACHE_DIFF = float(os.getenv("SCAN_CACHE_DIFF", 8.0))  # ค่าต่างสูงสุดรายช่องของภาพย่อ 16x16 (0-255) ที่ยังถือว่าเป็นภาพเดิม
+SCAN_BATCH_MAX = int(os.getenv("SCAN_BATCH_MAX", 20))  # จำนวนภาพสูงสุดต่อคำขอ /scan/batch
+SCAN_BATCH_MAX_AGE_HOURS = float(os.getenv("SCAN_BATCH_MAX_AGE_HOURS", 72))  # ภาพย้อนหลังที่ถ่ายนานกว่านี้ไม่บันทึกเวลาให้
+DUPLICATE_THRESHOLD = os.getenv("DUPLICATE_THRESHOLD")  # ระยะที่ถือว่าหน้าซ้ำ (ไม่ตั้ง = ใช้ THRESHOLD ปัจจุบัน)
+SCHED_WORKERS = int(os.getenv("SCHED_WORKERS", 2))            # งาน AI ที่รันพร้อมกันได้ (ที่เหลือรอคิวตามลำดับความสำคัญ)
+SCHED_KIOSK_LIMIT = int(os.getenv("SCHED_KIOSK_LIMIT", 2))    # งานค้างสูงสุดต่อ Kiosk (0 = ไม่จำกัด)
+SCHED_QUEUE_MAX = int(os.getenv("SCHED_QUEUE_MAX", 50))       # คิวรอสูงสุด เกินนี้ตอบ 503
+SCHED_SLO_P95_MS = float(os.getenv("SCHED_SLO_P95_MS", 1500)) # p95 เวลาตอบที่ยอมรับได้ เกินแล้วเริ่มตัดงาน (0 = ปิด)
+SCHED_WINDOW_SEC = float(os.getenv("SCHED_WINDOW_SEC", 60))   # ช่วงเวลาที่ใช้คำนวณ p95
+# จำนวน process ของงานเบื้องหลัง (นำเข้า/Re-embed) เว้น Core ไว้ให้งานสแกนตาม SCHED_WORKERS
+BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", 0)) or max(1, (os.cpu_count() or 1) - SCHED_WORKERS)
+EMPLOYEE_PAGE_MAX = int(os.getenv("EMPLOYEE_PAGE_MAX", 500))  # จำนวนพนักงานสูงสุดต่อหน้าของ /api/employees
+ARCHIVE_LOGS = os.getenv("ARCHIVE_LOGS", "True").lower() == "true"  # Log ที่พ้นระยะเก็บ ย้ายไป archive/ แทนการลบทิ้ง
+REPORT_RANGE_MAX_DAYS = int(os.getenv("REPORT_RANGE_MAX_DAYS", 366))
+CAPTURE_ENABLED = os.getenv("CAPTURE_ENABLED", "False").lower() == "true"  # บันทึกคำขอ /scan, /manual_scan ไว้เล่นซ้ำ (replay_capture.py)
+CAPTURE_FILE = os.getenv("CAPTURE_FILE", "captures/scan_capture.jsonl")
+CAPTURE_SAMPLE = float(os.getenv("CAPTURE_SAMPLE", 1.0))    # สัดส่วนคำขอที่เก็บ (0-1)
+CAPTURE_MAX_MB = float(os.getenv("CAPTURE_MAX_MB", 200))    # พื้นที่สูงสุดของไฟล์ capture
 
 app = FastAPI()
 
+class ApiGZipMiddleware(GZipMiddleware):
+    """บีบอัดเฉพาะ JSON ของ /api/ (รูป JPEG บีบซ้ำแล้วไม่เล็กลง เสีย CPU เปล่า)"""
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith("/api/"):
+            await super().__call__(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+app.add_middleware(ApiGZipMiddleware, minimum_size=1024)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -46,6 +93,7 @@ app.add_middleware(
 
 os.makedirs("images", exist_ok=True)
 os.makedirs("attendance_images", exist_ok=True)
+os.makedirs("thumbnails", exist_ok=True)
 
 app.mount("/images", StaticFiles(directory="images"), name="images")
 app.mount("/attendance_images", StaticFiles(directory="attendance_images"), name="attendance_images")
@@ -54,6 +102,23 @@ app.mount("/attendance_images", StaticFiles(directory="attendance_images"), name
 known_embeddings = []
 known_ids = []
 known_names = []
+known_matrix = None  # embedding ที่ normalize แล้ว 1 แถวต่อคน (ใช้เทียบแบบเมทริกซ์ สร้างตอน load_faces)
+ACTIVE_MODEL = MODEL_NAME  # โมเดลของ embedding ชุดที่ใช้สแกนอยู่ (เปลี่ยนได้ด้วยงาน Re-embed)
+
+# Cache ผลสแกนล่าสุดต่อ Kiosk (ภาพซ้ำเดิม เช่น ทางเดินว่าง/คนยืนนิ่ง ไม่ต้องรัน AI ใหม่)
+scan_cache = {}
+scan_cache_lock = threading.Lock()
+scan_cache_stats = {"hits": 0, "misses": 0, "infer_ms": 0.0, "saved_ms": 0.0}
+
+# คิวงานจดจำใบหน้า: manual > scan > enroll (ลงทะเบียน/นำเข้า/ส่งย้อนหลัง)
+scheduler = RecognitionScheduler(SCHED_WORKERS, SCHED_KIOSK_LIMIT, SCHED_QUEUE_MAX, SCHED_SLO_P95_MS, SCHED_WINDOW_SEC)
+
+# บันทึกคำขอสแกนจริงไว้เล่นซ้ำตอนทดสอบประสิทธิภาพ (ปิดไว้ถ้าไม่ได้ตั้งค่า)
+recorder = TrafficRecorder(CAPTURE_FILE, CAPTURE_ENABLED, CAPTURE_SAMPLE, CAPTURE_MAX_MB)
+
+# สถานะงานลบข้อมูลเก่า (ให้หน้า Monitor ดึงไปแสดง)
+cleanup_lock = threading.Lock()
+cleanup_progress = {"running": False, "cutoff": None, "deleted_logs": 0, "archived_logs": 0, "deleted_files": 0, "batches": 0, "started": None, "finished": None, "error": None}
 
 # --- ADMIN AUTHENTICATION ---
 ADMIN_USER = os.getenv("ADMIN_USER", "admin")
@@ -71,6 +136,20 @@ def verify_admin(credentials: HTTPBasicCredentials = Depends(security)):
         )
     return credentials.username
 
+def require_recognition():
+    """ปิด API ที่ต้องใช้ระบบจดจำใบหน้าเมื่อรันในโหมด reports"""
+    if not RECOGNITION_ENABLED:
+        raise HTTPException(status_code=503, detail="Server นี้เปิดในโหมด reports (ไม่มีระบบจดจำใบหน้า)")
+
+def busy_response(exc):
+    return JSONResponse(status_code=exc.status_code, headers={"Retry-After": str(exc.retry_after)},
+                        content={"status": "BUSY", "name": "Server ไม่ว่าง", "message": "Server ไม่ว่าง กรุณาลองใหม่",
+                                 "reason": exc.reason, "retry_after": exc.retry_after})
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return busy_response(exc)
+
 # --- จัดการกรณี Login หน้า Admin ไม่ผ่าน (กด Cancel) ---
 @app.exception_handler(HTTPException)
 async def auth_exception_handler(request: Request, exc: HTTPException):
@@ -105,6 +184,40 @@ def get_db_conn():
         return conn
     except: return None
 
+EMPLOYEE_FTS = None  # tokenizer ของ employees_fts (None = SQLite ไม่มี FTS5 ค้นจากต้นคำด้วย index แทน)
+
+def init_employee_search(cur):
+    """สร้าง employees_fts (trigram ค้นกลางคำได้ทั้งชื่อภาษาไทยและรหัส) + trigger ให้ตรงกับ employees เสมอ"""
+    global EMPLOYEE_FTS
+    row = cur.execute("SELECT sql FROM sqlite_master WHERE name = 'employees_fts'").fetchone()
+    if row:
+        EMPLOYEE_FTS = "trigram" if "trigram" in row[0] else "unicode61"
+    else:
+        for tokenizer in ("trigram", "unicode61"):  # trigram ต้องใช้ SQLite 3.34 ขึ้นไป
+            try:
+                cur.execute(f"CREATE VIRTUAL TABLE employees_fts USING fts5(employee_id, name, tokenize='{tokenizer}')")
+                EMPLOYEE_FTS = tokenizer
+                break
+            except sqlite3.OperationalError:
+                continue
+        if not EMPLOYEE_FTS: return
+        print(f">>> 🛠️ Building employee search index ({EMPLOYEE_FTS})...")
+        cur.execute("INSERT INTO employees_fts (rowid, employee_id, name) SELECT rowid, employee_id, name FROM employees")
+    # INSERT OR REPLACE ลบแถวเดิมโดยไม่เรียก trigger AFTER DELETE จึงต้องลบ entry เดิมตั้งแต่ BEFORE INSERT
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS employees_fts_bi BEFORE INSERT ON employees BEGIN
+        DELETE FROM employees_fts WHERE rowid = (SELECT rowid FROM employees WHERE employee_id = new.employee_id);
+    END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS employees_fts_ai AFTER INSERT ON employees BEGIN
+        INSERT INTO employees_fts (rowid, employee_id, name) VALUES (new.rowid, new.employee_id, new.name);
+    END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS employees_fts_au AFTER UPDATE OF employee_id, name ON employees BEGIN
+        DELETE FROM employees_fts WHERE rowid = old.rowid;
+        INSERT INTO employees_fts (rowid, employee_id, name) VALUES (new.rowid, new.employee_id, new.name);
+    END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS employees_fts_ad AFTER DELETE ON employees BEGIN
+        DELETE FROM employees_fts WHERE rowid = old.rowid;
+    END""")
+
 def init_system():
     conn = get_db_conn()
     if conn:
@@ -129,6 +242,18 @@ def init_system():
             print(">>> 🛠️ Migrating DB: Adding 'department' column...")
             cur.execute("ALTER TABLE employees ADD COLUMN department TEXT")
 
+        # โมเดลที่ใช้สร้าง embedding ของแต่ละคน (NULL = โมเดลเริ่มต้น)
+        try:
+            cur.execute("ALTER TABLE employees ADD COLUMN embedding_model TEXT")
+        except:
+            pass
+
+        # Index สำหรับ filter/ค้นหาจากต้นคำ + ตาราง FTS5 สำหรับค้นชื่อ/รหัส (/api/employees?q=)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_employees_name ON employees (name)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_employees_role ON employees (role, employee_id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_employees_dep ON employees (department, employee_id)")
+        init_employee_search(cur)
+
         # 2. ตาราง Logs
         cur.execute("""CREATE TABLE IF NOT EXISTS attendance_logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT, 
@@ -144,6 +269,11 @@ def init_system():
             cur.execute("ALTER TABLE attendance_logs ADD COLUMN client_ip TEXT")
         except:
             pass
+
+        # Index สำหรับงานลบข้อมูลเก่า / ค้นหาตามเวลา (ไม่ต้อง scan ทั้งตาราง)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_check_time ON attendance_logs (check_time)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_emp_time ON attendance_logs (employee_id, check_time)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_evidence ON attendance_logs (evidence_image)")
         
         # 3. ตาราง Remarks
         cur.execute("""CREATE TABLE IF NOT EXISTS daily_remarks (
@@ -159,6 +289,18 @@ def init_system():
         # 5. [ใหม่] ตาราง Departments (ตำแหน่งงาน)
         cur.execute("""CREATE TABLE IF NOT EXISTS departments (dep_name TEXT PRIMARY KEY)""")
 
+        # 6. ตาราง Embedding แยกตามโมเดล (ใช้ตอนเปลี่ยนโมเดล / ย้อนกลับโมเดลเดิม)
+        cur.execute("""CREATE TABLE IF NOT EXISTS face_embeddings (
+            employee_id TEXT, 
+            model_name TEXT, 
+            embedding TEXT, 
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, 
+            PRIMARY KEY (employee_id, model_name)
+        )""")
+
+        # 7. ตาราง Settings ที่ระบบปรับเองระหว่างทำงาน (เช่น โมเดลที่ใช้อยู่)
+        cur.execute("""CREATE TABLE IF NOT EXISTS app_settings (key TEXT PRIMARY KEY, value TEXT)""")
+
         # Seed Data (ข้อมูลเริ่มต้น)
         # default_roles = ["พนักงานทั่วไป", "วิศวะ", "แม่บ้าน", "รปภ.", "ธุรการ"]
         # for r in default_roles:
@@ -171,27 +313,91 @@ def init_system():
         conn.commit()
         conn.close()
     
+    global ACTIVE_MODEL, THRESHOLD
+    ACTIVE_MODEL = get_setting("active_model", MODEL_NAME)
+    THRESHOLD = float(get_setting("threshold", THRESHOLD))
+
+    if not RECOGNITION_ENABLED:
+        print(">>> 📊 APP_MODE=reports: เปิดเฉพาะหน้า Admin/รายงาน (ไม่โหลดระบบจดจำใบหน้า)")
+        return
+
+    threading.Thread(target=migrate_evidence_layout, daemon=True).start()
+    init_gallery_signature()
     load_faces()
 
+    # มีงาน Re-embed ค้างอยู่ (Server ถูกปิดกลางทาง) -> ทำต่อ
+    target = get_setting("reembed_target")
+    if target and target != ACTIVE_MODEL:
+        threshold = get_setting("reembed_threshold")
+        threading.Thread(target=run_reembed_job, args=(target, float(threshold) if threshold else None), daemon=True).start()
+
+def init_gallery_signature():
+    """จำว่าใบหน้าในฐานข้อมูลสร้างด้วย Engine ไหน (get_engine จะไม่ใช้ ONNX กับ gallery ที่สร้างด้วย DeepFace)
+    ฐานข้อมูลเดิมที่ยังไม่มี setting นี้สร้างด้วย DeepFace ทั้งหมด ฐานข้อมูลว่างใช้ Engine ปัจจุบันได้เลย"""
+    conn = get_db_conn()
+    if not conn: return
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM employees WHERE embedding IS NOT NULL LIMIT 1")
+        has_faces = cur.fetchone() is not None
+        gallery = get_setting("gallery_signature")
+        if not has_faces:
+            gallery = model_signature(ACTIVE_MODEL)
+        elif not gallery or gallery.partition("/")[0] != ACTIVE_MODEL:
+            gallery = DeepFaceEngine(ACTIVE_MODEL).signature
+        cur.execute("INSERT OR REPLACE INTO app_settings (key, value) VALUES ('gallery_signature', ?)", (gallery,))
+        conn.commit()
+    finally:
+        conn.close()
+    set_gallery_signature(gallery)
+
+def get_setting(key, default=None):
+    conn = get_db_conn()
+    if not conn: return default
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT value FROM app_settings WHERE key = ?", (key,))
+        row = cur.fetchone()
+        return row['value'] if row else default
+    except: return default
+    finally: conn.close()
+
 def load_faces():
-    global known_embeddings, known_ids, known_names
+    global known_embeddings, known_ids, known_names, known_matrix
     print(">>> 🔄 Loading AI Models & Faces...")
     conn = get_db_conn()
     if not conn: return
     cur = conn.cursor()
-    cur.execute("SELECT employee_id, name, embedding FROM employees")
+    # โหลดเฉพาะ embedding ของโมเดลที่ใช้อยู่ (กันเปรียบเทียบข้ามโมเดล)
+    cur.execute("SELECT employee_id, name, embedding FROM employees WHERE embedding_model IS NULL OR embedding_model = ?", (ACTIVE_MODEL,))
     rows = cur.fetchall()
     
-    known_embeddings, known_ids, known_names = [], [], []
+    embeddings, ids, names = [], [], []
     for r in rows:
         if r['embedding']:
             try:
-                known_embeddings.append(json.loads(r['embedding']))
-                known_ids.append(r['employee_id'])
-                known_names.append(r['name'])
+                embeddings.append(json.loads(r['embedding']))
+                ids.append(r['employee_id'])
+                names.append(r['name'])
             except: pass
     conn.close()
-    print(f">>> ✅ Loaded {len(known_names)} faces.")
+    matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1) if embeddings else np.zeros((0, 0), np.float32)
+    if len(matrix): matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-10
+    # สลับชุดข้อมูลทีเดียว การสแกนที่ทำงานอยู่จะไม่เห็นข้อมูลครึ่งๆ กลางๆ
+    known_embeddings, known_ids, known_names, known_matrix = embeddings, ids, names, matrix
+    print(f">>> ✅ Loaded {len(known_names)} faces ({ACTIVE_MODEL}).")
+
+def match_embeddings(embs):
+    """เทียบ embedding หลายหน้ากับทุกคนในครั้งเดียว (cosine distance ด้วยการคูณเมทริกซ์)
+    คืน list ตามลำดับ: (employee_id, name, distance) หรือ None ถ้าไม่ผ่าน THRESHOLD"""
+    matrix, ids, names = known_matrix, known_ids, known_names
+    if not len(embs): return []
+    q = np.asarray(embs, dtype=np.float32).reshape(len(embs), -1)
+    if not len(ids) or q.shape[1] != matrix.shape[1]: return [None] * len(embs)  # ยังไม่มีข้อมูล/กำลังสลับโมเดล
+    q /= np.linalg.norm(q, axis=1, keepdims=True) + 1e-10
+    dist = 1.0 - q @ matrix.T
+    best = dist.argmin(axis=1)
+    return [(ids[i], names[i], float(dist[r, i])) if dist[r, i] < THRESHOLD else None for r, i in enumerate(best)]
 
 @app.on_event("startup")
 async def startup_event():
@@ -222,8 +428,8 @@ async def view_print(username: str = Depends(verify_admin)):
 
 @app.get("/health")
 async def health_check():
-    """API สำหรับเช็คว่า Server ยังรอดอยู่ไหม"""
-    return {"status": "online"}
+    """API สำหรับเช็คว่า Server ยังรอดอยู่ไหม (model = โมเดลที่ Kiosk โหมด Edge ต้องใช้ให้ตรงกัน)"""
+    return {"status": "online", "model": model_signature(ACTIVE_MODEL)}
 
 @app.get("/webscan")
 async def view_webscan():
@@ -248,21 +454,176 @@ def send_telegram_thread(name, time_str, img_path, client_ip="Unknown"):
     except Exception as e: 
         print(f"Telegram Error: {e}")
 
-# เพิ่ม parameter client_ip
-def save_log(emp_id, name, frame, type="SCAN", client_ip="Unknown"):
-    now = datetime.now()
+# --- EVIDENCE STORAGE (แบ่งโฟลเดอร์ตามวัน attendance_images/YYYY/MM/DD/) ---
+def evidence_path_for(emp_id, when):
+    """คืน path สำหรับเก็บรูปหลักฐาน (สร้างโฟลเดอร์ของวันนั้นให้ด้วย)"""
+    day_dir = f"attendance_images/{when.strftime('%Y/%m/%d')}"
+    os.makedirs(day_dir, exist_ok=True)
+    return f"{day_dir}/{emp_id}_{when.strftime('%H%M%S')}.jpg"
+
+def resolve_evidence_path(img_path, check_time=None):
+    """แปลง path แบบเก่า (attendance_images/xxx.jpg) ให้ชี้ไปที่โฟลเดอร์ของวันนั้น ถ้าไฟล์ถูกย้ายไปแล้ว"""
+    if not img_path or img_path.count("/") != 1: return img_path
+    if os.path.exists(img_path) or not check_time: return img_path
+    return f"attendance_images/{str(check_time)[:10].replace('-', '/')}/{os.path.basename(img_path)}"
+
+def migrate_evidence_layout():
+    """ย้ายรูปหลักฐานแบบเก่าที่อยู่รวมโฟลเดอร์เดียว ไปไว้ใน attendance_images/YYYY/MM/DD/ (ทำครั้งเดียว)"""
     conn = get_db_conn()
     if not conn: return
+    moved = 0
+    try:
+        cur = conn.cursor()
+        while True:
+            # เรียงจากใหม่ไปเก่า: ถ้าชื่อไฟล์ซ้ำ (ถูกเขียนทับ) ไฟล์จริงจะเป็นของ log ล่าสุด
+            cur.execute("""SELECT id, check_time, evidence_image FROM attendance_logs
+                           WHERE evidence_image LIKE 'attendance_images/%' AND evidence_image NOT LIKE 'attendance_images/%/%'
+                           ORDER BY check_time DESC LIMIT ?""", (CLEANUP_BATCH_SIZE,))
+            rows = cur.fetchall()
+            if not rows: break
+            for r in rows:
+                src = r['evidence_image']
+                dst = f"attendance_images/{str(r['check_time'])[:10].replace('-', '/')}/{os.path.basename(src)}"
+                if os.path.isfile(src):
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    os.replace(src, dst)
+                    moved += 1
+                cur.execute("UPDATE attendance_logs SET evidence_image = ? WHERE id = ?", (dst, r['id']))
+            conn.commit()
+
+        # ไฟล์ที่ไม่มี log อ้างอิงแล้ว ย้ายเข้าโฟลเดอร์ตามวันที่แก้ไขไฟล์ เพื่อให้ระบบลบตามอายุเก็บได้
+        leftovers = [e for e in os.scandir("attendance_images") if e.is_file() and e.name.lower().endswith(".jpg")]
+        for entry in leftovers:
+            day = datetime.fromtimestamp(entry.stat().st_mtime).strftime("%Y/%m/%d")
+            os.makedirs(f"attendance_images/{day}", exist_ok=True)
+            os.replace(entry.path, f"attendance_images/{day}/{entry.name}")
+            moved += 1
+    except Exception as e:
+        print(f"Evidence Migration Error: {e}")
+    finally:
+        conn.close()
+    if moved: print(f">>> 📦 Migrated {moved} evidence images to dated folders.")
+
+# --- THUMBNAILS (รูปย่อสำหรับหน้า Admin / Report) ---
+THUMB_DIR = "thumbnails"
+THUMB_SIZES = {"sm": 64, "md": 160, "lg": 480}  # ด้านยาวสุด (px)
+thumb_lock = threading.Lock()
+thumb_index = None     # path -> ขนาด เรียงจากใช้งานนานสุดไปล่าสุด (LRU ใน RAM ไม่พึ่ง atime ของ disk ที่ mount noatime)
+thumb_cache_bytes = 0  # ขนาดรวมของ cache
+
+def thumb_path_for(src_path, size):
+    return f"{THUMB_DIR}/{size}/{src_path}"
+
+def _thumb_index():
+    """สร้าง index จาก disk ครั้งแรกที่ใช้ (เรียงตาม mtime) ต้องถือ thumb_lock"""
+    global thumb_index, thumb_cache_bytes
+    if thumb_index is None:
+        files = []
+        for r, _, names in os.walk(THUMB_DIR):
+            for f in names:
+                st = os.stat(os.path.join(r, f))
+                files.append((st.st_mtime, os.path.join(r, f).replace("\\", "/"), st.st_size))
+        files.sort()
+        thumb_index = OrderedDict((path, size) for _, path, size in files)
+        thumb_cache_bytes = sum(thumb_index.values())
+    return thumb_index
+
+def thumb_cache_touch(path, nbytes=None):
+    """บันทึกว่ารูปย่อถูกใช้ (หรือเพิ่งเขียน ขนาด nbytes) แล้วลบรูปที่ไม่ได้ใช้นานที่สุดออก เมื่อเกิน THUMB_CACHE_MB"""
+    global thumb_cache_bytes
+    limit = THUMB_CACHE_MB * 1024 * 1024
+    with thumb_lock:
+        index = _thumb_index()
+        if nbytes is not None:
+            thumb_cache_bytes += nbytes - index.get(path, 0)
+            index[path] = nbytes
+        elif path not in index:
+            return
+        index.move_to_end(path)
+        if thumb_cache_bytes <= limit: return
+        # ลบให้เหลือ 90% ของเพดาน จะได้ไม่ต้อง evict ทุกครั้งที่เขียน
+        while len(index) > 1 and thumb_cache_bytes > limit * 0.9:
+            old, size = index.popitem(last=False)
+            thumb_cache_bytes -= size
+            try: os.remove(old)
+            except OSError: pass
+
+def thumb_cache_forget(path):
+    """เอารูปย่อ (หรือทั้งโฟลเดอร์) ที่ถูกลบจาก disk ออกจาก index"""
+    global thumb_cache_bytes
+    with thumb_lock:
+        if thumb_index is None: return
+        for key in [k for k in thumb_index if k == path or k.startswith(path + "/")]:
+            thumb_cache_bytes -= thumb_index.pop(key)
+
+def make_thumbnail(src_path, size, frame=None):
+    """สร้างรูปย่อ 1 ขนาด จากไฟล์ต้นฉบับ (หรือ frame ที่มีอยู่ใน RAM แล้ว)"""
+    if frame is None: frame = cv2.imread(src_path)
+    if frame is None: return None
+    h, w = frame.shape[:2]
+    scale = THUMB_SIZES[size] / max(h, w)
+    if scale < 1:
+        frame = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    dst = thumb_path_for(src_path, size)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    cv2.imwrite(dst, frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    thumb_cache_touch(dst, os.path.getsize(dst))
+    return dst
+
+def make_all_thumbnails(src_path, frame=None):
+    """สร้างรูปย่อทุกขนาดตอนลงทะเบียน (รูปหลักฐานการสแกนจะสร้างตอนเปิดดูครั้งแรกที่ /thumb ไม่หน่วงการสแกน)"""
+    try:
+        for size in THUMB_SIZES:
+            make_thumbnail(src_path, size, frame)
+    except Exception as e:
+        print(f"Thumbnail Error: {e}")
+
+def remove_thumbnails(src_path):
+    for size in THUMB_SIZES:
+        try: os.remove(thumb_path_for(src_path, size))
+        except OSError: pass
+        thumb_cache_forget(thumb_path_for(src_path, size))
+
+@app.get("/thumb/{size}/{src_path:path}")
+async def get_thumbnail(request: Request, size: str, src_path: str):
+    """ส่งรูปย่อขนาด sm / md / lg ของรูปใน images/ หรือ attendance_images/ (สร้างให้ถ้ายังไม่มี)"""
+    norm = os.path.normpath(src_path).replace("\\", "/")
+    if size not in THUMB_SIZES or norm.startswith("..") or norm.split("/")[0] not in ("images", "attendance_images"):
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not os.path.isfile(norm):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    src_stat = os.stat(norm)
+    dst = thumb_path_for(norm, size)
+    if not os.path.exists(dst) or os.path.getmtime(dst) < src_stat.st_mtime:
+        dst = await run_in_threadpool(make_thumbnail, norm, size)
+        if not dst: raise HTTPException(status_code=404, detail="Not Found")
+    else:
+        await run_in_threadpool(thumb_cache_touch, dst)
+
+    # รูปหลักฐานไม่มีวันเปลี่ยน -> cache ยาว, รูปพนักงานแก้ไขได้ -> ให้ browser ถามด้วย ETag ทุกครั้ง
+    etag = f'"{size}-{int(src_stat.st_mtime)}-{src_stat.st_size}"'
+    cache = "public, max-age=31536000, immutable" if norm.startswith("attendance_images/") else "public, no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(dst, media_type="image/jpeg", headers=headers)
+
+# เพิ่ม parameter client_ip
+def save_log(emp_id, name, frame, type="SCAN", client_ip="Unknown", captured_at=None):
+    """บันทึกเวลา คืน True ถ้าบันทึกใหม่ (ซ้ำภายใน 60 วินาทีจะข้าม)
+    captured_at = เวลาที่ถ่ายภาพจริง (ภาพที่ Kiosk เก็บไว้ตอน Offline แล้วส่งมาทีหลัง)"""
+    now = captured_at or datetime.now()
+    conn = get_db_conn()
+    if not conn: return False
     try:
         cur = conn.cursor()
-        cur.execute("SELECT check_time FROM attendance_logs WHERE employee_id=? ORDER BY id DESC LIMIT 1", (emp_id,))
-        last = cur.fetchone()
-        if last:
-            last_time = datetime.strptime(last['check_time'], "%Y-%m-%d %H:%M:%S.%f")
-            if (now - last_time).total_seconds() < 60: return
-
-        if not os.path.exists("attendance_images"): os.makedirs("attendance_images")
-        img_path = f"attendance_images/{emp_id}_{now.strftime('%H%M%S')}.jpg"
+        # ตรวจซ้ำรอบเวลาที่ถ่ายจริง ±60 วินาที (ภาพย้อนหลังอาจมาถึงหลังการสแกนสดของคนเดิม)
+        cur.execute("SELECT 1 FROM attendance_logs WHERE employee_id=? AND check_time > ? AND check_time < ? LIMIT 1",
+                    (emp_id, now - timedelta(seconds=60), now + timedelta(seconds=60)))
+        if cur.fetchone(): return False
+
+        img_path = evidence_path_for(emp_id, now)
         
         # ==========================================
         # 🟢 เพิ่มส่วนนี้: ฝังลายน้ำ (เวลา และ IP) ลงบนรูป
@@ -291,7 +652,7 @@ def save_log(emp_id, name, frame, type="SCAN", client_ip="Unknown"):
         # บันทึกรูปลงโฟลเดอร์ (รูปนี้จะมีลายน้ำติดไปด้วย)
         cv2.imwrite(img_path, frame)
         
-        status_txt = "บันทึกแล้ว" if type == "SCAN" else "บันทึกมือ"
+        status_txt = {"SCAN": "บันทึกแล้ว", "OFFLINE": "บันทึกย้อนหลัง"}.get(type, "บันทึกมือ")
         
         # อัปเดตคำสั่ง Insert ให้มี client_ip
         cur.execute("INSERT INTO attendance_logs (employee_id, employee_name, check_time, evidence_image, log_type, status, client_ip) VALUES (?,?,?,?,?,?,?)",
@@ -301,51 +662,303 @@ def save_log(emp_id, name, frame, type="SCAN", client_ip="Unknown"):
         if ENABLE_TELEGRAM:
             # ส่งค่า client_ip เข้า Thread ของ Telegram ด้วย (รูปที่ส่งไปก็จะมีลายน้ำด้วย)
             threading.Thread(target=send_telegram_thread, args=(f"{name} ({type})", now.strftime("%H:%M:%S"), img_path, client_ip)).start()
+        return True
     except Exception as e: 
         print(f"DB Error: {e}")
+        return False
     finally: 
         conn.close()
 
 # --- CORE API ---
 # เพิ่ม request: Request เข้าไปในวงเล็บตรงนี้ครับ 👇
-@app.post("/scan")
+@app.post("/scan", dependencies=[Depends(require_recognition)])
 async def scan_face(request: Request, file: UploadFile = File(...)):
+    # ตอนนี้ระบบจะรู้จัก request แล้วครับ จะสามารถดึง IP ได้
+    client_ip = request.headers.get('X-Forwarded-For', request.client.host)
+    kiosk_id = request.headers.get('X-Kiosk-Id')
+    arrival, t0 = time.time(), time.perf_counter()
+    contents = await file.read()
     try:
-        # ตอนนี้ระบบจะรู้จัก request แล้วครับ จะสามารถดึง IP ได้
-        client_ip = request.headers.get('X-Forwarded-For', request.client.host)
-        
-        contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        async with scheduler.slot("scan", kiosk_id or client_ip):
+            try:
+                result = await run_in_threadpool(recognize_jpeg, contents, client_ip, kiosk_id)
+            except:
+                result = {"status": "ERROR", "name": "System Error"}
+    except Overloaded:
+        recorder.record("/scan", arrival, client_ip, kiosk_id, contents, None, (time.perf_counter() - t0) * 1000)
+        raise
+    recorder.record("/scan", arrival, client_ip, kiosk_id, contents, result, (time.perf_counter() - t0) * 1000)
+    return result
+
+def region_signature(gray, box=None):
+    """ลายเซ็นขนาดเล็ก (16x16) ของทั้งภาพ หรือเฉพาะกรอบ box = [x, y, w, h] ไว้เทียบว่าภาพใหม่ต่างจากภาพก่อนหน้าแค่ไหน"""
+    if box:
+        x, y, w, h = box
+        gray = gray[max(0, y):y + h, max(0, x):x + w]
+        if gray.size == 0: return None
+    return cv2.resize(gray, (16, 16), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+def same_region(old, gray, box=None):
+    """ค่าต่างสูงสุดรายช่อง (ไม่ใช่ค่าเฉลี่ยทั้งภาพ) คนใหม่ที่โผล่มาในมุมเล็กๆ ของภาพจึงไม่ถูกเฉลี่ยจนหายไป"""
+    new = region_signature(gray, box)
+    return old is not None and new is not None and np.abs(old - new).max() < SCAN_CACHE_DIFF
+
+def cached_scan_result(kiosk, gray, now):
+    """คืนผลเดิมของ Kiosk นี้ถ้าภาพแทบไม่เปลี่ยนและยังไม่หมดอายุ ไม่งั้นคืน None
+    เทียบทั้งภาพและเทียบละเอียดเฉพาะกรอบหน้าที่ผลเดิมเจอ (เปลี่ยนคนในกรอบเดิมต้องรัน AI ใหม่)
+    ผลจาก cache มี cached = True และทุกหน้า recorded = False (ไม่ได้บันทึกเวลาซ้ำ Client ไม่ต้องแสดงว่าลงเวลาใหม่)"""
+    with scan_cache_lock:
+        entry = scan_cache.get(kiosk)
+        if entry and now - entry[3] < SCAN_CACHE_TTL and all(same_region(sig, gray, box) for box, sig in zip(entry[0], entry[1])):
+            scan_cache_stats["hits"] += 1
+            scan_cache_stats["saved_ms"] += scan_cache_stats["infer_ms"]
+            faces = [{**f, "recorded": False} if "recorded" in f else f for f in entry[2].get("faces", [])]
+            return {**entry[2], "faces": faces, "cached": True}
+        scan_cache_stats["misses"] += 1
+        return None
+
+def store_scan_result(kiosk, gray, result, now, infer_ms):
+    boxes = [None] + [f["box"] for f in result.get("faces", [])]  # None = ทั้งภาพ
+    sigs = [region_signature(gray, box) for box in boxes]
+    with scan_cache_lock:
+        scan_cache[kiosk] = (boxes, sigs, result, now)
+        # เวลาเฉลี่ยต่อการรัน AI 1 ครั้ง ใช้ประมาณ CPU ที่ประหยัดได้ต่อ hit
+        stats = scan_cache_stats
+        stats["infer_ms"] = infer_ms if not stats["infer_ms"] else 0.9 * stats["infer_ms"] + 0.1 * infer_ms
+        if len(scan_cache) > 256:
+            for k in [k for k, e in scan_cache.items() if now - e[3] >= SCAN_CACHE_TTL]: del scan_cache[k]
+
+def face_box(obj):
+    area = obj.get("facial_area") or {}
+    return [int(area.get("x", 0)), int(area.get("y", 0)), int(area.get("w", 0)), int(area.get("h", 0))]
+
+def pair_faces(boxes, matches):
+    """จับคู่กรอบหน้ากับผลเทียบ ถ้าคนเดียวกันถูกจับได้หลายกรอบ เก็บเฉพาะกรอบที่ใกล้ที่สุด (ที่เหลือเป็น Unknown)
+    เรียงหน้าที่จดจำได้ (ใกล้สุดก่อน) ไว้หน้ารายการ"""
+    order = sorted(range(len(boxes)), key=lambda i: matches[i][2] if matches[i] else float("inf"))
+    faces, seen = [], set()
+    for i in order:
+        match = matches[i] if matches[i] and matches[i][0] not in seen else None
+        if match: seen.add(match[0])
+        faces.append((boxes[i], match))
+    return faces
+
+def log_faces(frame, faces, **log_kw):
+    """บันทึกเวลาทุกคนที่จดจำได้ในภาพ คืนผลสำหรับตอบ Kiosk
+    status/name = คนแรกที่จดจำได้ (ให้ Client รุ่นเดิมใช้ได้) ส่วน faces = ผลของทุกใบหน้า"""
+    results = []
+    for box, match in faces:
+        if match:
+            recorded = save_log(match[0], match[1], frame, **log_kw)
+            results.append({"status": "OK", "name": match[1], "box": box, "recorded": recorded})
+        else:
+            results.append({"status": "FAIL", "name": "Unknown", "box": box})
+    first = results[0] if results and results[0]["status"] == "OK" else None
+    return {"status": "OK" if first else "FAIL", "name": first["name"] if first else "Unknown",
+            "faces": results, "time": datetime.now().strftime("%H:%M:%S")}
+
+def recognize_jpeg(contents, client_ip, kiosk_id=None):
+    """ถอดรหัสภาพ -> จดจำใบหน้า -> บันทึกเวลา (ใช้ร่วมกันทั้ง /scan และ /ws/scan)
+    ภาพที่แทบไม่ต่างจากภาพก่อนหน้าของ Kiosk เดียวกันภายใน SCAN_CACHE_TTL จะตอบผลเดิมโดยไม่รัน AI"""
+    nparr = np.frombuffer(contents, np.uint8)
+    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+    kiosk, now = kiosk_id or client_ip, time.time()
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if SCAN_CACHE_TTL > 0 else None
+    if gray is not None:
+        cached = cached_scan_result(kiosk, gray, now)
+        if cached: return cached
+
+    t0 = time.perf_counter()
+    objs = represent(frame, ACTIVE_MODEL)
+    faces = pair_faces([face_box(o) for o in objs], match_embeddings([o["embedding"] for o in objs]))
+    # ส่ง client_ip ไปให้ save_log บันทึกต่อ
+    result = log_faces(frame, faces, client_ip=client_ip)
+    if gray is not None: store_scan_result(kiosk, gray, result, now, (time.perf_counter() - t0) * 1000)
+    return result
+
+@app.websocket("/ws/scan")
+async def ws_scan(websocket: WebSocket):
+    """Kiosk เปิด connection ค้างไว้แล้วส่งภาพเป็น binary: [seq 4 ไบต์ big-endian][JPEG]
+    ตอบกลับเป็น JSON ที่มี seq เดียวกัน ถ้ามีภาพใหม่มาระหว่างประมวลผล ภาพเก่าที่ยังไม่ได้ทำจะถูกทิ้ง (status DROPPED)"""
+    if not RECOGNITION_ENABLED:
+        await websocket.close(code=1013)  # Try Again Later: ให้ Kiosk ไปใช้ Server หลัก
+        return
+    await websocket.accept()
+    client_ip = websocket.headers.get('X-Forwarded-For', websocket.client.host)
+    kiosk_id = websocket.headers.get('X-Kiosk-Id') or websocket.query_params.get('kiosk')
+    latest = {"frame": None, "closed": False}
+    arrived = asyncio.Event()
+
+    async def receiver():
+        try:
+            while True:
+                data = await websocket.receive_bytes()
+                if len(data) < 5: continue
+                stale = latest["frame"]
+                latest["frame"] = (struct.unpack(">I", data[:4])[0], data[4:])
+                arrived.set()
+                if stale: await websocket.send_json({"seq": stale[0], "status": "DROPPED"})
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            latest["closed"] = True
+            arrived.set()
 
-        objs = DeepFace.represent(img_path=frame, model_name="Facenet512", enforce_detection=False)
-        found_name, status = "Unknown", "FAIL"
-        
-        if objs:
-            target_emb = objs[0]["embedding"]
-            min_dist, idx = 100, -1
-            
-            for i, known_emb in enumerate(known_embeddings):
-                dist = 1 - (np.dot(target_emb, known_emb) / (np.linalg.norm(target_emb) * np.linalg.norm(known_emb)))
-                if dist < min_dist: min_dist, idx = dist, i
-            
-            if min_dist < THRESHOLD and idx != -1:
-                # ส่ง client_ip ไปให้ save_log บันทึกต่อ
-                save_log(known_ids[idx], known_names[idx], frame, client_ip=client_ip)
-                found_name = known_names[idx]
-                status = "OK"
-                
-        return {"status": status, "name": found_name, "time": datetime.now().strftime("%H:%M:%S")}
-    except: 
-        return {"status": "ERROR", "name": "System Error"}
+    recv_task = asyncio.create_task(receiver())
+    try:
+        while True:
+            await arrived.wait()
+            arrived.clear()
+            if latest["closed"]: break
+            item, latest["frame"] = latest["frame"], None
+            if item is None: continue
+            seq, contents = item
+            try:
+                async with scheduler.slot("scan", kiosk_id or client_ip):
+                    result = await run_in_threadpool(recognize_jpeg, contents, client_ip, kiosk_id)
+            except Overloaded as e:
+                result = {"status": "BUSY", "name": "Server ไม่ว่าง", "reason": e.reason, "retry_after": e.retry_after}
+            except Exception:
+                result = {"status": "ERROR", "name": "System Error"}
+            await websocket.send_json({"seq": seq, **result})
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        recv_task.cancel()
+
+def parse_edge_faces(embeddings, embedding):
+    """อ่านใบหน้าที่ Kiosk ส่งมา คืน [(กรอบหน้า หรือ None, embedding)] หรือ ValueError
+    embeddings = JSON list [{"embedding": [...], "box": [x, y, w, h]}, ...] ทุกหน้าในภาพ (กรอบเป็นพิกัดภาพที่ Kiosk ใช้คำนวณ)
+    embedding = JSON list ตัวเลขของหน้าเดียวไม่มีกรอบ (Kiosk รุ่นเดิม)"""
+    if embeddings is not None:
+        items = json.loads(embeddings)
+        if not isinstance(items, list): raise ValueError
+        faces = []
+        for item in items:
+            box = [int(v) for v in item["box"]]
+            if len(box) != 4 or min(box) < 0: raise ValueError
+            faces.append((box, [float(v) for v in item["embedding"]]))
+    elif embedding is not None:
+        faces = [(None, [float(v) for v in json.loads(embedding)])]
+    else:
+        raise ValueError
+    if not all(emb and all(math.isfinite(v) for v in emb) for _, emb in faces): raise ValueError
+    return faces
+
+@app.post("/scan/embedding", dependencies=[Depends(require_recognition)])
+async def scan_embedding(request: Request, model: str = Form(...), embeddings: str = Form(None),
+                         embedding: str = Form(None), file: UploadFile = File(...)):
+    """โหมด Edge: Kiosk คำนวณ embedding ของทุกใบหน้าเองแล้วส่งมาพร้อมรูปหลักฐานขนาดเล็ก Server แค่เทียบและบันทึก
+    ตอบรูปแบบเดียวกับ /scan (status, name, faces พร้อม box/recorded, time)
+    model ต้องตรงกับ model_signature ของ Server ไม่งั้นตอบ 409 (Kiosk ต้องกลับไปส่งภาพเต็มแทน)"""
+    active = model_signature(ACTIVE_MODEL)
+    if model != active:
+        return JSONResponse(status_code=409, content={"status": "MODEL_MISMATCH", "model": active})
+    try:
+        faces = parse_edge_faces(embeddings, embedding)
+    except (ValueError, TypeError, KeyError):
+        return JSONResponse(status_code=400, content={"status": "ERROR",
+                                                      "message": 'embeddings ต้องเป็น JSON list ของ {"embedding": [ตัวเลข], "box": [x, y, w, h]}'})
+    # ขนาดต้องตรงกับ gallery (หรือกับโมเดลที่ใช้ ถ้ายังไม่มีใบหน้าในฐานข้อมูล)
+    dim = known_matrix.shape[1] if len(known_ids) else EMBEDDING_DIMS.get(ACTIVE_MODEL)
+    if dim and any(len(emb) != dim for _, emb in faces):
+        return JSONResponse(status_code=409, content={"status": "MODEL_MISMATCH", "model": active})
+    client_ip = request.headers.get('X-Forwarded-For', request.client.host)
+    contents = await file.read()
+    async with scheduler.slot("scan", request.headers.get('X-Kiosk-Id') or client_ip):
+        try:
+            return await run_in_threadpool(match_and_log, faces, contents, client_ip)
+        except Exception:
+            return {"status": "ERROR", "name": "System Error"}
+
+def match_and_log(faces, contents, client_ip):
+    """เทียบ embedding ทุกหน้าที่ Kiosk ส่งมาแล้วบันทึกเวลาพร้อมรูปหลักฐาน (รันใน threadpool)
+    faces = [(กรอบหน้า, embedding)] จาก parse_edge_faces Kiosk รุ่นเดิมที่ไม่ส่งกรอบจะได้คำตอบแบบเดิม (ไม่มี faces)"""
+    frame = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None: return {"status": "ERROR", "name": "ไฟล์รูปภาพไม่ถูกต้อง"}
+    paired = pair_faces([box for box, _ in faces], match_embeddings([emb for _, emb in faces]))
+    result = log_faces(frame, paired, client_ip=client_ip)
+    if any(box is None for box, _ in faces): del result["faces"]
+    return result
+
+def process_scan_batch(frames, captured, client_ip, errors=None):
+    """จดจำทุกใบหน้าในภาพหลายภาพ แล้วเทียบกับฐานข้อมูลด้วยการคูณเมทริกซ์ครั้งเดียว บันทึกตามเวลาที่ถ่ายจริง
+    errors = {index: ข้อความ} ภาพที่ไม่ต้องประมวลผล (ตอบ ERROR ตามข้อความนั้น)"""
+    embs, owners, results = [], [], []
+    for i, frame in enumerate(frames):
+        results.append({"status": "FAIL", "name": "Unknown", "faces": []})
+        if errors and i in errors:
+            results[i] = {"status": "ERROR", "name": errors[i], "faces": []}
+            continue
+        if frame is None:
+            results[i] = {"status": "ERROR", "name": "ไฟล์รูปภาพไม่ถูกต้อง", "faces": []}
+            continue
+        for obj in represent(frame, ACTIVE_MODEL):
+            embs.append(obj["embedding"])
+            owners.append((i, face_box(obj)))
+    per_frame = {}
+    for (i, box), match in zip(owners, match_embeddings(embs)):
+        per_frame.setdefault(i, ([], []))
+        per_frame[i][0].append(box)
+        per_frame[i][1].append(match)
+    for i, (boxes, matches) in per_frame.items():
+        results[i] = log_faces(frames[i], pair_faces(boxes, matches), type="OFFLINE", client_ip=client_ip, captured_at=captured[i])
+    return results
+
+@app.post("/scan/batch", dependencies=[Depends(require_recognition)])
+async def scan_batch(request: Request, files: List[UploadFile] = File(...), captured_at: List[str] = Form(...)):
+    """รับภาพที่ Kiosk เก็บไว้ตอน Server ล่ม (captured_at = เวลาที่ถ่ายจริง ISO format เรียงตรงกับ files)"""
+    if len(files) != len(captured_at):
+        raise HTTPException(status_code=400, detail="จำนวน files และ captured_at ไม่ตรงกัน")
+    if len(files) > SCAN_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"ส่งได้ไม่เกิน {SCAN_BATCH_MAX} ภาพต่อครั้ง")
+    client_ip = request.headers.get('X-Forwarded-For', request.client.host)
+    now = datetime.now()
+    oldest = now - timedelta(hours=SCAN_BATCH_MAX_AGE_HOURS)
+    frames, captured, errors = [], [], {}
+    for i, (f, ts) in enumerate(zip(files, captured_at)):
+        contents = await f.read()
+        try:
+            taken = datetime.fromisoformat(ts)
+            if taken.tzinfo: taken = taken.astimezone().replace(tzinfo=None)
+        except (ValueError, TypeError):
+            taken = None
+        # เวลาเป็นหลักฐานการมาทำงาน ถ้าไม่แน่ใจไม่บันทึก (ไม่เดาเป็นเวลาปัจจุบัน/ไม่รับย้อนหลังไม่จำกัด)
+        if taken is None:
+            errors[i] = "captured_at ไม่ถูกต้อง"
+        elif taken < oldest:
+            errors[i] = f"ภาพเก่าเกิน {SCAN_BATCH_MAX_AGE_HOURS:g} ชั่วโมง ไม่บันทึกเวลา"
+        frames.append(None if i in errors else cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR))
+        captured.append(min(taken, now) if taken else None)  # นาฬิกา Kiosk เดินเร็วกว่าก็ไม่บันทึกเวลาอนาคต
+    if errors: print(f">>> ⚠️ /scan/batch จาก {client_ip}: ไม่บันทึก {len(errors)} ภาพ ({', '.join(sorted(set(errors.values())))})")
+    # ภาพย้อนหลังไม่เร่งด่วน รอคิวหลังงานสแกนสด (ช่วงคนเยอะอาจได้ 503 + Retry-After ให้ Kiosk ส่งใหม่ทีหลัง)
+    async with scheduler.slot("enroll", request.headers.get('X-Kiosk-Id') or client_ip):
+        results = await run_in_threadpool(process_scan_batch, frames, captured, client_ip, errors)
+    return {"status": "success", "results": results}
 
 # 1. เพิ่ม request: Request เข้าไปในวงเล็บ 👇
-@app.post("/manual_scan")
+@app.post("/manual_scan", dependencies=[Depends(require_recognition)])
 async def manual_scan(request: Request, employee_id: str = Form(...), file: UploadFile = File(...)):
+    # 2. ดึง IP ของเครื่องที่กำลังใช้งาน
+    client_ip = request.headers.get('X-Forwarded-For', request.client.host)
+    # ลงเวลามือมาก่อนงานอื่นในคิว (พนักงานยืนรออยู่) และไม่ถูกตัดตอน Server หนัก
+    kiosk_id = request.headers.get('X-Kiosk-Id')
+    arrival, t0 = time.time(), time.perf_counter()
+    contents = await file.read()
+    try:
+        async with scheduler.slot("manual", kiosk_id or client_ip):
+            result = await run_in_threadpool(manual_checkin, employee_id, contents, client_ip)
+    except Overloaded:
+        recorder.record("/manual_scan", arrival, client_ip, kiosk_id, contents, None, (time.perf_counter() - t0) * 1000,
+                        employee_id=employee_id)
+        raise
+    recorder.record("/manual_scan", arrival, client_ip, kiosk_id, contents, result, (time.perf_counter() - t0) * 1000,
+                    employee_id=employee_id)
+    return result
+
+def manual_checkin(employee_id, contents, client_ip):
     try:
-        # 2. ดึง IP ของเครื่องที่กำลังใช้งาน
-        client_ip = request.headers.get('X-Forwarded-For', request.client.host)
-        
         conn = get_db_conn()
         cur = conn.cursor()
         cur.execute("SELECT name FROM employees WHERE employee_id = ?", (employee_id,))
@@ -354,7 +967,6 @@ async def manual_scan(request: Request, employee_id: str = Form(...), file: Uplo
         
         if not emp: return {"status": "FAIL", "message": "ไม่พบรหัสพนักงาน"}
         
-        contents = await file.read()
         nparr = np.frombuffer(contents, np.uint8)
         frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
@@ -372,46 +984,137 @@ async def manual_scan(request: Request, employee_id: str = Form(...), file: Uplo
 
 # --- EMPLOYEE MANAGEMENT ---
 
+EMPLOYEE_FIELDS = ("employee_id", "name", "role", "department", "image_path", "embedding_model", "created_at")
+EMPLOYEE_DEFAULT_FIELDS = ("employee_id", "name", "role", "department", "image_path")
+
+def employee_filters(q, role, department):
+    """เงื่อนไข WHERE + parameters ของการค้นหาพนักงาน"""
+    where, params = [], []
+    if role and role != "all":
+        where.append("role = ?")
+        params.append(role)
+    if department and department != "all":
+        where.append("department = ?")
+        params.append(department)
+    if q:
+        if EMPLOYEE_FTS == "trigram" and len(q) >= 3:
+            where.append("employee_id IN (SELECT employee_id FROM employees_fts WHERE employees_fts MATCH ?)")
+            params.append('"' + q.replace('"', '""') + '"')
+        elif EMPLOYEE_FTS == "unicode61":
+            where.append("employee_id IN (SELECT employee_id FROM employees_fts WHERE employees_fts MATCH ?)")
+            params.append(" ".join('"' + t.replace('"', '""') + '"*' for t in q.split()))
+        else:
+            # คำค้นสั้นกว่า 3 ตัวอักษร (trigram ใช้ไม่ได้) / ไม่มี FTS5: ค้นจากต้นคำด้วย index ของรหัสและชื่อ
+            where.append("((employee_id >= ? AND employee_id < ?) OR (name >= ? AND name < ?))")
+            params += [q, q + "\U0010ffff", q, q + "\U0010ffff"]
+    return where, params
+
 @app.get("/api/employees")
-async def get_employees():
+async def get_employees(q: str = "", role: str = "", department: str = "", fields: str = "",
+                        limit: Optional[int] = None, cursor: str = ""):
+    """รายชื่อพนักงานเรียงตามรหัส q = ค้นชื่อ/รหัส, fields = คอลัมน์ที่ต้องการ (คั่นด้วย ,)
+    ส่ง limit -> แบ่งหน้าแบบ keyset คืน {items, next_cursor, total (เฉพาะหน้าแรก)} หน้าถัดไปส่ง cursor=next_cursor
+    ไม่ส่ง limit -> คืนทุกคนเป็น list แบบเดิม"""
+    cols = [f for f in fields.split(",") if f in EMPLOYEE_FIELDS] if fields else list(EMPLOYEE_DEFAULT_FIELDS)
+    if "employee_id" not in cols: cols.insert(0, "employee_id")  # ใช้เป็น cursor
+    where, params = employee_filters(q.strip(), role, department)
+    clause = lambda w: f" WHERE {' AND '.join(w)}" if w else ""
+    select = f"SELECT {', '.join(cols)} FROM employees"
     conn = get_db_conn()
     cur = conn.cursor()
-    # ดึง department มาด้วย
-    cur.execute("SELECT employee_id, name, role, department, image_path FROM employees")
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    try:
+        if limit is None:
+            return cur.execute(f"{select}{clause(where)} ORDER BY employee_id", params).fetchall()
+        limit = min(max(limit, 1), EMPLOYEE_PAGE_MAX)
+        page_where, page_params = (where + ["employee_id > ?"], params + [cursor]) if cursor else (where, params)
+        rows = cur.execute(f"{select}{clause(page_where)} ORDER BY employee_id LIMIT ?", page_params + [limit + 1]).fetchall()
+        result = {"items": [dict(r) for r in rows[:limit]],
+                  "next_cursor": rows[limit - 1]["employee_id"] if len(rows) > limit else None}
+        if not cursor:
+            result["total"] = cur.execute(f"SELECT COUNT(*) FROM employees{clause(where)}", params).fetchone()[0]
+        return result
+    finally:
+        conn.close()
 
-@app.post("/api/register")
+def duplicate_threshold():
+    return float(DUPLICATE_THRESHOLD) if DUPLICATE_THRESHOLD else THRESHOLD
+
+def enrolled_duplicates(emb, emp_id):
+    """พนักงานรหัสอื่นที่ใบหน้าใกล้กับ emb ต่ำกว่า duplicate_threshold() (ใกล้สุดก่อน)"""
+    matrix, ids, names = known_matrix, known_ids, known_names
+    return [{"employee_id": ids[i], "name": names[i], "distance": round(d, 4)}
+            for i, d in dedupe.nearest(matrix, emb, duplicate_threshold()) if ids[i] != emp_id]
+
+async def save_enroll_photo(emp_id, file, force=False):
+    """บันทึกรูปลงทะเบียน + คำนวณ embedding (รันใน thread ตามคิว enroll ไม่ขวางงานสแกน)
+    คืน (file_path, embedding_json, model ที่ใช้คำนวณ, []) หรือถ้าหน้าซ้ำกับพนักงานรหัสอื่นและไม่ได้ force คืน (None, None, None, รายชื่อที่ซ้ำ)
+    โดยไม่เขียนทับรูปเดิม ช่วง Server หนักจะได้ 503 + Retry-After (Overloaded) ก่อนบันทึกอะไรลงฐานข้อมูล"""
+    upload_path = f"images/.upload_{emp_id}.jpg"
+    with open(upload_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+    try:
+        model = ACTIVE_MODEL
+        async with scheduler.slot("enroll"):
+            try:
+                emb = await run_in_threadpool(represent_file, upload_path, model)
+            except Exception:
+                emb = None
+        duplicates = enrolled_duplicates(emb, emp_id) if emb and not force else []
+        if duplicates: return None, None, None, duplicates
+        file_path = f"images/{emp_id}.jpg"
+        os.replace(upload_path, file_path)
+        make_all_thumbnails(file_path)
+        return file_path, json.dumps(emb) if emb else None, model, []
+    finally:
+        if os.path.exists(upload_path): os.remove(upload_path)
+
+def write_enrollment(emp_id, file_path, embedding_json, model, write):
+    """เขียนข้อมูลพนักงาน + embedding ผ่าน write(cur, embedding_json, model_name)
+    ถือ gallery_write_lock ไม่ให้ชนกับ cutover_model ถ้าสลับโมเดลไประหว่างคำนวณ จะคำนวณใหม่ด้วยโมเดลปัจจุบัน"""
+    with gallery_write_lock:
+        if embedding_json and model != ACTIVE_MODEL:
+            try:
+                embedding_json = json.dumps(represent_file(file_path, ACTIVE_MODEL))
+            except Exception:
+                embedding_json = None
+        conn = get_db_conn()
+        try:
+            cur = conn.cursor()
+            write(cur, embedding_json, ACTIVE_MODEL)
+            # รูปใหม่ -> embedding ของโมเดลอื่นที่เก็บไว้ใช้ไม่ได้แล้ว (งาน Re-embed จะคำนวณใหม่)
+            cur.execute("DELETE FROM face_embeddings WHERE employee_id = ?", (emp_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+def duplicate_response(duplicates):
+    names = ", ".join(f"{d['employee_id']} {d['name']}" for d in duplicates)
+    return {"status": "duplicate", "message": f"ใบหน้านี้คล้ายกับพนักงานที่ลงทะเบียนแล้ว: {names}", "matches": duplicates}
+
+@app.post("/api/register", dependencies=[Depends(require_recognition)])
 async def register(
     name: str = Form(...),
     emp_id: str = Form(...),
     role: str = Form(...),
     department: str = Form(...), # [ใหม่] รับค่า department
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    force: bool = Form(False)  # ยืนยันลงทะเบียนแม้หน้าคล้ายพนักงานคนอื่น
 ):
+    scheduler.admit("enroll")  # เช็คก่อนเขียนทับรูปเดิม
     try:
-        file_path = f"images/{emp_id}.jpg"
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        file_path, embedding_json, model, duplicates = await save_enroll_photo(emp_id, file, force)
+        if duplicates: return duplicate_response(duplicates)
 
-        embedding_json = None
-        try:
-            objs = DeepFace.represent(img_path=file_path, model_name="Facenet512", enforce_detection=False)
-            if objs: embedding_json = json.dumps(objs[0]["embedding"])
-        except: pass
-
-        conn = get_db_conn()
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT OR REPLACE INTO employees (employee_id, name, role, department, image_path, embedding)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (emp_id, name, role, department, file_path, embedding_json))
-        conn.commit()
-        conn.close()
+        def write(cur, embedding_json, model_name):
+            cur.execute("""
+                INSERT OR REPLACE INTO employees (employee_id, name, role, department, image_path, embedding, embedding_model)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (emp_id, name, role, department, file_path, embedding_json, model_name))
+        await run_in_threadpool(write_enrollment, emp_id, file_path, embedding_json, model, write)
 
-        load_faces()
+        await run_in_threadpool(load_faces)
         return {"status": "success", "message": f"ลงทะเบียน {name} เรียบร้อย"}
+    except Overloaded: raise
     except Exception as e: return {"status": "error", "message": str(e)}
 
 @app.post("/api/employees/update")
@@ -420,35 +1123,32 @@ async def update_employee(
     name: str = Form(...),
     role: str = Form(...),
     department: str = Form(...), # [ใหม่] รับค่า department
-    file: Optional[UploadFile] = File(None)
+    file: Optional[UploadFile] = File(None),
+    force: bool = Form(False)
 ):
+    if file:
+        require_recognition()  # เปลี่ยนรูปต้องคำนวณ embedding ใหม่ (แก้เฉพาะข้อมูลได้ในโหมด reports)
+        scheduler.admit("enroll")
     try:
-        conn = get_db_conn()
-        cur = conn.cursor()
-
         if file:
-            file_path = f"images/{emp_id}.jpg"
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            embedding_json = None
-            try:
-                objs = DeepFace.represent(img_path=file_path, model_name="Facenet512", enforce_detection=False)
-                if objs: embedding_json = json.dumps(objs[0]["embedding"])
-            except: pass
-            
-            cur.execute("""
-                UPDATE employees SET name=?, role=?, department=?, image_path=?, embedding=? WHERE employee_id=?
-            """, (name, role, department, file_path, embedding_json, emp_id))
+            file_path, embedding_json, model, duplicates = await save_enroll_photo(emp_id, file, force)
+            if duplicates: return duplicate_response(duplicates)
+            def write(cur, embedding_json, model_name):
+                cur.execute("""
+                    UPDATE employees SET name=?, role=?, department=?, image_path=?, embedding=?, embedding_model=? WHERE employee_id=?
+                """, (name, role, department, file_path, embedding_json, model_name, emp_id))
+            await run_in_threadpool(write_enrollment, emp_id, file_path, embedding_json, model, write)
         else:
+            conn = get_db_conn()
+            cur = conn.cursor()
             cur.execute("""
                 UPDATE employees SET name=?, role=?, department=? WHERE employee_id=?
             """, (name, role, department, emp_id))
-
-        conn.commit()
-        conn.close()
-        load_faces()
+            conn.commit()
+            conn.close()
+        await run_in_threadpool(load_faces)
         return {"status": "success"}
+    except Overloaded: raise
     except Exception as e: return {"status": "error", "message": str(e)}
 
 @app.delete("/api/employees/delete/{emp_id}")
@@ -460,14 +1160,250 @@ async def delete_employee(emp_id: str):
         row = cur.fetchone()
         if row and row['image_path'] and os.path.exists(row['image_path']):
             os.remove(row['image_path'])
+            remove_thumbnails(row['image_path'])
         
         cur.execute("DELETE FROM employees WHERE employee_id = ?", (emp_id,))
+        cur.execute("DELETE FROM face_embeddings WHERE employee_id = ?", (emp_id,))
         conn.commit()
         conn.close()
         load_faces()
         return {"status": "success"}
     except Exception as e: return {"status": "error", "message": str(e)}
 
+# --- BULK IMPORT (ZIP/โฟลเดอร์รูป + CSV) ---
+bulk_jobs = {}  # job_id -> สถานะล่าสุด
+
+def run_bulk_job(job_id, job_dir, force=False):
+    def on_progress(state):
+        bulk_jobs[job_id] = {k: v for k, v in state.items() if k != "employee_ids"}
+    try:
+        summary = bulk_import.run_job(job_dir, DB_FILE, workers=BACKGROUND_WORKERS, progress=on_progress, force=force)
+        for emp_id in summary["employee_ids"]:
+            make_all_thumbnails(f"images/{emp_id}.jpg")
+        load_faces()  # โหลด gallery ใหม่ครั้งเดียวหลังนำเข้าทั้งหมด
+    except Exception as e:
+        print(f"Bulk Import Error: {e}")
+        bulk_jobs[job_id] = {**bulk_jobs.get(job_id, {}), "job_id": job_id, "status": "error", "message": str(e)}
+
+@app.post("/api/employees/bulk-import", dependencies=[Depends(require_recognition)])
+async def bulk_import_employees(
+    archive: UploadFile = File(...),  # ZIP รูปพนักงาน
+    csv_file: UploadFile = File(...), # employee_id,name,role,department[,photo]
+    force: bool = Form(False),        # นำเข้าแม้หน้าซ้ำกับพนักงานคนอื่น
+    username: str = Depends(verify_admin)
+):
+    """นำเข้าพนักงานจำนวนมาก ทำงานเบื้องหลัง ส่งไฟล์เดิมซ้ำจะทำต่อจากจุดที่ค้าง"""
+    scheduler.admit("enroll")  # งานนี้ใช้ BACKGROUND_WORKERS Core ไม่เริ่มตอนที่ Server ตอบช้าเกิน SLO อยู่แล้ว
+    try:
+        upload_dir = os.path.join(bulk_import.BULK_DIR, "_upload")
+        os.makedirs(upload_dir, exist_ok=True)
+        zip_path, csv_path = os.path.join(upload_dir, "photos.zip"), os.path.join(upload_dir, "staff.csv")
+        with open(zip_path, "wb") as buffer: shutil.copyfileobj(archive.file, buffer)
+        with open(csv_path, "wb") as buffer: shutil.copyfileobj(csv_file.file, buffer)
+
+        job_id, job_dir = await run_in_threadpool(bulk_import.prepare_job, zip_path, csv_path, ACTIVE_MODEL)
+        if bulk_jobs.get(job_id, {}).get("status") == "running":
+            return {"status": "running", "job_id": job_id}
+
+        bulk_jobs[job_id] = {"job_id": job_id, "status": "running", "total": 0, "processed": 0}
+        threading.Thread(target=run_bulk_job, args=(job_id, job_dir, force), daemon=True).start()
+        return {"status": "success", "job_id": job_id}
+    except Exception as e: return {"status": "error", "message": str(e)}
+
+@app.get("/api/employees/bulk-import/{job_id}")
+async def bulk_import_status(job_id: str, username: str = Depends(verify_admin)):
+    return bulk_jobs.get(job_id, {"job_id": job_id, "status": "unknown"})
+
+@app.post("/api/system/reload-faces", dependencies=[Depends(require_recognition)])
+async def reload_faces(username: str = Depends(verify_admin)):
+    """โหลดใบหน้าจากฐานข้อมูลใหม่ (เช่น หลังรัน bulk_import.py จาก command line)"""
+    await run_in_threadpool(load_faces)
+    return {"status": "success", "faces_loaded": len(known_names)}
+
+# --- RE-EMBEDDING (เปลี่ยนโมเดล AI โดยไม่ต้องอัปโหลดรูปใหม่) ---
+reembed_lock = threading.Lock()
+gallery_write_lock = threading.Lock()  # การเขียน embedding ของ register/update กับ cutover_model ไม่ทับกัน
+reembed_state = {"status": "idle", "target_model": None, "total": 0, "done": 0, "failed": 0, "failures": [], "rate": 0.0, "eta_sec": None, "message": ""}
+
+def reembed_pending(target_model):
+    """คนที่ยังไม่มี embedding ของโมเดลใหม่ (รวมคนที่ลงทะเบียน/แก้รูประหว่างงานกำลังทำ)
+    คืน ([(emp_id, image_path)], [emp_id ที่ไม่มีไฟล์รูป], จำนวนพนักงานทั้งหมด)"""
+    conn = get_db_conn(); cur = conn.cursor()
+    cur.execute("""SELECT e.employee_id, e.image_path FROM employees e
+                   LEFT JOIN face_embeddings f ON f.employee_id = e.employee_id AND f.model_name = ?
+                   WHERE f.employee_id IS NULL AND e.image_path IS NOT NULL""", (target_model,))
+    rows = cur.fetchall()
+    cur.execute("SELECT Count(*) FROM employees")
+    total = cur.fetchone()[0]
+    conn.close()
+    pending = [(r['employee_id'], r['image_path']) for r in rows if os.path.exists(r['image_path'])]
+    missing = [r['employee_id'] for r in rows if not os.path.exists(r['image_path'])]
+    return pending, missing, total
+
+def store_reembedded(target_model, results, failures):
+    """บันทึกผลจาก embed_files_parallel ลง face_embeddings ทีละรายการ (ไม่ผ่าน -> failures) yield จำนวนที่ทำแล้ว"""
+    conn = get_db_conn(); cur = conn.cursor()
+    try:
+        for n, (emp_id, emb, err) in enumerate(results, 1):
+            if emb is None:
+                failures[emp_id] = err or "ไม่พบใบหน้า"
+            else:
+                cur.execute("INSERT OR REPLACE INTO face_embeddings (employee_id, model_name, embedding, updated_at) VALUES (?, ?, ?, ?)",
+                            (emp_id, target_model, json.dumps(emb), datetime.now()))
+                conn.commit()
+            yield n
+    finally:
+        conn.close()
+
+def run_reembed_job(target_model, target_threshold=None):
+    """คำนวณ embedding ใหม่จาก images/{emp_id}.jpg ด้วยโมเดลใหม่แบบขนาน เก็บใน face_embeddings
+    ระหว่างนี้การสแกนยังใช้ embedding ชุดเดิม เมื่อครบทุกคนแล้วจึงสลับชุดทีเดียว (cutover)
+    ถ้าถูกขัดจังหวะ เริ่มใหม่จะทำต่อเฉพาะคนที่ยังไม่มี embedding ของโมเดลใหม่"""
+    if not reembed_lock.acquire(blocking=False): return
+    try:
+        conn = get_db_conn(); cur = conn.cursor()
+        cur.execute("INSERT OR REPLACE INTO app_settings (key, value) VALUES ('reembed_target', ?)", (target_model,))
+        cur.execute("DELETE FROM app_settings WHERE key = 'reembed_threshold'")
+        if target_threshold is not None:
+            cur.execute("INSERT INTO app_settings (key, value) VALUES ('reembed_threshold', ?)", (str(target_threshold),))
+        conn.commit(); conn.close()
+
+        reembed_state.update({"status": "running", "target_model": target_model, "done": 0, "failed": 0, "failures": [],
+                              "rate": 0.0, "eta_sec": None, "message": ""})
+        t0, processed, failures = time.time(), 0, {}
+        while True:
+            pending, missing, reembed_state["total"] = reembed_pending(target_model)
+            failures.update({emp_id: "ไม่พบไฟล์รูป" for emp_id in missing})
+            pending = [p for p in pending if p[0] not in failures]
+            reembed_state["failed"] = len(failures)
+            if not pending: break
+
+            base = reembed_state["total"] - len(pending)
+            for n in store_reembedded(target_model, embed_files_parallel(pending, target_model, BACKGROUND_WORKERS), failures):
+                processed += 1
+                reembed_state["failed"] = len(failures)
+                elapsed = time.time() - t0
+                reembed_state["rate"] = round(processed / max(elapsed, 1e-6), 2)
+                reembed_state["done"] = base + n
+                remaining = max(reembed_state["total"] - reembed_state["done"], 0)
+                reembed_state["eta_sec"] = int(remaining / reembed_state["rate"]) if reembed_state["rate"] else None
+
+        if not failures: failures = cutover_model(target_model, target_threshold)
+        if failures:
+            # สลับทั้งที่บางคนไม่มี embedding ของโมเดลใหม่ คนเหล่านั้นจะสแกนไม่ติด -> ให้แก้รูปแล้วสั่งงานใหม่ (ทำต่อเฉพาะคนที่ค้าง)
+            reembed_state.update({"status": "error", "failed": len(failures), "eta_sec": None,
+                                  "failures": [{"employee_id": k, "error": v} for k, v in sorted(failures.items())][:200],
+                                  "message": f"ยังไม่สลับโมเดล: ไม่ผ่าน {len(failures)} คน แก้รูปแล้วเริ่มงานใหม่อีกครั้ง"})
+            return
+        reembed_state.update({"status": "done", "done": reembed_state["total"], "eta_sec": 0,
+                              "message": f"สลับไปใช้ {target_model} แล้ว"})
+    except Exception as e:
+        print(f"Re-embed Error: {e}")
+        reembed_state.update({"status": "error", "message": str(e)})
+    finally:
+        reembed_lock.release()
+
+def cutover_model(target_model, target_threshold=None):
+    """สลับ embedding ทั้งหมดไปโมเดลใหม่ใน Transaction เดียว แล้วโหลด gallery ใหม่
+    ถือ gallery_write_lock ตลอด: คนที่ลงทะเบียน/แก้รูปหลังงานหลักจบจะถูกคำนวณเพิ่มก่อนสลับ
+    ถ้ายังมีคนที่คำนวณไม่ผ่านจะไม่สลับ คืน {emp_id: error} (ว่าง = สลับแล้ว)"""
+    global ACTIVE_MODEL, THRESHOLD
+    with gallery_write_lock:
+        pending, missing, _ = reembed_pending(target_model)
+        failures = {emp_id: "ไม่พบไฟล์รูป" for emp_id in missing}
+        for _ in store_reembedded(target_model, embed_files_parallel(pending, target_model, BACKGROUND_WORKERS), failures): pass
+        if failures: return failures
+        _cutover_locked(target_model, target_threshold)
+        set_gallery_signature(model_signature(target_model))
+        ACTIVE_MODEL = target_model
+        if target_threshold is not None: THRESHOLD = target_threshold
+    load_faces()
+    return {}
+
+def _cutover_locked(target_model, target_threshold):
+    conn = get_db_conn(); cur = conn.cursor()
+    try:
+        # เก็บชุดเดิมไว้ใน face_embeddings เผื่อต้องย้อนกลับ
+        cur.execute("""INSERT OR REPLACE INTO face_embeddings (employee_id, model_name, embedding, updated_at)
+                       SELECT employee_id, COALESCE(embedding_model, ?), embedding, CURRENT_TIMESTAMP FROM employees
+                       WHERE embedding IS NOT NULL AND COALESCE(embedding_model, ?) != ?""", (ACTIVE_MODEL, ACTIVE_MODEL, target_model))
+        cur.execute("""UPDATE employees SET embedding_model = ?, embedding = (
+                           SELECT f.embedding FROM face_embeddings f WHERE f.employee_id = employees.employee_id AND f.model_name = ?)
+                       WHERE EXISTS (SELECT 1 FROM face_embeddings f WHERE f.employee_id = employees.employee_id AND f.model_name = ?)""",
+                    (target_model, target_model, target_model))
+        cur.execute("INSERT OR REPLACE INTO app_settings (key, value) VALUES ('active_model', ?)", (target_model,))
+        cur.execute("INSERT OR REPLACE INTO app_settings (key, value) VALUES ('gallery_signature', ?)", (model_signature(target_model),))
+        if target_threshold is not None:
+            cur.execute("INSERT OR REPLACE INTO app_settings (key, value) VALUES ('threshold', ?)", (str(target_threshold),))
+        cur.execute("DELETE FROM app_settings WHERE key IN ('reembed_target', 'reembed_threshold')")
+        conn.commit()
+    finally:
+        conn.close()
+
+@app.post("/api/system/reembed", dependencies=[Depends(require_recognition)])
+async def start_reembed(model_name: str = Form(...), threshold: Optional[float] = Form(None), username: str = Depends(verify_admin)):
+    """เริ่มงานคำนวณ embedding ใหม่ทั้งหมดด้วยโมเดลที่เลือก (ทำงานเบื้องหลัง)"""
+    if reembed_lock.locked():
+        return {"status": "error", "message": "มีงาน Re-embed กำลังทำงานอยู่"}
+    if model_name == ACTIVE_MODEL and threshold is None:
+        return {"status": "error", "message": f"ใช้โมเดล {model_name} อยู่แล้ว"}
+    scheduler.admit("enroll")
+    threading.Thread(target=run_reembed_job, args=(model_name.strip(), threshold), daemon=True).start()
+    return {"status": "success", "message": f"เริ่มคำนวณใหม่ด้วย {model_name}"}
+
+@app.get("/api/system/reembed")
+async def reembed_status(username: str = Depends(verify_admin)):
+    return {**reembed_state, "active_model": ACTIVE_MODEL, "threshold": THRESHOLD}
+
+# --- ตรวจหาพนักงานที่ลงทะเบียนซ้ำ (คนเดียวกันหลายรหัส) ---
+dedupe_lock = threading.Lock()
+dedupe_state = {"status": "idle", "threshold": None, "faces": 0, "blocks": 0, "done": 0, "clusters": [],
+                "started": None, "finished": None, "message": ""}
+
+def run_dedupe_job(threshold):
+    """เทียบทุกคู่ใน gallery ที่โหลดอยู่ทีละ block (ไม่สร้างเมทริกซ์ N x N) แล้วรวมเป็นกลุ่มที่สงสัยว่าซ้ำ"""
+    if not dedupe_lock.acquire(blocking=False): return
+    try:
+        matrix, ids, names = known_matrix, known_ids, known_names  # ชุดที่ใช้สแกนอยู่ (load_faces สลับทั้งชุด)
+        dedupe_state.update({"status": "running", "threshold": threshold, "faces": len(ids), "blocks": 0, "done": 0,
+                             "clusters": [], "started": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                             "finished": None, "message": ""})
+        def on_progress(done, total):
+            dedupe_state.update({"done": done, "blocks": total})
+        clusters = dedupe.find_duplicates(matrix, ids, names, threshold, progress=on_progress)
+        dedupe_state.update({"status": "done", "clusters": clusters, "finished": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                             "message": f"พบ {len(clusters)} กลุ่มที่สงสัยว่าซ้ำ"})
+    except Exception as e:
+        print(f"Dedupe Error: {e}")
+        dedupe_state.update({"status": "error", "message": str(e)})
+    finally:
+        dedupe_lock.release()
+
+@app.post("/api/system/duplicates", dependencies=[Depends(require_recognition)])
+async def start_dedupe(threshold: Optional[float] = Form(None), username: str = Depends(verify_admin)):
+    """เริ่มงานตรวจหน้าซ้ำทั้งฐานข้อมูล (ทำงานเบื้องหลัง ดูผลที่ GET /api/system/duplicates)"""
+    if dedupe_lock.locked():
+        return {"status": "error", "message": "มีงานตรวจหน้าซ้ำกำลังทำงานอยู่"}
+    scheduler.admit("enroll")
+    threading.Thread(target=run_dedupe_job, args=(threshold or duplicate_threshold(),), daemon=True).start()
+    return {"status": "success", "message": f"เริ่มตรวจ {len(known_ids)} ใบหน้า"}
+
+@app.get("/api/system/duplicates")
+async def dedupe_status(username: str = Depends(verify_admin)):
+    return dedupe_state
+
+@app.post("/api/system/capture")
+async def set_capture(enabled: bool = Form(...), sample: Optional[float] = Form(None), username: str = Depends(verify_admin)):
+    """เปิด/ปิดการบันทึกคำขอสแกนสำหรับ replay_capture.py (ไม่ต้อง restart Server)
+
+    ⚠️ ข้อมูลส่วนบุคคล: ไฟล์ capture เก็บรูปใบหน้าเต็มทุกคำขอที่สุ่มได้ คู่กับรหัส/ชื่อพนักงานที่จดจำได้ IP และ Kiosk
+    - เปิดเฉพาะช่วงเก็บข้อมูลทดสอบ แล้วปิดทันที (ไม่มีการปิดเองหรือหมดอายุ)
+    - ไฟล์อยู่ที่ CAPTURE_FILE (+ .1) ในเครื่อง Server เท่านั้น ขนาดรวมไม่เกิน CAPTURE_MAX_MB (ข้อมูลเก่าถูกเขียนทับตอนหมุนไฟล์)
+    - งานลบรูปหลักฐานตาม KEEP_IMAGE_DAYS ไม่ลบไฟล์นี้ และการปิดก็ไม่ลบไฟล์ ต้องลบเองเมื่อเล่นซ้ำเสร็จ
+    - ห้ามคัดลอกออกนอกเครื่องหรือแนบในรายงานปัญหา ใช้ได้ตามวัตถุประสงค์ที่แจ้งพนักงานไว้เท่านั้น"""
+    recorder.configure(enabled, sample)
+    return {"status": "success", **recorder.snapshot()}
+
 # --- SETTINGS: ROLES & DEPARTMENTS ---
 
 @app.get("/api/roles")
@@ -516,6 +1452,10 @@ async def delete_department(dep_name: str):
 # --- REPORT API (Updated for Department) ---
 @app.get("/api/report/daily")
 async def get_daily_report(date: str, role: str = "all"):
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="รูปแบบวันที่ต้องเป็น YYYY-MM-DD")
     conn = get_db_conn()
     if not conn: return []
     cur = conn.cursor()
@@ -530,17 +1470,15 @@ async def get_daily_report(date: str, role: str = "all"):
     employees = cur.fetchall()
 
     # ... (ส่วนดึง Logs เหมือนเดิม) ...
-    cur.execute("SELECT employee_id, check_time, evidence_image FROM attendance_logs WHERE date(check_time) = ? ORDER BY check_time ASC", (date,))
-    all_logs = cur.fetchall()
+    all_logs = logs_between(cur, date, date)
     
     logs_by_emp = {}
     for log in all_logs:
         eid = log['employee_id']
         if eid not in logs_by_emp: logs_by_emp[eid] = []
-        logs_by_emp[eid].append({"time": log['check_time'], "img": log['evidence_image']})
+        logs_by_emp[eid].append({"time": log['check_time'], "img": resolve_evidence_path(log['evidence_image'], log['check_time'])})
 
-    cur.execute("SELECT employee_id, remark FROM daily_remarks WHERE date_str = ?", (date,))
-    remarks_map = {r['employee_id']: r['remark'] for r in cur.fetchall()}
+    remarks_map = {r['employee_id']: r['remark'] for r in remarks_between(cur, date, date)}
 
     report_data = []
     for emp in employees:
@@ -568,6 +1506,82 @@ async def get_daily_report(date: str, role: str = "all"):
     conn.close()
     return report_data
 
+def next_day(date_str):
+    return (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+def archived_until():
+    """Log ก่อนวันนี้ (YYYY-MM-DD) ถูกย้ายไป archive แล้ว ช่วงที่ใหม่กว่าไม่ต้องเปิดไฟล์ archive"""
+    return get_setting("archived_until", "")
+
+def logs_between(cur, start_date, end_date):
+    """Log ช่วง start_date..end_date (รวมทั้งสองวัน) จากตารางปัจจุบัน + archive ถ้าช่วงนั้นเคยถูกย้ายไปแล้ว
+    แถวจาก archive ไม่มีรูปหลักฐาน (evidence_image ว่าง) และมี archived = True"""
+    cur.execute("SELECT id, employee_id, employee_name, check_time, log_type, status, evidence_image FROM attendance_logs "
+                "WHERE check_time >= ? AND check_time < ? ORDER BY check_time ASC", (start_date, next_day(end_date)))
+    logs = [dict(r, archived=False) for r in cur.fetchall()]
+    if start_date < archived_until():
+        live = {(r['id'], r['check_time']) for r in logs}  # แถวที่ archive แล้วแต่ยังลบไม่ทัน (ระบบดับกลาง batch)
+        old = [dict(r, id=int(r['id']), evidence_image="", archived=True)
+               for r in archive.read_logs(start_date, end_date) if (int(r['id']), r['check_time']) not in live]
+        if old: logs = sorted(old + logs, key=lambda r: r['check_time'])
+    return logs
+
+def remarks_between(cur, start_date, end_date):
+    cur.execute("SELECT date_str, employee_id, remark FROM daily_remarks WHERE date_str >= ? AND date_str <= ?", (start_date, end_date))
+    remarks = {(r['date_str'], r['employee_id']): dict(r) for r in cur.fetchall()}
+    if start_date < archived_until():
+        for r in archive.read_remarks(start_date, end_date):
+            remarks.setdefault((r['date_str'], r['employee_id']), r)
+    return list(remarks.values())
+
+def build_range_report(start, end, role, employee_id):
+    conn = get_db_conn()
+    if not conn: return []
+    try:
+        cur = conn.cursor()
+        sql, params = "SELECT employee_id, name, role, department FROM employees WHERE 1=1", []
+        if role != "all":
+            sql += " AND role = ?"; params.append(role)
+        if employee_id:
+            sql += " AND employee_id = ?"; params.append(employee_id)
+        employees = {e['employee_id']: e for e in cur.execute(sql + " ORDER BY employee_id", params).fetchall()}
+
+        days = {}
+        for log in logs_between(cur, start, end):
+            if log['employee_id'] not in employees: continue
+            t = log['check_time'].split(".")[0]
+            day = days.setdefault((t[:10], log['employee_id']), {"first": t, "last": t, "scans": 0, "archived": False})
+            day["last"] = t
+            day["scans"] += 1
+            day["archived"] = day["archived"] or log['archived']
+        remarks = {(r['date_str'], r['employee_id']): r['remark'] for r in remarks_between(cur, start, end)}
+    finally:
+        conn.close()
+
+    rows = []
+    for (date_str, e_id) in sorted(set(days) | {k for k in remarks if k[1] in employees}):
+        emp, day = employees[e_id], days.get((date_str, e_id))
+        rows.append({
+            "date": date_str, "employee_id": e_id, "name": emp['name'], "role": emp['role'], "department": emp['department'],
+            "time_in": day["first"][11:] if day else "-",
+            "time_out": day["last"][11:] if day and day["scans"] > 1 else "-",
+            "scans": day["scans"] if day else 0, "archived": day["archived"] if day else False,
+            "remark": remarks.get((date_str, e_id), "")
+        })
+    return rows
+
+@app.get("/api/report/range")
+async def get_range_report(start: str, end: str, role: str = "all", employee_id: Optional[str] = None):
+    """สรุปเข้า-ออกรายวันของพนักงานช่วง start..end (YYYY-MM-DD) อ่านข้อมูลเก่าจาก archive ให้อัตโนมัติ"""
+    try:
+        d_start, d_end = datetime.strptime(start, "%Y-%m-%d"), datetime.strptime(end, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="รูปแบบวันที่ต้องเป็น YYYY-MM-DD")
+    if d_end < d_start or (d_end - d_start).days >= REPORT_RANGE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"ช่วงวันที่ไม่ถูกต้อง (สูงสุด {REPORT_RANGE_MAX_DAYS} วัน)")
+    # ช่วงที่อยู่ใน archive ต้องแตกไฟล์ gzip ทำใน threadpool ไม่ให้ขวางการสแกน
+    return await run_in_threadpool(build_range_report, start, end, role, employee_id)
+
 @app.post("/api/report/remark")
 async def update_remark(date: str = Form(...), employee_id: str = Form(...), remark: str = Form("")):
     try:
@@ -605,7 +1619,10 @@ async def system_status():
         "database": {"status": "Unknown", "employees": 0, "logs": 0},
         "storage": {"total": 0, "used": 0, "free": 0, "percent": 0},
         "ai_model": {"status": "Not Loaded", "faces_loaded": 0},
-        "telegram": {"enabled": ENABLE_TELEGRAM, "token_status": "Unknown"}
+        "telegram": {"enabled": ENABLE_TELEGRAM, "token_status": "Unknown"},
+        "cleanup": cleanup_progress,
+        "archive": {"enabled": ARCHIVE_LOGS, "archived_until": archived_until() or None, **archive.summary()},
+        "capture": recorder.snapshot()
     }
 
     # ... (ส่วนเช็ค Database, AI, Storage, Telegram ของเดิม คงไว้เหมือนเดิม) ...
@@ -625,6 +1642,16 @@ async def system_status():
     # 2. เช็ค AI Model
     status["ai_model"]["faces_loaded"] = len(known_names)
     status["ai_model"]["status"] = "Ready" if len(known_names) > 0 else "Idle"
+    status["ai_model"]["model"] = ACTIVE_MODEL
+    status["ai_model"]["threshold"] = THRESHOLD
+    status["reembed"] = reembed_state
+    with scan_cache_lock:
+        st = dict(scan_cache_stats)
+    total = st["hits"] + st["misses"]
+    status["scan_cache"] = {"hits": st["hits"], "misses": st["misses"], "hit_ratio": round(st["hits"] / total, 3) if total else 0.0,
+                            "avg_infer_ms": round(st["infer_ms"], 1), "cpu_saved_sec": round(st["saved_ms"] / 1000, 1),
+                            "ttl": SCAN_CACHE_TTL}
+    status["scheduler"] = scheduler.snapshot()
 
     # 3. เช็ค Disk
     try:
@@ -660,33 +1687,121 @@ async def test_telegram():
     except Exception as e:
         return {"status": "error", "message": str(e)}
     
+def remove_evidence_file(img_path):
+    """ลบไฟล์รูปหลักฐาน 1 ไฟล์ (เฉพาะที่อยู่ใน attendance_images เท่านั้น)"""
+    if not img_path: return False
+    norm = os.path.normpath(img_path)
+    if not norm.startswith("attendance_images" + os.sep): return False
+    try:
+        if os.path.isfile(norm):
+            os.remove(norm)
+            remove_thumbnails(img_path)
+            return True
+    except Exception as e:
+        print(f"Remove Image Error: {e}")
+    return False
+
+def drop_expired_day_dirs(cutoff_date_str):
+    """ลบโฟลเดอร์ attendance_images/YYYY/MM/DD ที่เก่ากว่า cutoff ทั้งโฟลเดอร์ คืนค่าจำนวนไฟล์ที่ลบ"""
+    deleted = 0
+    root = "attendance_images"
+    for y in sorted(os.listdir(root)):
+        y_dir = os.path.join(root, y)
+        if not (y.isdigit() and os.path.isdir(y_dir)) or y > cutoff_date_str[:4]: continue
+        for m in sorted(os.listdir(y_dir)):
+            m_dir = os.path.join(y_dir, m)
+            if not os.path.isdir(m_dir) or f"{y}-{m}" > cutoff_date_str[:7]: continue
+            for d in sorted(os.listdir(m_dir)):
+                d_dir = os.path.join(m_dir, d)
+                if not os.path.isdir(d_dir) or f"{y}-{m}-{d}" >= cutoff_date_str: continue
+                deleted += sum(1 for e in os.scandir(d_dir) if e.is_file())
+                shutil.rmtree(d_dir, ignore_errors=True)
+                for size in THUMB_SIZES:
+                    shutil.rmtree(thumb_path_for(f"attendance_images/{y}/{m}/{d}", size), ignore_errors=True)
+                    thumb_cache_forget(thumb_path_for(f"attendance_images/{y}/{m}/{d}", size))
+                time.sleep(CLEANUP_BATCH_PAUSE)
+            if not os.listdir(m_dir): os.rmdir(m_dir)
+        if not os.listdir(y_dir): os.rmdir(y_dir)
+    return deleted
+
+def purge_old_logs(cutoff_date_str, include_remarks=False):
+    """ลบ Log และรูปหลักฐานที่เก่ากว่า cutoff ทีละ batch
+    - หา record ด้วย index ของ check_time แทนการไล่ os.listdir ทั้งโฟลเดอร์
+    - ARCHIVE_LOGS: เขียนแถวลงไฟล์ archive (fsync แล้ว) ก่อนลบออกจากตาราง ประวัติยังเรียกดูได้จาก /api/report/range
+    - ลบไฟล์ก่อนแล้วค่อยลบแถว ถ้าระบบดับกลางทาง รอบถัดไปจะเก็บตกได้ (ไม่มีไฟล์กำพร้า)
+    - พักระหว่าง batch ตาม CLEANUP_BATCH_PAUSE เพื่อไม่ให้ disk ทำงานหนักเกินไป
+    คืนค่า (จำนวน log, จำนวนไฟล์) หรือ None ถ้ามีงานลบกำลังทำอยู่แล้ว"""
+    if not cleanup_lock.acquire(blocking=False):
+        return None
+
+    cleanup_progress.update({
+        "running": True, "cutoff": cutoff_date_str, "deleted_logs": 0, "archived_logs": 0, "deleted_files": 0, "batches": 0,
+        "started": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "finished": None, "error": None
+    })
+    try:
+        while True:
+            conn = get_db_conn()
+            cur = conn.cursor()
+            cur.execute("SELECT id, employee_id, employee_name, check_time, log_type, status, client_ip, evidence_image "
+                        "FROM attendance_logs WHERE check_time < ? ORDER BY check_time LIMIT ?", (cutoff_date_str, CLEANUP_BATCH_SIZE))
+            rows = cur.fetchall()
+            if not rows:
+                conn.close()
+                break
+            if ARCHIVE_LOGS:
+                cleanup_progress["archived_logs"] += archive.archive_logs(rows)
+
+            for r in rows:
+                img = r['evidence_image']
+                # รูปในโฟลเดอร์ตามวัน จะถูกลบยกโฟลเดอร์ด้านล่าง
+                if img and img.count("/") > 1: continue
+                # รูปเดิมอาจถูกเขียนทับโดย log ที่ใหม่กว่า (ชื่อไฟล์ซ้ำ) -> เก็บไว้ถ้ายังมีคนอ้างอิง
+                cur.execute("SELECT 1 FROM attendance_logs WHERE evidence_image = ? AND check_time >= ? LIMIT 1", (img, cutoff_date_str))
+                if cur.fetchone(): continue
+                if remove_evidence_file(img):
+                    cleanup_progress["deleted_files"] += 1
+
+            cur.executemany("DELETE FROM attendance_logs WHERE id = ?", [(r['id'],) for r in rows])
+            conn.commit()
+            conn.close()
+
+            cleanup_progress["deleted_logs"] += len(rows)
+            cleanup_progress["batches"] += 1
+            print(f">>> 🧹 Cleanup batch {cleanup_progress['batches']}: logs={cleanup_progress['deleted_logs']}, archived={cleanup_progress['archived_logs']}, files={cleanup_progress['deleted_files']}")
+            time.sleep(CLEANUP_BATCH_PAUSE)
+
+        # ลบยกโฟลเดอร์ของวันที่หมดอายุ (ไม่ต้องไล่ทีละไฟล์)
+        cleanup_progress["deleted_files"] += drop_expired_day_dirs(cutoff_date_str)
+
+        conn = get_db_conn()
+        cur = conn.cursor()
+        if include_remarks:
+            if ARCHIVE_LOGS:
+                cur.execute("SELECT date_str, employee_id, remark FROM daily_remarks WHERE date_str < ?", (cutoff_date_str,))
+                archive.archive_remarks(cur.fetchall())
+            cur.execute("DELETE FROM daily_remarks WHERE date_str < ?", (cutoff_date_str,))
+        if ARCHIVE_LOGS and cutoff_date_str > archived_until():
+            cur.execute("INSERT OR REPLACE INTO app_settings (key, value) VALUES ('archived_until', ?)", (cutoff_date_str,))
+        conn.commit()
+        conn.close()
+
+        return cleanup_progress["deleted_logs"], cleanup_progress["deleted_files"]
+    except Exception as e:
+        cleanup_progress["error"] = str(e)
+        raise
+    finally:
+        cleanup_progress["running"] = False
+        cleanup_progress["finished"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cleanup_lock.release()
+
 def cleanup_old_data():
     """ทำงานเบื้องหลัง: ลบรูปและ Log ที่เก่ากว่ากำหนด"""
     while True:
         if KEEP_IMAGE_DAYS > 0:
             print(f">>> 🧹 Running Cleanup Task (Keep {KEEP_IMAGE_DAYS} days)...")
             try:
-                cutoff_time = datetime.now().timestamp() - (KEEP_IMAGE_DAYS * 86400)
-                
-                # 1. ลบไฟล์รูปภาพ
-                folder = "attendance_images"
-                if os.path.exists(folder):
-                    for f in os.listdir(folder):
-                        f_path = os.path.join(folder, f)
-                        # เช็คว่าไฟล์เก่ากว่า cutoff หรือไม่
-                        if os.path.isfile(f_path) and os.path.getmtime(f_path) < cutoff_time:
-                            os.remove(f_path)
-                            print(f"Deleted old image: {f}")
-                
-                # 2. (Optional) ลบข้อมูลใน Database ด้วย
-                conn = get_db_conn()
-                cur = conn.cursor()
-                # คำนวณวันที่ย้อนหลัง
                 date_cutoff = (datetime.now() - timedelta(days=KEEP_IMAGE_DAYS)).strftime("%Y-%m-%d")
-                cur.execute("DELETE FROM attendance_logs WHERE date(check_time) < ?", (date_cutoff,))
-                conn.commit()
-                conn.close()
-                
+                purge_old_logs(date_cutoff)
             except Exception as e:
                 print(f"Cleanup Error: {e}")
         
@@ -704,21 +1819,29 @@ async def reset_attendance_data(username: str = Depends(verify_admin)):
         cur.execute("DELETE FROM daily_remarks")
         # รีเซ็ตตัวนับ ID ให้กลับไปเริ่มที่ 1 ใหม่
         cur.execute("DELETE FROM sqlite_sequence WHERE name='attendance_logs'")
+        cur.execute("DELETE FROM app_settings WHERE key = 'archived_until'")
         conn.commit()
         conn.close()
+        archived = archive.set_aside()  # ID เริ่มใหม่ที่ 1 archive เดิมจะปนกับ Log ใหม่ ย้ายแยกไว้แทนการลบ
 
-        # 2. ลบรูปภาพสแกนทั้งหมดในโฟลเดอร์ attendance_images
+        # 2. ลบรูปภาพสแกนทั้งหมดในโฟลเดอร์ attendance_images (รวมโฟลเดอร์ย่อยรายวัน)
         folder = "attendance_images"
         if os.path.exists(folder):
-            for filename in os.listdir(folder):
-                file_path = os.path.join(folder, filename)
+            for entry in os.scandir(folder):
                 try:
-                    if os.path.isfile(file_path):
-                        os.unlink(file_path)
+                    if entry.is_dir():
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    else:
+                        os.unlink(entry.path)
                 except Exception as e:
                     pass
+        for size in THUMB_SIZES:
+            shutil.rmtree(thumb_path_for("attendance_images", size), ignore_errors=True)
+            thumb_cache_forget(thumb_path_for("attendance_images", size))
 
-        return {"status": "success", "message": "ล้างประวัติและรูปสแกนทั้งหมดเรียบร้อยแล้ว"}
+        message = "ล้างประวัติและรูปสแกนทั้งหมดเรียบร้อยแล้ว"
+        if archived: message += f" (ประวัติใน archive ย้ายไปเก็บที่ {archived})"
+        return {"status": "success", "message": message}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -726,43 +1849,24 @@ async def reset_attendance_data(username: str = Depends(verify_admin)):
 async def cleanup_old_data_api(days: int = 45, username: str = Depends(verify_admin)):
     """ล้างข้อมูลประวัติและรูปภาพที่เก่ากว่า x วัน (ค่าเริ่มต้น 45 วัน)"""
     try:
-        # คำนวณหาวันที่และเวลาตัดยอด (ย้อนหลัง 45 วัน)
-        cutoff_datetime = datetime.now() - timedelta(days=days)
-        cutoff_date_str = cutoff_datetime.strftime("%Y-%m-%d")
-        cutoff_timestamp = cutoff_datetime.timestamp()
-
-        # 1. ลบประวัติจาก Database ที่เก่ากว่าวันที่ตัดยอด
-        conn = get_db_conn()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM attendance_logs WHERE date(check_time) < ?", (cutoff_date_str,))
-        deleted_logs = cur.rowcount  # นับจำนวนแถวที่ถูกลบ
-        cur.execute("DELETE FROM daily_remarks WHERE date_str < ?", (cutoff_date_str,))
-        conn.commit()
-        conn.close()
+        cutoff_date_str = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
 
-        # 2. ลบไฟล์รูปภาพที่เก่ากว่าเวลาตัดยอด
-        folder = "attendance_images"
-        deleted_files = 0
-        if os.path.exists(folder):
-            for filename in os.listdir(folder):
-                file_path = os.path.join(folder, filename)
-                try:
-                    if os.path.isfile(file_path):
-                        # เช็คว่าไฟล์นี้ถูกสร้างก่อน cutoff_timestamp หรือไม่
-                        if os.path.getmtime(file_path) < cutoff_timestamp:
-                            os.unlink(file_path)
-                            deleted_files += 1
-                except Exception as e:
-                    pass
+        # ทำงานใน threadpool เพื่อไม่ให้ขวางการสแกน (ดูความคืบหน้าได้จาก /api/system/status)
+        result = await run_in_threadpool(purge_old_logs, cutoff_date_str, True)
+        if result is None:
+            return {"status": "error", "message": "มีงานล้างข้อมูลกำลังทำงานอยู่ กรุณารอสักครู่"}
+        deleted_logs, deleted_files = result
 
         return {
             "status": "success", 
-            "message": f"ลบประวัติไป {deleted_logs} รายการ และรูปภาพ {deleted_files} รูป เรียบร้อยแล้ว"
+            "message": f"ลบประวัติไป {deleted_logs} รายการ (เก็บไว้ใน archive {cleanup_progress['archived_logs']} รายการ) และรูปภาพ {deleted_files} รูป เรียบร้อยแล้ว"
         }
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 if __name__ == "__main__":
-    print(f">>> 🚀 Starting Server on Port {SERVER_PORT}...")
-    threading.Thread(target=cleanup_old_data, daemon=True).start()
+    import uvicorn
+    print(f">>> 🚀 Starting Server on Port {SERVER_PORT} (mode: {APP_MODE})...")
+    if RECOGNITION_ENABLED:
+        threading.Thread(target=cleanup_old_data, daemon=True).start()
     uvicorn.run(app, host=SERVER_HOST, port=SERVER_PORT)
\ No newline at end of file
@@ -0,0 +1,77 @@
+"""ทดสอบ API ด้วย TestClient: ฐานข้อมูล/โฟลเดอร์ชั่วคราวต่อเทสต์ และใช้ deepface ปลอม (ไม่โหลดโมเดลจริง)
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+import json
+import types
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.update({"APP_MODE": "reports", "EMBED_ENGINE": "deepface", "ENABLE_TELEGRAM": "False", "CAPTURE_ENABLED": "False",
+                   "ADMIN_USER": "admin", "ADMIN_PASS": "test-pass"})
+os.chdir(tempfile.mkdtemp(prefix="attendance_test_"))  # server_api สร้างโฟลเดอร์รูปตอน import
+
+class FakeDeepFace:
+    """แทน deepface.DeepFace: represent คืนใบหน้าตาม faces ที่เทสต์ตั้งไว้ (ไม่สนเนื้อภาพ) และนับจำนวนครั้งที่ถูกเรียก"""
+    faces = []
+    calls = 0
+
+    @staticmethod
+    def build_model(model_name):
+        return None
+
+    @classmethod
+    def represent(cls, img_path, model_name=None, enforce_detection=False, detector_backend="opencv"):
+        cls.calls += 1
+        return [dict(f) for f in cls.faces]
+
+def fake_face(embedding, x=0, y=0, w=100, h=100):
+    """ใบหน้า 1 รายการในรูปแบบผลของ DeepFace.represent"""
+    return {"embedding": [float(v) for v in embedding], "facial_area": {"x": x, "y": y, "w": w, "h": h}}
+
+def enroll(server, emp_id, name, embedding):
+    """เพิ่มพนักงานพร้อม embedding ลงฐานข้อมูลทดสอบ แล้วโหลด gallery ใหม่"""
+    conn = server.get_db_conn()
+    conn.execute("INSERT INTO employees (employee_id, name, role, embedding) VALUES (?, ?, 'staff', ?)",
+                 (emp_id, name, json.dumps([float(v) for v in embedding])))
+    conn.commit(); conn.close()
+    server.load_faces()
+
+sys.modules["deepface"] = types.SimpleNamespace(DeepFace=FakeDeepFace, __version__="test")
+
+import archive
+import server_api
+from fastapi.testclient import TestClient
+
+AUTH = ("admin", "test-pass")
+
+@pytest.fixture
+def fake_deepface():
+    FakeDeepFace.faces, FakeDeepFace.calls = [], 0
+    yield FakeDeepFace
+    FakeDeepFace.faces = []
+
+@pytest.fixture
+def server(tmp_path, monkeypatch, fake_deepface):
+    """server_api ที่ใช้ฐานข้อมูลว่างใน tmp_path (ตารางพร้อม ยังไม่มีพนักงาน)"""
+    monkeypatch.chdir(tmp_path)
+    for folder in ("images", "attendance_images", "thumbnails"): os.makedirs(folder)  # server_api สร้างตอน import (cwd เดิม)
+    monkeypatch.setattr(server_api, "DB_FILE", str(tmp_path / "attendance.db"))
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    monkeypatch.setattr(server_api, "RECOGNITION_ENABLED", False)  # init_system ไม่โหลดโมเดล/ไม่เริ่ม thread
+    server_api.init_system()
+    monkeypatch.setattr(server_api, "RECOGNITION_ENABLED", True)
+    server_api.load_faces()  # gallery ว่าง
+    server_api.scan_cache.clear()
+    monkeypatch.setattr(server_api, "thumb_index", None)  # index รูปย่อเป็น path ในโฟลเดอร์ของเทสต์ก่อน
+    archive._read_month.cache_clear()
+    yield server_api
+    archive._read_month.cache_clear()
+
+@pytest.fixture
+def client(server):
+    return TestClient(server.app)
@@ -0,0 +1,77 @@
+import csv
+import cv2
+import numpy as np
+import pytest
+import bulk_import
+from conftest import AUTH, enroll, fake_face
+
+def one_hot(i, dim=512, noise=0.0):
+    v = np.zeros(dim, np.float32)
+    v[i] = 1.0
+    v[(i + 7) % dim] = noise
+    return [float(x) for x in v]
+
+PHOTO = cv2.imencode(".jpg", np.full((160, 160, 3), 128, np.uint8))[1].tobytes()
+
+@pytest.fixture
+def gallery(server):
+    enroll(server, "E1", "Alice", one_hot(0))
+    return server
+
+def test_duplicate_rows_against_gallery_and_within_file(gallery):
+    rows = [{"employee_id": e, "name": n} for e, n in
+            [("E1", "Alice"), ("N1", "Alice again"), ("N2", "Carol"), ("N3", "Carol again"), ("N4", "Dave")]]
+    embs = [one_hot(0), one_hot(0, noise=0.1), one_hot(2), one_hot(2, noise=0.1), one_hot(3)]
+    found = bulk_import.duplicate_rows(rows, embs, gallery.DB_FILE, gallery.ACTIVE_MODEL, threshold=0.3)
+    assert set(found) == {"N1", "N3"}  # E1 นำเข้าซ้ำเพื่อเปลี่ยนรูปไม่นับ
+    assert "E1 Alice" in found["N1"] and "N2 Carol" in found["N3"]
+
+@pytest.fixture
+def job(gallery, tmp_path, monkeypatch):
+    """งานนำเข้า 3 คน: N1 หน้าซ้ำกับ E1 ในฐานข้อมูล, N2 ปกติ, N3 หน้าซ้ำกับ N2 ในไฟล์เดียวกัน"""
+    photos = tmp_path / "photos"
+    photos.mkdir()
+    embeddings = {"N1": one_hot(0, noise=0.1), "N2": one_hot(2), "N3": one_hot(2, noise=0.1)}
+    for emp_id in embeddings: (photos / f"{emp_id}.jpg").write_bytes(PHOTO)
+    staff = tmp_path / "staff.csv"
+    with open(staff, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["employee_id", "name", "role", "department"])
+        for emp_id in embeddings: w.writerow([emp_id, f"Name {emp_id}", "staff", "HR"])
+    def fake_embed(items, model_name, workers=None):
+        for emp_id, _ in items: yield emp_id, embeddings[emp_id], None
+    monkeypatch.setattr(bulk_import, "embed_files_parallel", fake_embed)
+    _, job_dir = bulk_import.prepare_job(str(photos), str(staff), gallery.ACTIVE_MODEL)
+    return job_dir
+
+def employee_ids(server):
+    conn = server.get_db_conn()
+    ids = sorted(r[0] for r in conn.execute("SELECT employee_id FROM employees"))
+    conn.close()
+    return ids
+
+def test_bulk_import_skips_duplicates(gallery, job):
+    summary = bulk_import.run_job(job, gallery.DB_FILE)
+    assert summary["employee_ids"] == ["N2"]
+    assert sorted(f["employee_id"] for f in summary["failures"]) == ["N1", "N3"]
+    assert employee_ids(gallery) == ["E1", "N2"]
+    with open(f"{job}/failures.csv", encoding="utf-8-sig") as f:
+        assert sorted(r["employee_id"] for r in csv.DictReader(f)) == ["N1", "N3"]
+
+def test_bulk_import_force_imports_duplicates(gallery, job):
+    summary = bulk_import.run_job(job, gallery.DB_FILE, force=True)
+    assert sorted(summary["employee_ids"]) == ["N1", "N2", "N3"] and summary["failures"] == []
+    assert employee_ids(gallery) == ["E1", "N1", "N2", "N3"]
+
+def test_register_duplicate_face_needs_force(gallery, client, fake_deepface):
+    fake_deepface.faces = [fake_face(one_hot(0, noise=0.1))]
+    form = {"name": "Alice again", "emp_id": "N1", "role": "staff", "department": "HR"}
+    upload = lambda: {"file": ("face.jpg", PHOTO, "image/jpeg")}
+
+    r = client.post("/api/register", data=form, files=upload(), auth=AUTH).json()
+    assert r["status"] == "duplicate" and r["matches"][0]["employee_id"] == "E1"
+    assert employee_ids(gallery) == ["E1"]
+
+    r = client.post("/api/register", data={**form, "force": "true"}, files=upload(), auth=AUTH).json()
+    assert r["status"] == "success"
+    assert employee_ids(gallery) == ["E1", "N1"]
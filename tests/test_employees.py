@@ -0,0 +1,46 @@
+import pytest
+from conftest import AUTH
+
+STAFF = [("E001", "สมใจ ใจดี", "staff", "HR"), ("E002", "Alice Smith", "staff", "IT"),
+         ("E003", "Bob Jones", "manager", "IT"), ("E004", "มานี มีนา", "staff", "HR"),
+         ("E005", "Carol Lee", "staff", "IT")]
+
+@pytest.fixture
+def staff(server, client):
+    conn = server.get_db_conn()
+    conn.executemany("INSERT INTO employees (employee_id, name, role, department) VALUES (?, ?, ?, ?)", STAFF)
+    conn.commit(); conn.close()
+    return lambda **params: client.get("/api/employees", params=params, auth=AUTH).json()
+
+def test_keyset_pages_cover_everyone_once(staff):
+    pages, cursor = [], ""
+    while True:
+        page = staff(limit=2, cursor=cursor)
+        pages.append(page)
+        if not page["next_cursor"]: break
+        cursor = page["next_cursor"]
+    assert [len(p["items"]) for p in pages] == [2, 2, 1]
+    assert [e["employee_id"] for p in pages for e in p["items"]] == [s[0] for s in STAFF]
+    assert pages[0]["total"] == 5 and "total" not in pages[1]
+
+def test_pages_keep_filters(staff):
+    first = staff(limit=1, department="IT")
+    second = staff(limit=1, department="IT", cursor=first["next_cursor"])
+    assert first["total"] == 3 and [first["items"][0]["employee_id"], second["items"][0]["employee_id"]] == ["E002", "E003"]
+
+def test_search_matches_inside_thai_names(server, staff):
+    if server.EMPLOYEE_FTS != "trigram": pytest.skip(f"SQLite นี้ไม่มี FTS5 trigram ({server.EMPLOYEE_FTS})")
+    assert [e["employee_id"] for e in staff(q="ใจดี")] == ["E001"]
+    assert [e["employee_id"] for e in staff(q="mith")] == ["E002"]
+
+def test_short_query_matches_prefix(staff):
+    assert [e["employee_id"] for e in staff(q="E00")] == [s[0] for s in STAFF]
+    assert [e["employee_id"] for e in staff(q="Bo")] == ["E003"]
+
+def test_search_follows_edits(server, staff):
+    if not server.EMPLOYEE_FTS: pytest.skip("SQLite นี้ไม่มี FTS5")
+    conn = server.get_db_conn()
+    conn.execute("UPDATE employees SET name = 'Dana Smith' WHERE employee_id = 'E005'")
+    conn.execute("DELETE FROM employees WHERE employee_id = 'E002'")
+    conn.commit(); conn.close()
+    assert [e["employee_id"] for e in staff(q="Smith")] == ["E005"]
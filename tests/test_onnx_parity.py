@@ -0,0 +1,82 @@
+"""ONNX ใช้แทน DeepFace กับ gallery เดิมได้เฉพาะไฟล์ที่ bench_engine.py compare ตรวจผ่านแล้ว
+
+เทสต์ parity จริงต้องมี deepface + onnxruntime, weights ของ Facenet512 (~/.deepface หรือ $DEEPFACE_HOME),
+ไฟล์ ONNX (ONNX_MODEL_PATH) และโฟลเดอร์รูปหน้า (PARITY_IMAGES ค่าเริ่มต้น images/) ถ้าขาดอย่างใดจะ skip
+"""
+import os
+import sys
+import json
+import shutil
+import subprocess
+from importlib import metadata
+import pytest
+import face_engine
+from conftest import ROOT
+
+MODEL_PATH = os.getenv("ONNX_MODEL_PATH", os.path.join(ROOT, "models", "facenet512_int8.onnx"))
+IMAGES = os.getenv("PARITY_IMAGES", os.path.join(ROOT, "images"))
+DEEPFACE_GALLERY = "Facenet512/deepface-0.0.93"
+
+@pytest.fixture
+def onnx_file(tmp_path, monkeypatch):
+    path = tmp_path / "facenet512_int8.onnx"
+    path.write_bytes(b"onnx-model")
+    monkeypatch.setattr(face_engine, "EMBED_ENGINE", "onnx")
+    monkeypatch.setattr(face_engine, "ONNX_MODEL_PATH", str(path))
+    monkeypatch.setattr(face_engine, "_engines", {})
+    monkeypatch.setattr(face_engine, "_gallery_signatures", {})
+    face_engine.set_gallery_signature(DEEPFACE_GALLERY)
+    return path
+
+def write_record(path, **fields):
+    st = os.stat(path)
+    record = {"reference": DEEPFACE_GALLERY, "sha256": face_engine.file_sha256(str(path), st.st_mtime_ns, st.st_size),
+              "passed": True, **fields}
+    with open(face_engine.parity_path(str(path)), "w", encoding="utf-8") as f: json.dump(record, f)
+
+def test_onnx_is_not_used_on_deepface_gallery_without_parity_record(onnx_file):
+    assert isinstance(face_engine.get_engine("Facenet512"), face_engine.DeepFaceEngine)
+
+def test_onnx_is_used_after_passing_parity(onnx_file):
+    write_record(onnx_file)
+    assert isinstance(face_engine.get_engine("Facenet512"), face_engine.OnnxEngine)
+
+@pytest.mark.parametrize("change", ["failed", "model_replaced", "other_reference"])
+def test_stale_or_failed_parity_record_is_ignored(onnx_file, change):
+    if change == "failed":
+        write_record(onnx_file, passed=False)
+    elif change == "other_reference":
+        write_record(onnx_file, reference="ArcFace/deepface-0.0.93")
+    else:
+        write_record(onnx_file)
+        onnx_file.write_bytes(b"re-exported model")
+    assert isinstance(face_engine.get_engine("Facenet512"), face_engine.DeepFaceEngine)
+
+def installed(name):
+    try:
+        return bool(metadata.version(name))  # conftest แทน deepface ด้วย module ปลอม จึงตรวจจาก metadata
+    except metadata.PackageNotFoundError:
+        return False
+
+def weights_file():
+    home = os.getenv("DEEPFACE_HOME", os.path.expanduser("~"))
+    return os.path.join(home, ".deepface", "weights", "facenet512_weights.h5")
+
+def test_onnx_matches_deepface_with_real_weights(tmp_path):
+    for package in ("deepface", "onnxruntime"):
+        if not installed(package): pytest.skip(f"ไม่ได้ติดตั้ง {package}")
+    if not os.path.exists(weights_file()): pytest.skip(f"ไม่มี weights {weights_file()}")
+    if not os.path.exists(MODEL_PATH): pytest.skip(f"ไม่มีไฟล์ ONNX {MODEL_PATH} (สร้างด้วย bench_engine.py export)")
+    if not os.path.isdir(IMAGES) or len(os.listdir(IMAGES)) < 2: pytest.skip(f"ไม่มีรูปหน้าใน {IMAGES}")
+
+    model = tmp_path / os.path.basename(MODEL_PATH)  # ตรวจสำเนา ไม่เขียนผลทับข้างไฟล์จริง
+    shutil.copyfile(MODEL_PATH, model)
+    env = {k: v for k, v in os.environ.items() if k not in ("APP_MODE", "EMBED_ENGINE")}
+    proc = subprocess.run([sys.executable, "bench_engine.py", "compare", IMAGES, "--onnx", str(model), "--limit", "50"],
+                          cwd=ROOT, env=env, capture_output=True, text=True, timeout=1800)
+    print(proc.stdout)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    with open(face_engine.parity_path(str(model)), encoding="utf-8") as f:
+        record = json.load(f)
+    assert record["passed"] and record["min_cos"] >= 0.98 and record["agreement"] >= 0.99
+    assert face_engine.parity_record(str(model), record["reference"])
@@ -0,0 +1,38 @@
+import os
+from conftest import AUTH
+
+def add_log(server, emp_id, check_time):
+    conn = server.get_db_conn()
+    conn.execute("INSERT INTO attendance_logs (employee_id, employee_name, check_time, evidence_image) VALUES (?, ?, ?, '')",
+                 (emp_id, emp_id, check_time))
+    conn.commit(); conn.close()
+
+def test_daily_report_rejects_malformed_date(client):
+    assert client.get("/api/report/daily", params={"date": "bad"}).status_code == 400
+    assert client.get("/api/report/daily", params={"date": "2026-02-30"}).status_code == 400
+    assert client.get("/api/report/daily", params={"date": "2026-01-05"}).json() == []
+
+def test_range_report_merges_archive_without_duplicates(server, client):
+    conn = server.get_db_conn()
+    conn.execute("INSERT INTO employees (employee_id, name, role) VALUES ('E1', 'A', 'staff')")
+    conn.execute("INSERT INTO app_settings (key, value) VALUES ('archived_until', '2026-02-01')")
+    conn.commit(); conn.close()
+    archived = {"id": 1, "employee_id": "E1", "employee_name": "A", "check_time": "2026-01-05 08:00:00",
+                "log_type": "SCAN", "status": "-", "client_ip": "", "evidence_image": ""}
+    server.archive.archive_logs([archived, archived])  # เขียนซ้ำ (ระบบดับก่อนลบแถว) ต้องนับครั้งเดียว
+    add_log(server, "E1", "2026-01-05 17:00:00")
+
+    rows = client.get("/api/report/range", params={"start": "2026-01-05", "end": "2026-01-05"}).json()
+    assert [(r["time_in"], r["time_out"], r["scans"], r["archived"]) for r in rows] == [("08:00:00", "17:00:00", 2, True)]
+
+def test_reset_keeps_archive_history(server, client, tmp_path):
+    server.archive.archive_logs([{"id": 1, "employee_id": "E1", "employee_name": "A", "check_time": "2026-01-05 08:00:00",
+                                  "log_type": "SCAN", "status": "-", "client_ip": "", "evidence_image": ""}])
+    add_log(server, "E1", "2026-03-01 08:00:00")
+
+    reply = client.delete("/api/system/reset-attendance", auth=AUTH).json()
+    assert reply["status"] == "success"
+    assert not os.path.exists(server.archive.ARCHIVE_DIR)
+    kept = [d for d in os.listdir(tmp_path) if d.startswith("archive_reset_")]
+    assert len(kept) == 1 and os.listdir(tmp_path / kept[0]) == ["attendance_2026-01.csv.gz"]
+    assert server.get_db_conn().execute("SELECT COUNT(*) FROM attendance_logs").fetchone()[0] == 0
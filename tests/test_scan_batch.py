@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+import cv2
+import numpy as np
+import pytest
+from conftest import enroll, fake_face
+
+def one_hot(i, dim=512):
+    v = np.zeros(dim, np.float32)
+    v[i] = 1.0
+    return v
+
+FRAME = cv2.imencode(".jpg", np.full((240, 320, 3), 128, np.uint8))[1].tobytes()
+
+@pytest.fixture
+def send(server, client, fake_deepface):
+    enroll(server, "E1", "Alice", one_hot(0))
+    fake_deepface.faces = [fake_face(one_hot(0))]
+    def post(stamps, frames=None):
+        files = [("files", (f"{i}.jpg", FRAME, "image/jpeg")) for i in range(frames or len(stamps))]
+        return client.post("/scan/batch", files=files, data={"captured_at": stamps})
+    return post
+
+def logged_times(server):
+    conn = server.get_db_conn()
+    rows = conn.execute("SELECT check_time, log_type FROM attendance_logs ORDER BY check_time").fetchall()
+    conn.close()
+    return [(datetime.fromisoformat(str(t)), kind) for t, kind in rows]
+
+def test_bad_or_stale_timestamps_are_not_recorded(server, send):
+    now = datetime.now()
+    stamps = [(now - timedelta(hours=1)).isoformat(), "yesterday", (now - timedelta(hours=100)).isoformat(), ""]
+    r = send(stamps)
+    assert r.status_code == 200
+    results = r.json()["results"]
+    assert [x["status"] for x in results] == ["OK", "ERROR", "ERROR", "ERROR"]
+    assert results[0]["faces"][0]["recorded"] is True
+    assert "captured_at" in results[1]["name"] and f"{server.SCAN_BATCH_MAX_AGE_HOURS:g}" in results[2]["name"] and "captured_at" in results[3]["name"]
+    [(when, kind)] = logged_times(server)  # ไม่เดาเวลาเป็นตอนนี้ให้ภาพที่อ่านเวลาไม่ได้
+    assert kind == "OFFLINE" and abs(when - (now - timedelta(hours=1))) < timedelta(seconds=1)
+
+def test_future_timestamp_is_clamped_to_now(server, send):
+    before = datetime.now()
+    r = send([(before + timedelta(days=1)).isoformat()])
+    assert r.json()["results"][0]["status"] == "OK"
+    [(when, _)] = logged_times(server)
+    assert before <= when <= datetime.now()
+
+def test_count_mismatch_is_rejected(send):
+    assert send([datetime.now().isoformat()], frames=2).status_code == 400
@@ -0,0 +1,54 @@
+import cv2
+import numpy as np
+import pytest
+from conftest import enroll, fake_face
+
+BOX = (200, 150, 120, 120)
+
+def one_hot(i, dim=512):
+    v = np.zeros(dim, np.float32)
+    v[i] = 1.0
+    return v
+
+def jpeg(frame):
+    return cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes()
+
+def scene(seed=0):
+    """ฉากนิ่ง 640x480 (ลายสุ่มแบบเบลอ ให้ JPEG เข้ารหัสแล้วค่าใกล้เดิม)"""
+    noise = np.random.default_rng(seed).integers(0, 256, (48, 64), dtype=np.uint8)
+    return cv2.cvtColor(cv2.resize(noise, (640, 480), interpolation=cv2.INTER_CUBIC), cv2.COLOR_GRAY2BGR)
+
+@pytest.fixture
+def kiosk(server, fake_deepface, monkeypatch):
+    monkeypatch.setattr(server, "SCAN_CACHE_TTL", 60.0)
+    enroll(server, "E1", "Alice", one_hot(0))
+    enroll(server, "E2", "Bob", one_hot(1))
+    return lambda frame: server.recognize_jpeg(jpeg(frame), "10.0.0.5", "kiosk-1")
+
+def test_repeated_frame_is_cached_and_not_recorded(kiosk, fake_deepface):
+    fake_deepface.faces = [fake_face(one_hot(0), *BOX)]
+    first = kiosk(scene())
+    assert first["status"] == "OK" and first["faces"][0]["recorded"] is True and "cached" not in first
+
+    again = kiosk(scene())
+    assert fake_deepface.calls == 1  # ไม่ได้รัน AI ซ้ำ
+    assert again["cached"] is True and again["name"] == "Alice"
+    assert [f["recorded"] for f in again["faces"]] == [False]
+    assert first["faces"][0]["recorded"] is True  # ผลที่เก็บใน cache ไม่ถูกแก้
+
+def test_swapped_face_in_same_box_misses_cache(kiosk, fake_deepface):
+    fake_deepface.faces = [fake_face(one_hot(0), *BOX)]
+    before = scene()
+    kiosk(before)
+
+    # อีกคนยืนตรงกรอบเดิม ส่วนอื่นของภาพไม่เปลี่ยน
+    after = before.copy()
+    x, y, w, h = BOX
+    after[y:y+h, x:x+w] = scene(seed=1)[y:y+h, x:x+w]
+    old_sig = lambda f: cv2.resize(cv2.cvtColor(f, cv2.COLOR_BGR2GRAY), (16, 16), interpolation=cv2.INTER_AREA).astype(np.float32)
+    assert np.abs(old_sig(before) - old_sig(after)).mean() < 4.0  # เกณฑ์ค่าเฉลี่ยทั้งภาพแบบเดิมจะตอบผลของ Alice
+
+    fake_deepface.faces = [fake_face(one_hot(1), *BOX)]
+    result = kiosk(after)
+    assert fake_deepface.calls == 2
+    assert "cached" not in result and result["name"] == "Bob" and result["faces"][0]["recorded"] is True
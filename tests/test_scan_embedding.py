@@ -0,0 +1,62 @@
+import json
+import cv2
+import numpy as np
+import pytest
+from conftest import enroll
+
+def one_hot(i, dim=512):
+    v = np.zeros(dim, np.float32)
+    v[i] = 1.0
+    return [float(x) for x in v]
+
+EVIDENCE = cv2.imencode(".jpg", np.full((240, 320, 3), 128, np.uint8))[1].tobytes()
+
+@pytest.fixture
+def post(server, client):
+    enroll(server, "E1", "Alice", one_hot(0))
+    enroll(server, "E2", "Bob", one_hot(1))
+    def send(**fields):
+        data = {"model": server.model_signature(server.ACTIVE_MODEL), **fields}
+        return client.post("/scan/embedding", data=data, headers={"X-Kiosk-Id": "kiosk-1"},
+                           files={"file": ("evidence.jpg", EVIDENCE, "image/jpeg")})
+    return send
+
+def test_all_faces_are_matched_and_reply_like_scan(post):
+    faces = [{"embedding": one_hot(5), "box": [0, 0, 50, 50]},
+             {"embedding": one_hot(1), "box": [300, 100, 90, 90]},
+             {"embedding": one_hot(0), "box": [100, 100, 80, 80]}]
+    r = post(embeddings=json.dumps(faces))
+    assert r.status_code == 200
+    data = r.json()
+    assert data["status"] == "OK" and set(data) == {"status", "name", "faces", "time"}
+    recognised = {f["name"]: f for f in data["faces"] if f["status"] == "OK"}
+    assert recognised["Alice"]["box"] == [100, 100, 80, 80] and recognised["Alice"]["recorded"] is True
+    assert recognised["Bob"]["box"] == [300, 100, 90, 90] and recognised["Bob"]["recorded"] is True
+    assert [f["box"] for f in data["faces"] if f["status"] == "FAIL"] == [[0, 0, 50, 50]]
+
+    again = post(embeddings=json.dumps(faces)).json()  # ซ้ำภายในช่วงกันบันทึกซ้ำ
+    assert [f["recorded"] for f in again["faces"] if f["status"] == "OK"] == [False, False]
+
+def test_no_faces_is_fail(post):
+    data = post(embeddings="[]").json()
+    assert data["status"] == "FAIL" and data["faces"] == []
+
+def test_single_embedding_from_older_kiosk(post):
+    data = post(embedding=json.dumps(one_hot(1))).json()
+    assert data["status"] == "OK" and data["name"] == "Bob" and "faces" not in data
+
+@pytest.mark.parametrize("embeddings", [
+    "not json", '{"embedding": [1]}', '[{"embedding": [1.0, 2.0]}]', '[{"embedding": [], "box": [0, 0, 1, 1]}]',
+    '[{"embedding": ["x"], "box": [0, 0, 1, 1]}]', '[{"embedding": [1.0], "box": [0, 0, 1]}]',
+    '[{"embedding": [1.0], "box": [-5, 0, 1, 1]}]',
+])
+def test_malformed_faces_are_rejected(post, embeddings):
+    assert post(embeddings=embeddings).status_code == 400
+
+def test_missing_embeddings_is_rejected(post):
+    assert post().status_code == 400
+
+def test_wrong_dimension_or_model_is_mismatch(post):
+    r = post(embeddings=json.dumps([{"embedding": [1.0] * 128, "box": [0, 0, 10, 10]}]))
+    assert r.status_code == 409 and r.json()["status"] == "MODEL_MISMATCH"
+    assert post(model="ArcFace/deepface-0.0.93", embeddings="[]").status_code == 409
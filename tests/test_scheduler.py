@@ -0,0 +1,66 @@
+import time
+import asyncio
+import pytest
+from datetime import datetime
+from scheduler import RecognitionScheduler, Overloaded
+
+def test_waiting_work_runs_by_priority():
+    async def main():
+        sched, order = RecognitionScheduler(workers=1, kiosk_limit=0), []
+        hold = asyncio.Event()
+        async def job(priority, wait=None):
+            async with sched.slot(priority):
+                order.append(priority)
+                if wait: await wait.wait()
+        first = asyncio.create_task(job("scan", hold))
+        await asyncio.sleep(0)
+        rest = [asyncio.create_task(job(p)) for p in ("enroll", "scan", "manual")]
+        await asyncio.sleep(0)
+        hold.set()
+        await asyncio.gather(first, *rest)
+        return order, sched.busy
+    order, busy = asyncio.run(main())
+    assert order == ["scan", "manual", "scan", "enroll"] and busy == 0
+
+def test_kiosk_limit_is_per_kiosk():
+    async def main():
+        sched = RecognitionScheduler(workers=1, kiosk_limit=1)
+        hold = asyncio.Event()
+        async def job(kiosk):
+            async with sched.slot("scan", kiosk): await hold.wait()
+        first = asyncio.create_task(job("kiosk-1"))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as e:
+            sched.admit("scan", "kiosk-1")
+        other = asyncio.create_task(job("kiosk-2"))  # เครื่องอื่นยังเข้าคิวได้
+        await asyncio.sleep(0)
+        queued = len(sched.waiting)
+        hold.set()
+        await asyncio.gather(first, other)
+        return e.value, queued
+    err, queued = asyncio.run(main())
+    assert err.status_code == 429 and err.reason == "kiosk_limit" and err.retry_after >= 1 and queued == 1
+
+def test_slow_scans_shed_enroll_but_not_manual():
+    sched = RecognitionScheduler(workers=1, slo_p95_ms=100)
+    sched.samples["enroll"].extend((time.time(), 5000) for _ in range(20))  # งานช้าประเภทอื่นไม่นับ
+    sched.admit("enroll")
+    sched.samples["scan"].extend((time.time(), 500) for _ in range(20))
+    assert sched.shedding()
+    with pytest.raises(Overloaded) as e:
+        sched.admit("enroll")
+    assert e.value.status_code == 503 and e.value.reason == "slo"
+    sched.admit("scan")    # ยังมีช่องว่าง ไม่ต้องรอคิว
+    sched.admit("manual")  # ลงเวลามือไม่ถูกตัด
+    sched.busy = 1
+    with pytest.raises(Overloaded):
+        sched.admit("scan")
+
+def test_shed_request_gets_503_with_retry_after(server, client, monkeypatch):
+    sched = RecognitionScheduler(workers=1, slo_p95_ms=100)
+    sched.samples["scan"].extend((time.time(), 500) for _ in range(20))
+    monkeypatch.setattr(server, "scheduler", sched)
+    r = client.post("/scan/batch", files=[("files", ("0.jpg", b"x", "image/jpeg"))],
+                    data={"captured_at": [datetime.now().isoformat()]})
+    assert r.status_code == 503 and int(r.headers["Retry-After"]) >= 1
+    assert sched.stats["enroll"]["shed"] == 1
@@ -0,0 +1,28 @@
+import os
+import cv2
+import numpy as np
+import pytest
+
+@pytest.fixture
+def photo(server):
+    cv2.imwrite("images/E1.jpg", np.full((600, 400, 3), 200, np.uint8))
+    cv2.imwrite("private.jpg", np.full((100, 100, 3), 50, np.uint8))  # รูปนอกโฟลเดอร์ที่อนุญาต
+    return "images/E1.jpg"
+
+@pytest.mark.parametrize("path", ["private.jpg", "images/%2e%2e/private.jpg", "images/..%2fprivate.jpg",
+                                  "attendance_images/%2e%2e/%2e%2e/etc/passwd", "thumbnails/sm/images/E1.jpg"])
+def test_paths_outside_photo_folders_are_not_served(client, photo, path):
+    assert client.get(f"/thumb/sm/{path}").status_code == 404
+
+def test_unknown_size_is_not_served(client, photo):
+    assert client.get(f"/thumb/xl/{photo}").status_code == 404
+
+def test_thumbnail_is_made_once_and_revalidated(client, photo):
+    r = client.get(f"/thumb/sm/{photo}")
+    assert r.status_code == 200 and r.headers["content-type"] == "image/jpeg"
+    thumb = cv2.imdecode(np.frombuffer(r.content, np.uint8), cv2.IMREAD_COLOR)
+    assert max(thumb.shape[:2]) == 64
+    assert os.path.exists(f"thumbnails/sm/{photo}") and r.headers["cache-control"] == "public, no-cache"
+
+    again = client.get(f"/thumb/sm/{photo}", headers={"If-None-Match": r.headers["etag"]})
+    assert again.status_code == 304